@@ -1,20 +1,62 @@
-from flask import Flask, request, render_template_string, jsonify, redirect
+from flask import Flask, request, render_template, jsonify, redirect, abort, stream_with_context
 import requests
-from urllib.parse import quote_plus, unquote_plus, urlparse
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib3 import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
+from urllib.parse import (quote_plus, unquote_plus, urlparse, urljoin, urldefrag,
+                          urlsplit, urlunsplit, parse_qsl, urlencode)
+from urllib.robotparser import RobotFileParser
 import os
 import time
 import re
 import json
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, Tag
 import random
 import threading
 import schedule
 import html
 import concurrent.futures
+import functools
+import bisect
 import hashlib
+import heapq
+import itertools
 import logging
-from collections import defaultdict
+import math
+import socket
+import sqlite3
+import sys
+from array import array
+from collections import defaultdict, deque, OrderedDict
 import io
+import base64
+import gzip
+import asyncio
+import atexit
+import weakref
+
+try:
+    import aiohttp
+except ImportError:  # без aiohttp загрузка идет через requests в пуле потоков
+    aiohttp = None
+
+try:
+    import numpy as np
+    from PIL import Image
+except ImportError:  # без Pillow и numpy цвета изображений определяются только по URL
+    np = None
+    Image = None
+
+try:
+    import brotli
+except ImportError:  # без brotli ответы сжимаются только gzip
+    brotli = None
+
+try:
+    import lxml  # noqa: F401 - разбор HTML парсером на C через BeautifulSoup
+except ImportError:
+    lxml = None
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -29,17 +71,1510 @@ app_status = {
     'start_time': time.time(),
     'is_active': True,
     'indexed_images': 0,
-    'processed_pages': 0
+    'processed_pages': 0,
+    'unchanged_pages': 0
 }
 
-# Глобальный индекс изображений
-image_index = {
-    'by_id': {},
-    'by_object': defaultdict(list),
-    'by_color': defaultdict(list),
-    'by_scene': defaultdict(list),
-    'by_domain': defaultdict(list)
-}
+class TextAnalyzer:
+    """Разбор текста на термины, общий для индекса и запросов: нормализация, стоп-слова, стемминг RU/EN"""
+
+    # Меняется вместе с правилами разбора: индекс с другой версией перестраивается
+    VERSION = 1
+
+    # Токены короче не индексируются и не ищутся
+    MIN_LENGTH = 3
+
+    STOPWORDS = frozenset((
+        # Русские
+        'без', 'более', 'был', 'была', 'были', 'было', 'быть', 'вам', 'вас', 'весь', 'вот', 'все', 'всего',
+        'всех', 'где', 'даже', 'для', 'его', 'ее', 'ей', 'если', 'есть', 'еще', 'же', 'из', 'или', 'им',
+        'их', 'как', 'какой', 'когда', 'кто', 'ли', 'между', 'меня', 'мне', 'может', 'мы', 'над', 'надо',
+        'нас', 'него', 'нее', 'нет', 'ни', 'них', 'ничего', 'но', 'ну', 'об', 'она', 'они', 'оно', 'от',
+        'очень', 'под', 'при', 'про', 'раз', 'сам', 'себя', 'так', 'также', 'там', 'тем', 'теперь', 'то',
+        'того', 'тоже', 'только', 'том', 'тот', 'тут', 'уже', 'хотя', 'чего', 'чем', 'через', 'что',
+        'чтобы', 'чуть', 'эта', 'эти', 'это', 'этого', 'этой', 'этот',
+        # Английские
+        'about', 'all', 'and', 'are', 'been', 'but', 'can', 'for', 'from', 'had', 'has', 'have', 'her',
+        'his', 'how', 'into', 'its', 'not', 'our', 'out', 'she', 'that', 'the', 'their', 'them', 'then',
+        'there', 'these', 'they', 'this', 'was', 'were', 'what', 'when', 'which', 'who', 'will', 'with',
+        'you', 'your'
+    ))
+
+    # Snowball-стеммер для русского (упрощенная запись на регулярных выражениях)
+    _RU_PERFECTIVE_GERUND = re.compile(r'(ив|ивши|ившись|ыв|ывши|ывшись|(?<=[ая])(в|вши|вшись))$')
+    _RU_REFLEXIVE = re.compile(r'(ся|сь)$')
+    _RU_ADJECTIVE = re.compile(r'(ее|ие|ые|ое|ими|ыми|ей|ий|ый|ой|ем|им|ым|ом|его|ого|ему|ому|их|ых|ую|юю|ая|яя|ою|ею)$')
+    _RU_PARTICIPLE = re.compile(r'(ивш|ывш|ующ|(?<=[ая])(ем|нн|вш|ющ|щ))$')
+    _RU_VERB = re.compile(r'(ила|ыла|ена|ейте|уйте|ите|или|ыли|ей|уй|ил|ыл|им|ым|ен|ило|ыло|ено|ят|ует|уют|ит|'
+                          r'ыт|ены|ить|ыть|ишь|ую|ю|(?<=[ая])(ла|на|ете|йте|ли|й|л|ем|н|ло|но|ет|ют|ны|ть|ешь|нно))$')
+    _RU_NOUN = re.compile(r'(а|ев|ов|ие|ье|е|иями|ями|ами|еи|ии|и|ией|ей|ой|ий|й|иям|ям|ием|ем|ам|ом|о|у|ах|'
+                          r'иях|ях|ы|ь|ию|ью|ю|ия|ья|я)$')
+    _RU_RV = re.compile(r'^(.*?[аеиоуыэюя])(.*)$')
+    _RU_DERIVATIONAL = re.compile(r'[^аеиоуыэюя][аеиоуыэюя].*ость?$')
+
+    def __init__(self, cache_size=100000):
+        # Разбор каждого встреченного слова кэшируется: словарь запросов и документов повторяется
+        self.analyze_token = functools.lru_cache(maxsize=cache_size)(self._analyze_token)
+
+    @staticmethod
+    def normalize(text):
+        return (text or '').lower().replace('ё', 'е')
+
+    def analyze(self, text):
+        """Термины текста в порядке следования (стоп-слова и короткие токены отброшены)"""
+        terms = []
+        for token in re.findall(r'\w+', self.normalize(text)):
+            term = self.analyze_token(token)
+            if term:
+                terms.append(term)
+        return terms
+
+    def _analyze_token(self, token):
+        if len(token) < self.MIN_LENGTH or token in self.STOPWORDS:
+            return None
+        if re.search('[а-я]', token):
+            return self._stem_russian(token)
+        if re.fullmatch('[a-z]+', token):
+            return self._stem_english(token)
+        return token
+
+    def _stem_russian(self, word):
+        match = self._RU_RV.match(word)
+        if not match:
+            return word
+        prefix, rv = match.groups()
+
+        stripped = self._RU_PERFECTIVE_GERUND.sub('', rv, 1)
+        if stripped == rv:
+            rv = self._RU_REFLEXIVE.sub('', rv, 1)
+            stripped = self._RU_ADJECTIVE.sub('', rv, 1)
+            if stripped != rv:
+                rv = self._RU_PARTICIPLE.sub('', stripped, 1)
+            else:
+                stripped = self._RU_VERB.sub('', rv, 1)
+                rv = self._RU_NOUN.sub('', rv, 1) if stripped == rv else stripped
+        else:
+            rv = stripped
+
+        rv = re.sub('и$', '', rv)
+        if self._RU_DERIVATIONAL.search(rv):
+            rv = re.sub('ость?$', '', rv)
+        if rv.endswith('ь'):
+            rv = rv[:-1]
+        else:
+            rv = re.sub('(ейше|ейш)$', '', rv)
+            rv = re.sub('нн$', 'н', rv)
+        return prefix + rv
+
+    @staticmethod
+    def _english_measure(stem):
+        """Число переходов гласная-согласная (m в алгоритме Портера)"""
+        pattern = ''
+        for i, char in enumerate(stem):
+            vowel = char in 'aeiou' or (char == 'y' and i > 0 and stem[i - 1] not in 'aeiou')
+            pattern += 'v' if vowel else 'c'
+        return len(re.findall('v+c+', pattern))
+
+    @staticmethod
+    def _english_has_vowel(stem):
+        return re.search('[aeiou]|(?<=[^aeiou])y', stem) is not None
+
+    def _stem_english(self, word):
+        """Шаг 1 стеммера Портера: множественное число, -ed/-ing, конечная y"""
+        if word.endswith('sses') or word.endswith('ies'):
+            word = word[:-2]
+        elif word.endswith('s') and not word.endswith('ss'):
+            word = word[:-1]
+
+        if word.endswith('eed'):
+            if self._english_measure(word[:-3]) > 0:
+                word = word[:-1]
+        else:
+            for suffix in ('ed', 'ing'):
+                stem = word[:-len(suffix)]
+                if word.endswith(suffix) and self._english_has_vowel(stem):
+                    word = stem
+                    if word.endswith(('at', 'bl', 'iz')):
+                        word += 'e'
+                    elif len(word) > 1 and word[-1] == word[-2] and word[-1] not in 'aeiouylsz':
+                        word = word[:-1]
+                    elif self._english_measure(word) == 1 and re.search('[^aeiou][aeiouy][^aeiouwxy]$', word):
+                        word += 'e'
+                    break
+
+        if word.endswith('y') and self._english_has_vowel(word[:-1]):
+            word = word[:-1] + 'i'
+        return word
+
+text_analyzer = TextAnalyzer(int(os.environ.get('ARIOS_ANALYZER_CACHE', 100000)))
+
+class BM25F:
+    """Полевой BM25: частоты термина в полях нормируются длиной поля, взвешиваются, суммируются и насыщаются"""
+
+    def __init__(self, weights, k1=1.2, b=0.75):
+        self.weights = weights
+        self.k1 = k1
+        self.b = b
+
+    @staticmethod
+    def idf(df, docs):
+        """Редкость термина: df документов с термином из docs"""
+        return math.log(1 + (docs - df + 0.5) / (df + 0.5))
+
+    def field_frequency(self, field, tf, length, average_lengths):
+        """Вклад одного поля в частоту термина с поправкой на длину поля"""
+        weight = self.weights.get(field, 0)
+        if not weight:
+            return 0.0
+        average = average_lengths.get(field) or length or 1
+        return weight * tf / (1 - self.b + self.b * length / average)
+
+    def saturate(self, frequency, idf):
+        """Оценка термина по суммарной частоте: рост замедляется, предел - idf * (k1 + 1)"""
+        return idf * frequency * (self.k1 + 1) / (self.k1 + frequency)
+
+    def score(self, field_terms, query_terms, stats):
+        """Оценка документа, поля которого уже разбиты на термины (до попадания в индекс)"""
+        counts = {field: defaultdict(int) for field in field_terms}
+        for field, terms in field_terms.items():
+            for term in terms:
+                counts[field][term] += 1
+
+        score = 0.0
+        for term in query_terms:
+            frequency = sum(
+                self.field_frequency(field, counts[field][term], len(field_terms[field]), stats['lengths'])
+                for field in field_terms if term in counts[field]
+            )
+            if frequency:
+                score += self.saturate(frequency, self.idf(stats['df'].get(term, 0), stats['docs']))
+        return score
+
+class SearchIndex:
+    """Персистентный инвертированный индекс (термин → список документов) на SQLite"""
+
+    # Поля документов, попадающие в индекс, и их веса при ранжировании
+    FIELD_WEIGHTS = {
+        # Метки компьютерного зрения и цвета только отбирают кандидатов, их вес считает _calculate_vision_relevance
+        'images': {'alt': 3, 'title': 2, 'filename': 2, 'context': 1, 'vision': 0, 'color': 0},
+        'websites': {'title': 3, 'description': 2},
+        'videos': {'title': 3}
+    }
+
+    # Поля, которые не хранятся в JSON документа, а восстанавливаются при чтении:
+    # поле -> значение по документу и домену из отдельного столбца
+    DERIVED_FIELDS = {
+        'images': {
+            'id': lambda document, domain: hashlib.md5(document['url'].encode()).hexdigest(),
+            'thumbnail': lambda document, domain: document['url'],
+            'domain': lambda document, domain: domain,
+            'metadata_extracted': lambda document, domain: True
+        },
+        'websites': {
+            'domain': lambda document, domain: domain
+        }
+    }
+
+    # Версия таблиц: при ее смене воркер при запуске досоздает столбцы и индексы, иначе запуск только читает
+    SCHEMA_VERSION = 4
+    # Версия содержимого постингов (и производных полей документов, например vision_terms):
+    # при ее смене индекс перестраивается из сохраненных документов
+    INDEX_VERSION = 5
+    # Через сколько секунд изображение, взятое на анализ, но не проанализированное, достается другому воркеру
+    ENRICHMENT_CLAIM_TTL = 600
+    # Как часто (в инструкциях SQLite) поиск со сроком проверяет, не истек ли он
+    PROGRESS_STEPS = 1000
+    # Сколько документов перестраивается за одну транзакцию: между пачками пишут краулер и анализ изображений
+    REINDEX_BATCH = 500
+    # Через сколько секунд блокировка перестроения считается брошенной (процесс упал посреди работы)
+    REINDEX_LOCK_TTL = 3600
+    # Во сколько раз средняя длина поля может уйти от опорной длины вкладов, прежде чем вклады пересчитываются
+    IMPACT_DRIFT = 1.5
+
+    def __init__(self, path, analyzer, generation_interval=60):
+        self.path = path
+        self.analyzer = analyzer
+        # Поколение индекса меняется не чаще раза в столько секунд (см. _bump_generation)
+        self.generation_interval = generation_interval
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self.scorers = {doc_type: BM25F(weights) for doc_type, weights in self.FIELD_WEIGHTS.items()}
+        self._init_schema()
+
+    def _connection(self):
+        """Отдельное соединение на каждый поток"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        conn = self._connection()
+        try:
+            current = conn.execute("SELECT value FROM meta WHERE key = 'schema_version'").fetchone()
+        except sqlite3.OperationalError:
+            current = None
+        if current and current[0] == self.SCHEMA_VERSION:
+            # Таблицы уже в нужном виде: запуск воркера ничего не пишет и не ждет чужих транзакций
+            if self._needs_reindex(conn):
+                logger.warning("⚠️ Версия индекса устарела, до перестроения поиск идет по старым постингам")
+            return
+
+        with self._write_lock, conn:
+            conn.executescript('''
+                CREATE TABLE IF NOT EXISTS documents (
+                    doc_id INTEGER PRIMARY KEY,
+                    doc_type TEXT NOT NULL,
+                    doc_key TEXT NOT NULL,
+                    domain TEXT,
+                    data TEXT NOT NULL,
+                    indexed_at REAL NOT NULL,
+                    enriched INTEGER NOT NULL DEFAULT 0,
+                    enrich_claimed_at REAL,
+                    UNIQUE (doc_type, doc_key)
+                );
+                CREATE TABLE IF NOT EXISTS postings (
+                    term TEXT NOT NULL,
+                    doc_type TEXT NOT NULL,
+                    doc_id INTEGER NOT NULL,
+                    field TEXT NOT NULL,
+                    tf INTEGER NOT NULL,
+                    length INTEGER NOT NULL DEFAULT 0,
+                    impact REAL NOT NULL DEFAULT 0,
+                    PRIMARY KEY (term, doc_type, doc_id, field)
+                ) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS term_stats (
+                    doc_type TEXT NOT NULL,
+                    term TEXT NOT NULL,
+                    df INTEGER NOT NULL,
+                    PRIMARY KEY (doc_type, term)
+                ) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS pages (
+                    url_key TEXT PRIMARY KEY,
+                    etag TEXT,
+                    last_modified TEXT,
+                    content_hash TEXT NOT NULL,
+                    links TEXT NOT NULL,
+                    fetched_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS meta (
+                    key TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS leases (
+                    name TEXT PRIMARY KEY,
+                    owner TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                );
+                INSERT OR IGNORE INTO meta (key, value) VALUES ('generation', 0);
+                INSERT OR IGNORE INTO meta (key, value) VALUES ('index_version', 0);
+                INSERT OR IGNORE INTO meta (key, value) VALUES ('analyzer_version', 0);
+                CREATE INDEX IF NOT EXISTS postings_by_doc ON postings (doc_id);
+                DROP INDEX IF EXISTS documents_by_domain;
+            ''')
+            # Индексы, созданные до появления фонового обогащения изображений
+            columns = {row[1] for row in conn.execute('PRAGMA table_info(documents)')}
+            if 'enriched' not in columns:
+                conn.execute('ALTER TABLE documents ADD COLUMN enriched INTEGER NOT NULL DEFAULT 0')
+            if 'enrich_claimed_at' not in columns:
+                conn.execute('ALTER TABLE documents ADD COLUMN enrich_claimed_at REAL')
+            conn.execute('CREATE INDEX IF NOT EXISTS documents_pending_enrichment '
+                         'ON documents (doc_type) WHERE enriched = 0')
+            # Постинги без длин полей и статистики BM25 пересчитываются
+            columns = {row[1] for row in conn.execute('PRAGMA table_info(postings)')}
+            if 'length' not in columns:
+                conn.execute('ALTER TABLE postings ADD COLUMN length INTEGER NOT NULL DEFAULT 0')
+            if 'impact' not in columns:
+                conn.execute('ALTER TABLE postings ADD COLUMN impact REAL NOT NULL DEFAULT 0')
+            empty = conn.execute('SELECT 1 FROM documents LIMIT 1').fetchone() is None
+            if empty:
+                # Постинги термина в порядке убывания вклада; для заполненного индекса его строит migrate()
+                self._create_impact_index(conn)
+            if self._needs_reindex(conn):
+                if empty:
+                    # Пустой индекс перестраивать не из чего
+                    self._set_versions(conn)
+                else:
+                    # Перестроение долгое: его выполняет migrate() в фоне, а не импорт модуля в каждом воркере
+                    logger.warning("⚠️ Версия индекса устарела, до перестроения поиск идет по старым постингам")
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('schema_version', ?)",
+                         (self.SCHEMA_VERSION,))
+
+    @staticmethod
+    def _create_impact_index(conn):
+        conn.execute('CREATE INDEX IF NOT EXISTS postings_by_impact '
+                     'ON postings (term, doc_type, impact DESC, doc_id)')
+
+    def _needs_reindex(self, conn):
+        versions = dict(conn.execute(
+            "SELECT key, value FROM meta WHERE key IN ('index_version', 'analyzer_version')"
+        ).fetchall())
+        if versions != {'index_version': self.INDEX_VERSION, 'analyzer_version': self.analyzer.VERSION}:
+            return True
+        # Средние длины полей сильно ушли от опорных: оценки вкладов стали слишком грубыми
+        for doc_type, weights in self.FIELD_WEIGHTS.items():
+            references = self._impact_lengths(conn, doc_type)
+            for field, average in self._average_lengths(conn, doc_type).items():
+                reference = references.get(field)
+                if weights.get(field) and reference and average and \
+                        max(average / reference, reference / average) > self.IMPACT_DRIFT:
+                    return True
+        return False
+
+    def _set_versions(self, conn):
+        conn.execute("UPDATE meta SET value = ? WHERE key = 'index_version'", (self.INDEX_VERSION,))
+        conn.execute("UPDATE meta SET value = ? WHERE key = 'analyzer_version'", (self.analyzer.VERSION,))
+
+    def acquire_lease(self, name, owner, ttl):
+        """Занять или продлить аренду name на ttl секунд; True, если она у owner.
+        
+        Так фоновую работу, которой нужен один исполнитель на все воркеры (краулер),
+        выполняет только процесс-арендатор; после его падения аренду через ttl займет другой.
+        """
+        conn = self._connection()
+        now = time.time()
+        with self._write_lock, conn:
+            return conn.execute(
+                "INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+                "WHERE leases.owner = excluded.owner OR leases.expires_at <= ?",
+                (name, owner, now + ttl, now)
+            ).rowcount > 0
+
+    def release_lease(self, name, owner):
+        """Освобождение аренды, если она у owner"""
+        conn = self._connection()
+        with self._write_lock, conn:
+            conn.execute('DELETE FROM leases WHERE name = ? AND owner = ?', (name, owner))
+
+    def needs_reindex(self):
+        """Устарели ли постинги (сменились INDEX_VERSION или версия анализатора)"""
+        return self._needs_reindex(self._connection())
+
+    def migrate(self):
+        """Перестроение устаревшего индекса; True, если его выполнил этот процесс.
+        
+        Перестраивает только один процесс: он занимает строку reindex_lock в meta,
+        остальные воркеры пропускают перестроение и продолжают работать.
+        """
+        conn = self._connection()
+        now = int(time.time())
+        try:
+            with self._write_lock:
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    claimed = self._needs_reindex(conn) and conn.execute(
+                        "INSERT INTO meta (key, value) VALUES ('reindex_lock', ?) "
+                        "ON CONFLICT (key) DO UPDATE SET value = excluded.value WHERE meta.value <= ?",
+                        (now, now - self.REINDEX_LOCK_TTL)
+                    ).rowcount > 0
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+            if not claimed:
+                return False
+
+            try:
+                self._reindex(conn)
+            finally:
+                with self._write_lock, conn:
+                    conn.execute("DELETE FROM meta WHERE key = 'reindex_lock'")
+            return True
+        except Exception as e:
+            logger.error(f"❌ Ошибка перестроения индекса: {e}")
+            return False
+
+    def _reindex(self, conn):
+        """Перестроение постингов и статистики по сохраненным документам пачками по REINDEX_BATCH.
+        
+        Каждая пачка - своя короткая транзакция: _write_postings снимает старые постинги документа
+        со счетчиков и записывает новые, поэтому статистика остается согласованной и посреди
+        перестроения, а запись краулера ждет не дольше одной пачки.
+        """
+        started = time.time()
+        with self._write_lock, conn:
+            self._create_impact_index(conn)
+            # Опорные длины вкладов - текущие средние длины полей
+            impact_lengths = {doc_type: self._average_lengths(conn, doc_type) for doc_type in self.FIELD_WEIGHTS}
+            conn.execute("DELETE FROM meta WHERE key LIKE 'impact_length:%'")
+            for doc_type, lengths in impact_lengths.items():
+                self._set_impact_lengths(conn, doc_type, lengths)
+
+        last_id = 0
+        rebuilt = 0
+        while True:
+            with self._write_lock, conn:
+                rows = conn.execute(
+                    'SELECT doc_id, doc_type, data FROM documents WHERE doc_id > ? ORDER BY doc_id LIMIT ?',
+                    (last_id, self.REINDEX_BATCH)
+                ).fetchall()
+                for doc_id, doc_type, data in rows:
+                    if doc_type not in self.FIELD_WEIGHTS:
+                        continue
+                    document = json.loads(data)
+                    # Термины меток зрения пересчитываются тем же анализатором, что и постинги
+                    if self._set_vision_terms(document):
+                        conn.execute('UPDATE documents SET data = ? WHERE doc_id = ?',
+                                     (json.dumps(document, ensure_ascii=False), doc_id))
+                    self._write_postings(conn, doc_type, doc_id, document, impact_lengths[doc_type])
+                # Блокировка перестроения продлевается, пока работа идет
+                conn.execute("UPDATE meta SET value = ? WHERE key = 'reindex_lock'", (int(time.time()),))
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            rebuilt += len(rows)
+
+        with self._write_lock, conn:
+            self._set_versions(conn)
+            self._bump_generation(conn, rebuilt)
+        if rebuilt:
+            logger.info(f"🔁 Индекс перестроен: {rebuilt} документов за {time.time() - started:.1f} с")
+
+    def _set_vision_terms(self, document):
+        """Метки компьютерного зрения, разобранные на термины: {метка: [термины]}; True, если поле изменилось.
+        
+        Разбираются один раз при записи документа, а не при ранжировании каждого запроса.
+        """
+        previous = document.pop('vision_terms', None)
+        vision_analysis = document.get('vision_analysis')
+        if vision_analysis:
+            document['vision_terms'] = {label: self.analyzer.analyze(label) for label in vision_analysis}
+        return document.get('vision_terms') != previous
+
+    def _document_fields(self, doc_type, document):
+        """Индексируемые поля документа, разбитые на термины"""
+        fields = {}
+        for field in self.FIELD_WEIGHTS.get(doc_type, {}):
+            if field == 'vision':
+                values = ' '.join(document.get('vision_analysis') or {})
+            elif field == 'color':
+                values = ' '.join(document.get('colors') or {})
+            else:
+                values = document.get(field) or ''
+            fields[field] = self.analyzer.analyze(values)
+        return fields
+
+    def _write_postings(self, conn, doc_type, doc_id, stored, impact_lengths):
+        """Постинги документа (частота, длина поля и вклад термина) и поправка статистики BM25"""
+        self._remove_postings(conn, doc_type, doc_id)
+        if stored.get('cluster', stored.get('url')) != stored.get('url'):
+            # Почти-дубликат уже проиндексированного изображения: в поиск попадает только канонический
+            return
+
+        fields = self._document_fields(doc_type, stored)
+        tfs = defaultdict(int)
+        for field, terms in fields.items():
+            for term in terms:
+                tfs[(term, field)] += 1
+        if not tfs:
+            return
+
+        lengths = {field: len(terms) for field, terms in fields.items() if terms}
+        if lengths.keys() - impact_lengths.keys():
+            # Первое заполненное поле: опорной длиной становится его длина в этом документе
+            self._set_impact_lengths(conn, doc_type, {
+                field: length for field, length in lengths.items() if field not in impact_lengths
+            }, replace=False)
+            impact_lengths.update(self._impact_lengths(conn, doc_type))
+
+        # Вклад термина - его полевая частота BM25F при опорных длинах полей: по нему список
+        # термина читается от лучших документов, а текущие средние длины уточняют оценку при поиске
+        scorer = self.scorers[doc_type]
+        impacts = defaultdict(float)
+        for (term, field), tf in tfs.items():
+            impacts[term] += scorer.field_frequency(field, tf, lengths[field], impact_lengths)
+
+        conn.executemany(
+            'INSERT INTO postings (term, doc_type, doc_id, field, tf, length, impact) VALUES (?, ?, ?, ?, ?, ?, ?)',
+            [(term, doc_type, doc_id, field, tf, lengths[field], impacts[term]) for (term, field), tf in tfs.items()]
+        )
+        self._adjust_stats(conn, doc_type, impacts, lengths, 1)
+
+    def _remove_postings(self, conn, doc_type, doc_id):
+        rows = conn.execute('SELECT term, field, length FROM postings WHERE doc_id = ?', (doc_id,)).fetchall()
+        if not rows:
+            return
+        conn.execute('DELETE FROM postings WHERE doc_id = ?', (doc_id,))
+        lengths = {field: length for _, field, length in rows}
+        self._adjust_stats(conn, doc_type, {term for term, _, _ in rows}, lengths, -1)
+
+    def _adjust_stats(self, conn, doc_type, terms, lengths, sign):
+        """Документная частота терминов, число документов и суммарные длины полей (+1 / -1 документ)"""
+        conn.executemany(
+            'INSERT INTO term_stats (doc_type, term, df) VALUES (?, ?, ?) '
+            'ON CONFLICT (doc_type, term) DO UPDATE SET df = df + excluded.df',
+            [(doc_type, term, sign) for term in terms]
+        )
+        if sign < 0:
+            conn.executemany('DELETE FROM term_stats WHERE doc_type = ? AND term = ? AND df <= 0',
+                             [(doc_type, term) for term in terms])
+        counters = [(f'docs:{doc_type}', sign)]
+        counters += [(f'length:{doc_type}:{field}', sign * length) for field, length in lengths.items()]
+        conn.executemany(
+            'INSERT INTO meta (key, value) VALUES (?, ?) '
+            'ON CONFLICT (key) DO UPDATE SET value = value + excluded.value',
+            counters
+        )
+
+    def _impact_lengths(self, conn, doc_type):
+        """Опорные длины полей, при которых посчитаны вклады терминов в постингах"""
+        return {key.rsplit(':', 1)[1]: value for key, value in conn.execute(
+            'SELECT key, value FROM meta WHERE key LIKE ?', (f'impact_length:{doc_type}:%',)
+        )}
+
+    def _set_impact_lengths(self, conn, doc_type, lengths, replace=True):
+        conn.executemany(
+            f"INSERT OR {'REPLACE' if replace else 'IGNORE'} INTO meta (key, value) VALUES (?, ?)",
+            [(f'impact_length:{doc_type}:{field}', max(1.0, float(length))) for field, length in lengths.items()]
+        )
+
+    def _average_lengths(self, conn, doc_type):
+        """Средние длины полей по счетчикам в meta"""
+        docs = 0
+        totals = {}
+        for key, value in conn.execute(
+            'SELECT key, value FROM meta WHERE key = ? OR key LIKE ?',
+            (f'docs:{doc_type}', f'length:{doc_type}:%')
+        ):
+            if key.startswith('docs:'):
+                docs = value
+            else:
+                totals[key.rsplit(':', 1)[1]] = value
+        return {field: total / docs for field, total in totals.items()} if docs > 0 else {}
+
+    def collection_stats(self, doc_type, terms):
+        """Статистика для BM25: число документов, средние и опорные длины полей, документные частоты терминов"""
+        conn = self._connection()
+        docs = conn.execute('SELECT value FROM meta WHERE key = ?', (f'docs:{doc_type}',)).fetchone()
+
+        terms = list(terms)
+        df = {}
+        if terms:
+            df = dict(conn.execute(
+                f"SELECT term, df FROM term_stats "
+                f"WHERE doc_type = ? AND term IN ({', '.join('?' * len(terms))})",
+                (doc_type, *terms)
+            ).fetchall())
+        return {
+            'docs': docs[0] if docs else 0,
+            'lengths': self._average_lengths(conn, doc_type),
+            'impact_lengths': self._impact_lengths(conn, doc_type),
+            'df': df
+        }
+
+    def score_fields(self, doc_type, fields, query_words):
+        """BM25F-оценка еще не проиндексированного документа по статистике индекса"""
+        terms = set(self.analyzer.analyze(' '.join(query_words)))
+        scorer = self.scorers.get(doc_type)
+        if not terms or scorer is None:
+            return 0
+        field_terms = {field: self.analyzer.analyze(text) for field, text in fields.items()}
+        return round(scorer.score(field_terms, terms, self.collection_stats(doc_type, terms)), 3)
+
+    def add_documents(self, doc_type, documents):
+        """Добавление или обновление документов в индексе"""
+        if doc_type not in self.FIELD_WEIGHTS or not documents:
+            return 0
+
+        conn = self._connection()
+        with self._write_lock, conn:
+            added, _ = self._write_documents(conn, doc_type, documents, time.time())
+            self._bump_generation(conn, added)
+            return added
+
+    def add_page(self, page):
+        """Индексирование записи страницы (изображения, сайты и видео) одной транзакцией.
+        
+        Возвращает URL изображений, сохраненных без анализа компьютерным зрением.
+        """
+        conn = self._connection()
+        now = time.time()
+        added = 0
+        pending = []
+        with self._write_lock, conn:
+            for doc_type in self.FIELD_WEIGHTS:
+                written, not_enriched = self._write_documents(conn, doc_type, page.get(doc_type) or [], now)
+                added += written
+                pending += not_enriched
+            self._bump_generation(conn, added)
+        return pending
+
+    def _bump_generation(self, conn, added):
+        """Новое поколение индекса после записи, но не чаще раза в generation_interval секунд.
+        
+        Поколение - номер интервала, в котором была последняя запись: краулер пишет постоянно,
+        и счетчик на каждую запись сбрасывал бы кэш результатов почти сразу. Записи внутри
+        интервала видны после следующей смены поколения или по истечении времени жизни кэша.
+        """
+        if added:
+            conn.execute("UPDATE meta SET value = max(value, ?) WHERE key = 'generation'",
+                         (int(time.time() // self.generation_interval),))
+
+    def generation(self):
+        """Текущее поколение индекса (общее для всех процессов, работающих с файлом)"""
+        return self._connection().execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()[0]
+
+    def _write_documents(self, conn, doc_type, documents, now):
+        """Запись документов одного типа внутри открытой транзакции: (число записанных, URL без анализа)"""
+        added = 0
+        pending = []
+        impact_lengths = self._impact_lengths(conn, doc_type)
+        for document in documents:
+            url = document.get('url')
+            if not url:
+                continue
+
+            doc_key = hashlib.md5(url.encode()).hexdigest()
+            stored = {k: v for k, v in document.items() if k != 'relevance_score'}
+            domain = document.get('domain') or document.get('channel') or urlparse(url).netloc
+
+            existing = conn.execute(
+                'SELECT data FROM documents WHERE doc_type = ? AND doc_key = ?',
+                (doc_type, doc_key)
+            ).fetchone()
+            if existing and not stored.get('vision_analyzed'):
+                # Повторное сканирование не должно терять результаты фонового анализа
+                previous = json.loads(existing[0])
+                if previous.get('vision_analyzed'):
+                    for field in ('vision_analysis', 'colors', 'phash', 'cluster'):
+                        if field in previous:
+                            stored[field] = previous[field]
+                    stored['vision_analyzed'] = True
+            enriched = 1 if doc_type != 'images' or stored.get('vision_analyzed') else 0
+            self._set_vision_terms(stored)
+            self._compact_document(doc_type, stored, domain)
+
+            # Изображение без анализа сразу занято записавшим его процессом: он сам ставит его в очередь
+            conn.execute(
+                'INSERT INTO documents (doc_type, doc_key, domain, data, indexed_at, enriched, enrich_claimed_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT (doc_type, doc_key) DO UPDATE SET '
+                'domain = excluded.domain, data = excluded.data, indexed_at = excluded.indexed_at, '
+                'enriched = excluded.enriched, enrich_claimed_at = excluded.enrich_claimed_at',
+                (doc_type, doc_key, domain, json.dumps(stored, ensure_ascii=False), now, enriched,
+                 None if enriched else now)
+            )
+            doc_id = conn.execute(
+                'SELECT doc_id FROM documents WHERE doc_type = ? AND doc_key = ?',
+                (doc_type, doc_key)
+            ).fetchone()[0]
+
+            self._write_postings(conn, doc_type, doc_id, stored, impact_lengths)
+            added += 1
+            if not enriched:
+                pending.append(url)
+
+        return added, pending
+
+    def _compact_document(self, doc_type, stored, domain):
+        """Удаление производных полей (миниатюра = URL, домен в своем столбце и т.п.) перед записью в JSON"""
+        for field, derive in self.DERIVED_FIELDS.get(doc_type, {}).items():
+            if field in stored and stored[field] == derive(stored, domain):
+                del stored[field]
+        return stored
+
+    def _load_document(self, doc_type, data, domain):
+        """Документ из сохраненного JSON с восстановленными производными полями"""
+        document = json.loads(data)
+        for field, derive in self.DERIVED_FIELDS.get(doc_type, {}).items():
+            if field not in document:
+                document[field] = derive(document, sys.intern(domain))
+        return document
+
+    def search(self, doc_type, terms, limit=200, deadline=None):
+        """Поиск документов по терминам запроса (уже разобранным анализатором): BM25F по постингам.
+        
+        terms - список терминов или словарь {термин: вес} после расширения запроса синонимами.
+        deadline - момент time.monotonic(), после которого SQLite прерывает запросы поиска (TimeoutError).
+        """
+        scorer = self.scorers.get(doc_type)
+        term_weights = terms if isinstance(terms, dict) else dict.fromkeys(terms, 1.0)
+        if scorer is None or not term_weights or limit <= 0:
+            return []
+
+        conn = self._connection()
+        if deadline is None:
+            return self._search(conn, doc_type, scorer, term_weights, limit)
+        # Обработчик прогресса вызывается каждые PROGRESS_STEPS инструкций SQLite: когда срок истек,
+        # текущий запрос прерывается, и поток пула не дочитывает постинги для ответа, который уже не ждут
+        conn.set_progress_handler(lambda: time.monotonic() > deadline, self.PROGRESS_STEPS)
+        try:
+            return self._search(conn, doc_type, scorer, term_weights, limit)
+        except sqlite3.OperationalError as e:
+            if time.monotonic() > deadline:
+                raise TimeoutError("срок запроса истек") from e
+            raise
+        finally:
+            conn.set_progress_handler(None, 0)
+
+    def _search(self, conn, doc_type, scorer, term_weights, limit):
+        stats = self.collection_stats(doc_type, term_weights)
+        terms = [
+            (term, stats['df'][term], weight * scorer.idf(stats['df'][term], stats['docs']))
+            for term, weight in term_weights.items() if stats['df'].get(term)
+        ]
+
+        top = self._top_documents(conn, doc_type, scorer, stats['lengths'], stats['impact_lengths'], terms, limit)
+        if not top:
+            return []
+
+        rows = {doc_id: (data, domain) for doc_id, data, domain in conn.execute(
+            f"SELECT doc_id, data, domain FROM documents WHERE doc_id IN ({', '.join('?' * len(top))})",
+            [doc_id for doc_id, _ in top]
+        )}
+
+        results = []
+        for doc_id, score in top:
+            document = self._load_document(doc_type, *rows[doc_id])
+            document['relevance_score'] = round(score, 3)
+            results.append(document)
+        return results
+
+    def _top_documents(self, conn, doc_type, scorer, average_lengths, impact_lengths, terms, limit):
+        """Лучшие limit документов: [(doc_id, оценка)] по убыванию, при равных оценках - меньший doc_id.
+        
+        terms - [(термин, df, idf)]. Списки терминов читаются блоками от большего вклада к меньшему,
+        следующим - список с наибольшей границей непрочитанного остатка. Вклад посчитан при опорных
+        длинах полей, а при текущих средних длинах частота больше вклада не более чем в slack раз,
+        поэтому непрочитанный документ термина оценивается сверху по последнему прочитанному вкладу.
+        Вклады остальных терминов у прочитанных документов дочитываются по doc_id, так что их оценки
+        точные. Когда limit-я оценка превысила сумму границ, непрочитанные документы в результат
+        уже не попадут, и чтение списков прекращается.
+        """
+        weights = scorer.weights
+        slack = max([1.0] + [
+            average / impact_lengths[field] for field, average in average_lengths.items()
+            if weights.get(field) and impact_lengths.get(field)
+        ])
+        # Запас на погрешность вычислений с плавающей точкой
+        slack *= 1 + 1e-9
+
+        idfs = {term: idf for term, _, idf in terms}
+        dfs = {term: df for term, df, _ in terms}
+        blocks = {term: self._impact_blocks(conn, doc_type, term) for term in idfs}
+        # Граница вклада еще не прочитанных документов термина (None - список прочитан целиком)
+        impacts = {term: self._max_impact(conn, doc_type, term) for term in idfs}
+        contributions = defaultdict(dict)  # doc_id -> {термин: вклад в оценку}
+        scores = {}
+
+        def bounds():
+            return {term: scorer.saturate(impact * slack, idfs[term])
+                    for term, impact in impacts.items() if impact is not None}
+
+        while True:
+            open_bounds = bounds()
+            if not open_bounds:
+                break
+            if len(scores) >= limit and heapq.nlargest(limit, scores.values())[-1] > sum(open_bounds.values()):
+                break
+            term = max(open_bounds, key=open_bounds.get)
+            block = next(blocks[term], None)
+            if block is None:
+                impacts[term] = None
+                continue
+            exhausted, impacts[term], documents = block
+            if exhausted:
+                impacts[term] = None
+            for doc_id, rows in documents:
+                if term in contributions[doc_id]:
+                    # Вклад уже дочитан по doc_id
+                    continue
+                frequency = sum(scorer.field_frequency(field, tf, length, average_lengths)
+                                for field, tf, length in rows)
+                self._add_contribution(scores, contributions, doc_id, term, scorer.saturate(frequency, idfs[term]))
+
+            # Недостающие вклады новых документов дочитываются по doc_id сразу: оценки прочитанных
+            # документов точные, и порог растет до настоящей limit-й оценки
+            self._complete_scores(conn, doc_type, scorer, average_lengths, dfs, idfs, scores, contributions,
+                                  [doc_id for doc_id, _ in documents], impacts)
+
+        # Оценка - сумма вкладов в порядке терминов запроса (одинаковая при любом порядке чтения)
+        final = [(doc_id, sum(contributions[doc_id].get(term, 0.0) for term in idfs)) for doc_id in scores]
+        return heapq.nlargest(limit, final, key=lambda item: (item[1], -item[0]))
+
+    @staticmethod
+    def _add_contribution(scores, contributions, doc_id, term, contribution):
+        contributions[doc_id][term] = contribution
+        scores[doc_id] = scores.get(doc_id, 0.0) + contribution
+
+    def _complete_scores(self, conn, doc_type, scorer, average_lengths, dfs, idfs, scores, contributions,
+                         doc_ids, impacts):
+        """Вклады терминов с недочитанными списками у документов doc_ids - выборкой по doc_id"""
+        for term, impact in impacts.items():
+            if impact is None:
+                continue
+            candidates = [doc_id for doc_id in doc_ids if term not in contributions[doc_id]]
+            if not candidates:
+                continue
+            wanted = set(candidates)
+            frequencies = defaultdict(float)
+            for doc_id, field, tf, length in self._term_postings(conn, doc_type, term, dfs[term], candidates):
+                if doc_id in wanted:
+                    frequencies[doc_id] += scorer.field_frequency(field, tf, length, average_lengths)
+            for doc_id in candidates:
+                frequency = frequencies[doc_id]
+                self._add_contribution(scores, contributions, doc_id, term,
+                                       scorer.saturate(frequency, idfs[term]) if frequency else 0.0)
+
+    def _max_impact(self, conn, doc_type, term):
+        row = conn.execute(
+            'SELECT impact FROM postings WHERE term = ? AND doc_type = ? ORDER BY impact DESC LIMIT 1',
+            (term, doc_type)
+        ).fetchone()
+        return row[0] if row else None
+
+    def _impact_blocks(self, conn, doc_type, term, block=256, max_block=16384):
+        """Постинги термина блоками по убыванию вклада (индекс postings_by_impact).
+        
+        Блок - (прочитан ли список целиком, вклад последнего документа, [(doc_id, [(поле, tf, длина)])]).
+        Строки одного документа всегда попадают в один блок.
+        """
+        columns = 'SELECT doc_id, field, tf, length, impact FROM postings WHERE term = ? AND doc_type = ?'
+        position = None  # (вклад, doc_id) последнего прочитанного документа
+        while True:
+            rows = []
+            if position is not None:
+                # Сначала - остаток документов с тем же вкладом, что и последний прочитанный
+                rows = conn.execute(
+                    f'{columns} AND impact = ? AND doc_id > ? ORDER BY doc_id LIMIT ?',
+                    (term, doc_type, *position, block)
+                ).fetchall()
+            if len(rows) < block:
+                if position is None:
+                    rows += conn.execute(f'{columns} ORDER BY impact DESC, doc_id LIMIT ?',
+                                         (term, doc_type, block)).fetchall()
+                else:
+                    rows += conn.execute(f'{columns} AND impact < ? ORDER BY impact DESC, doc_id LIMIT ?',
+                                         (term, doc_type, position[0], block - len(rows))).fetchall()
+            if not rows:
+                return
+            exhausted = len(rows) < block
+            if not exhausted:
+                # Строки последнего документа могли не поместиться в блок: они дочитываются по ключу
+                last = rows[-1][0]
+                rows = [row for row in rows if row[0] != last] + conn.execute(
+                    f'{columns} AND doc_id = ?', (term, doc_type, last)
+                ).fetchall()
+
+            documents = []
+            for doc_id, field, tf, length, _ in rows:
+                if not documents or documents[-1][0] != doc_id:
+                    documents.append((doc_id, []))
+                documents[-1][1].append((field, tf, length))
+            position = (rows[-1][4], rows[-1][0])
+            yield exhausted, position[0], documents
+            if exhausted:
+                return
+            block = min(block * 2, max_block)
+
+    def _term_postings(self, conn, doc_type, term, df, candidates=None, chunk=500):
+        """Постинги термина: весь список или только у кандидатов (что выйдет дешевле)"""
+        if candidates is None or df <= len(candidates):
+            return conn.execute(
+                'SELECT doc_id, field, tf, length FROM postings WHERE term = ? AND doc_type = ?',
+                (term, doc_type)
+            ).fetchall()
+        rows = []
+        for start in range(0, len(candidates), chunk):
+            part = candidates[start:start + chunk]
+            rows += conn.execute(
+                f"SELECT doc_id, field, tf, length FROM postings "
+                f"WHERE term = ? AND doc_type = ? AND doc_id IN ({', '.join('?' * len(part))})",
+                (term, doc_type, *part)
+            ).fetchall()
+        return rows
+
+    def claim_enrichment(self, limit=1000):
+        """URL изображений без анализа компьютерным зрением, занятые этим процессом.
+        
+        Строки помечаются временем захвата в одном UPDATE ... RETURNING, поэтому воркеры, которые
+        одновременно досылают очередь после перезапуска, получают разные изображения. Захват,
+        не закончившийся анализом (процесс упал), истекает через ENRICHMENT_CLAIM_TTL.
+        """
+        if limit <= 0:
+            return []
+        conn = self._connection()
+        now = time.time()
+        with self._write_lock, conn:
+            rows = conn.execute(
+                "UPDATE documents SET enrich_claimed_at = ? WHERE doc_id IN ("
+                "SELECT doc_id FROM documents WHERE doc_type = 'images' AND enriched = 0 "
+                "AND (enrich_claimed_at IS NULL OR enrich_claimed_at <= ?) LIMIT ?"
+                ") RETURNING json_extract(data, '$.url')",
+                (now, now - self.ENRICHMENT_CLAIM_TTL, limit)
+            ).fetchall()
+        return [url for (url,) in rows]
+
+    def renew_enrichment_claims(self, urls, chunk=500):
+        """Продление захвата изображений, которые еще ждут анализа в очереди этого процесса"""
+        conn = self._connection()
+        keys = [hashlib.md5(url.encode()).hexdigest() for url in urls]
+        now = time.time()
+        with self._write_lock, conn:
+            for start in range(0, len(keys), chunk):
+                part = keys[start:start + chunk]
+                conn.execute(
+                    f"UPDATE documents SET enrich_claimed_at = ? WHERE doc_type = 'images' AND enriched = 0 "
+                    f"AND doc_key IN ({', '.join('?' * len(part))})",
+                    (now, *part)
+                )
+
+    def set_vision_analysis(self, url, vision_analysis):
+        """Сохранение результата анализа изображения вместе с документом"""
+        return self.set_vision_analyses([(url, vision_analysis)]) > 0
+
+    def set_vision_analyses(self, items):
+        """Сохранение пачки результатов анализа (url, анализ[, доп. поля документа]) одной транзакцией"""
+        conn = self._connection()
+        documents = []
+        for url, vision_analysis, *fields in items:
+            row = conn.execute(
+                "SELECT data, domain FROM documents WHERE doc_type = 'images' AND doc_key = ?",
+                (hashlib.md5(url.encode()).hexdigest(),)
+            ).fetchone()
+            if row is None:
+                continue
+            document = self._load_document('images', *row)
+            document['vision_analysis'] = vision_analysis
+            document['vision_analyzed'] = True
+            if fields:
+                document.update(fields[0])
+            documents.append(document)
+        return self.add_documents('images', documents)
+
+    def page_state(self, url):
+        """Состояние страницы с прошлого обхода: ETag, Last-Modified, хэш содержимого и ссылки"""
+        row = self._connection().execute(
+            'SELECT etag, last_modified, content_hash, links, fetched_at FROM pages WHERE url_key = ?',
+            (hashlib.md5(url.encode()).hexdigest(),)
+        ).fetchone()
+        if row is None:
+            return None
+        etag, last_modified, content_hash, links, fetched_at = row
+        return {
+            'etag': etag,
+            'last_modified': last_modified,
+            'content_hash': content_hash,
+            'links': json.loads(links),
+            'fetched_at': fetched_at
+        }
+
+    def set_page_state(self, url, etag, last_modified, content_hash, links):
+        """Сохранение состояния страницы после ее индексирования"""
+        conn = self._connection()
+        with self._write_lock, conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO pages (url_key, etag, last_modified, content_hash, links, fetched_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (hashlib.md5(url.encode()).hexdigest(), etag, last_modified, content_hash,
+                 json.dumps(links), time.time())
+            )
+
+    def touch_page_state(self, url, validators=None):
+        """Отметка повторного обхода неизменившейся страницы; validators - новые (ETag, Last-Modified)"""
+        url_key = hashlib.md5(url.encode()).hexdigest()
+        conn = self._connection()
+        with self._write_lock, conn:
+            if validators is None:
+                conn.execute('UPDATE pages SET fetched_at = ? WHERE url_key = ?', (time.time(), url_key))
+            else:
+                conn.execute('UPDATE pages SET fetched_at = ?, etag = ?, last_modified = ? WHERE url_key = ?',
+                             (time.time(), *validators, url_key))
+
+    def cluster_heads(self):
+        """(doc_id, перцептивный хэш) канонических изображений кластеров почти-дубликатов"""
+        return self._connection().execute(
+            "SELECT doc_id, json_extract(data, '$.phash') FROM documents "
+            "WHERE doc_type = 'images' AND json_extract(data, '$.cluster') = json_extract(data, '$.url')"
+        ).fetchall()
+
+    def image_clusters(self, urls):
+        """Сохраненный кластер изображений по URL: {url: URL канонического изображения}"""
+        keys = {hashlib.md5(url.encode()).hexdigest(): url for url in urls}
+        if not keys:
+            return {}
+        rows = self._connection().execute(
+            f"SELECT doc_key, json_extract(data, '$.cluster') FROM documents "
+            f"WHERE doc_type = 'images' AND doc_key IN ({', '.join('?' * len(keys))})",
+            list(keys)
+        ).fetchall()
+        return {keys[doc_key]: cluster for doc_key, cluster in rows if cluster}
+
+    def doc_id(self, doc_type, url):
+        """Целочисленный идентификатор документа по URL (None, если документа нет)"""
+        row = self._connection().execute(
+            'SELECT doc_id FROM documents WHERE doc_type = ? AND doc_key = ?',
+            (doc_type, hashlib.md5(url.encode()).hexdigest())
+        ).fetchone()
+        return row[0] if row else None
+
+    def document_url(self, doc_id):
+        row = self._connection().execute(
+            "SELECT json_extract(data, '$.url') FROM documents WHERE doc_id = ?", (doc_id,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def count(self, doc_type=None):
+        """Количество документов в индексе"""
+        conn = self._connection()
+        if doc_type is None:
+            return conn.execute('SELECT COUNT(*) FROM documents').fetchone()[0]
+        return conn.execute(
+            'SELECT COUNT(*) FROM documents WHERE doc_type = ?', (doc_type,)
+        ).fetchone()[0]
+
+# Глобальный индекс документов (переживает перезапуски процесса)
+search_index = SearchIndex(os.environ.get(
+    'ARIOS_INDEX_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'arios_index.db')
+), text_analyzer, generation_interval=float(os.environ.get('ARIOS_GENERATION_INTERVAL', 60)))
+app_status['indexed_images'] = search_index.count('images')
+
+class FetchResponse:
+    """Результат загрузки URL (основные поля как у requests.Response)"""
+
+    __slots__ = ('url', 'status_code', 'headers', 'content', 'truncated')
+
+    def __init__(self, url, status_code, headers, content, truncated=False):
+        self.url = url
+        self.status_code = status_code
+        self.headers = CaseInsensitiveDict(headers)
+        self.content = content
+        self.truncated = truncated
+
+    @property
+    def encoding(self):
+        match = re.search(r'charset=([\w-]+)', self.headers.get('Content-Type', ''), re.I)
+        return match.group(1) if match else None
+
+    @property
+    def text(self):
+        try:
+            return self.content.decode(self.encoding or 'utf-8', errors='replace')
+        except LookupError:
+            return self.content.decode('utf-8', errors='replace')
+
+class HttpTransport:
+    """Общий HTTP-транспорт: пулы соединений по хостам, keep-alive, повторы с задержкой и статистика"""
+
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+    RETRY_METHODS = frozenset(['GET', 'HEAD'])
+
+    def __init__(self, max_connections=100, per_host=8, retries=2, backoff=0.5, keepalive=30):
+        self.max_connections = max_connections
+        self.per_host = per_host
+        self.retries = retries
+        self.backoff = backoff
+        self.keepalive = keepalive
+        self._stats = {'requests': 0, 'connections_created': 0, 'retries': 0}
+        self._lock = threading.Lock()
+        # Общий лимит занятых соединений: пулы urllib3 ограничивают только соединения к одному хосту
+        self._slots = threading.BoundedSemaphore(max_connections)
+
+        adapter = HTTPAdapter(
+            pool_connections=max(1, max_connections // per_host),
+            pool_maxsize=per_host,
+            # Запрос ждет свободного соединения к хосту, а не открывает лишнее сверх per_host
+            pool_block=True,
+            max_retries=Retry(
+                total=retries, backoff_factor=backoff,
+                status_forcelist=self.RETRY_STATUSES,
+                allowed_methods=self.RETRY_METHODS,
+                raise_on_status=False
+            )
+        )
+        # Пулы urllib3 с подсчетом новых соединений
+        adapter.poolmanager.pool_classes_by_scheme = {
+            'http': self._counting_pool(HTTPConnectionPool),
+            'https': self._counting_pool(HTTPSConnectionPool)
+        }
+
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def _counting_pool(self, pool_class):
+        transport = self
+
+        class CountingPool(pool_class):
+            def _new_conn(self):
+                transport.record('connections_created')
+                return super()._new_conn()
+
+        return CountingPool
+
+    def record(self, counter, amount=1):
+        with self._lock:
+            self._stats[counter] += amount
+
+    def request(self, method, url, **kwargs):
+        """HTTP-запрос через общий пул соединений: одновременно не больше max_connections"""
+        self._slots.acquire()
+        try:
+            self.record('requests')
+            response = self.session.request(method, url, **kwargs)
+        except Exception:
+            self._slots.release()
+            raise
+        retries = getattr(response.raw, 'retries', None)
+        if retries is not None and retries.history:
+            self.record('retries', len(retries.history))
+
+        if not kwargs.get('stream'):
+            self._slots.release()
+            return response
+        # Потоковый ответ держит соединение, пока тело не прочитано: место освобождается при закрытии
+        close = response.close
+        held = True
+
+        def close_and_release():
+            nonlocal held
+            try:
+                close()
+            finally:
+                if held:
+                    held = False
+                    self._slots.release()
+
+        response.close = close_and_release
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def create_async_session(self):
+        """Сессия aiohttp с теми же лимитами соединений и учетом статистики"""
+        trace_config = aiohttp.TraceConfig()
+
+        async def on_connection_created(session, context, params):
+            self.record('connections_created')
+
+        trace_config.on_connection_create_end.append(on_connection_created)
+        connector = aiohttp.TCPConnector(
+            limit=self.max_connections,
+            limit_per_host=self.per_host,
+            keepalive_timeout=self.keepalive
+        )
+        return aiohttp.ClientSession(connector=connector, trace_configs=[trace_config])
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['connections_reused'] = max(0, stats['requests'] - stats['connections_created'])
+        stats['reuse_ratio'] = round(stats['connections_reused'] / stats['requests'], 3) if stats['requests'] else 0
+        return stats
+
+# Общий транспорт для всех исходящих HTTP-запросов
+http_transport = HttpTransport(
+    max_connections=int(os.environ.get('ARIOS_HTTP_MAX_CONNECTIONS', 100)),
+    per_host=int(os.environ.get('ARIOS_HTTP_PER_HOST', 8)),
+    retries=int(os.environ.get('ARIOS_HTTP_RETRIES', 2))
+)
+
+class AsyncFetchEngine:
+    """Асинхронная загрузка страниц: собственный цикл событий, общий и похостовый лимиты параллельности"""
+
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, transport, max_concurrency=100, per_host=4, timeout=8, max_body_bytes=5 * 1024 * 1024):
+        self.transport = transport
+        self.max_concurrency = max_concurrency
+        self.per_host = per_host
+        self.timeout = timeout
+        self.max_body_bytes = max_body_bytes
+        self._loop = None
+        self._loop_thread = None
+        self._loop_lock = threading.Lock()
+        self._session = None
+        self._global_semaphore = None
+        self._host_semaphores = weakref.WeakValueDictionary()
+
+    @property
+    def loop(self):
+        """Цикл событий в отдельном фоновом потоке (запускается при первом обращении)"""
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._loop_thread = threading.Thread(
+                    target=self._loop.run_forever, name='fetch-loop', daemon=True
+                )
+                self._loop_thread.start()
+        return self._loop
+
+    def run(self, coroutine, timeout=None):
+        """Синхронное выполнение корутины в цикле движка"""
+        if threading.current_thread() is self._loop_thread:
+            coroutine.close()
+            raise RuntimeError("Синхронный вызов из цикла событий движка загрузки")
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result(timeout)
+
+    def _host_semaphore(self, host):
+        semaphore = self._host_semaphores.get(host)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.per_host)
+            self._host_semaphores[host] = semaphore
+        return semaphore
+
+    async def fetch_async(self, url, headers=None, method='GET', timeout=None, max_bytes=None, accept=None):
+        """Загрузка URL с потоковым чтением тела не больше max_bytes.
+        
+        accept(статус, заголовки) вызывается до чтения тела: если он вернул False,
+        тело не читается, и ответ возвращается с пустым content.
+        """
+        if self._global_semaphore is None:
+            self._global_semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        timeout = timeout or self.timeout
+        max_bytes = max_bytes or self.max_body_bytes
+        host_semaphore = self._host_semaphore(urlparse(url).netloc.lower())
+
+        if aiohttp is None:
+            # Повторы выполняет сам транспорт (urllib3 Retry)
+            async with self._global_semaphore, host_semaphore:
+                return await asyncio.get_running_loop().run_in_executor(
+                    None, self._blocking_fetch, url, headers, method, timeout, max_bytes, accept
+                )
+
+        retries = self.transport.retries if method in self.transport.RETRY_METHODS else 0
+        for attempt in range(retries + 1):
+            try:
+                async with self._global_semaphore, host_semaphore:
+                    response = await self._aiohttp_fetch(url, headers, method, timeout, max_bytes, accept)
+                if response.status_code not in self.transport.RETRY_STATUSES or attempt == retries:
+                    return response
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if attempt == retries:
+                    raise
+
+            self.transport.record('retries')
+            await asyncio.sleep(self.transport.backoff * (2 ** attempt))
+
+    async def _aiohttp_fetch(self, url, headers, method, timeout, max_bytes, accept=None):
+        if self._session is None:
+            self._session = self.transport.create_async_session()
+
+        self.transport.record('requests')
+        async with self._session.request(
+            method, url, headers=headers, timeout=aiohttp.ClientTimeout(total=timeout)
+        ) as response:
+            if accept is not None and not accept(response.status, response.headers):
+                return FetchResponse(str(response.url), response.status, response.headers, b'')
+            body = bytearray()
+            truncated = False
+            async for chunk in response.content.iter_chunked(self.CHUNK_SIZE):
+                body += chunk
+                if len(body) >= max_bytes:
+                    truncated = True
+                    break
+            return FetchResponse(str(response.url), response.status, response.headers,
+                                 bytes(body[:max_bytes]), truncated)
+
+    def _blocking_fetch(self, url, headers, method, timeout, max_bytes, accept=None):
+        """Загрузка через общий транспорт requests, если aiohttp не установлен"""
+        with self.transport.request(method, url, headers=headers, timeout=timeout, stream=True) as response:
+            if accept is not None and not accept(response.status_code, response.headers):
+                return FetchResponse(response.url, response.status_code, response.headers, b'')
+            body = bytearray()
+            truncated = False
+            for chunk in response.iter_content(self.CHUNK_SIZE):
+                body += chunk
+                if len(body) >= max_bytes:
+                    truncated = True
+                    break
+            return FetchResponse(response.url, response.status_code, response.headers,
+                                 bytes(body[:max_bytes]), truncated)
+
+    def fetch(self, url, headers=None, method='GET', timeout=None, max_bytes=None):
+        """Синхронная обертка над fetch_async"""
+        return self.run(self.fetch_async(url, headers, method, timeout, max_bytes))
+
+    async def fetch_many_async(self, urls, headers=None, method='GET', timeout=None, max_bytes=None):
+        """Параллельная загрузка списка URL; ошибки возвращаются на месте результатов"""
+        return await asyncio.gather(
+            *(self.fetch_async(url, headers, method, timeout, max_bytes) for url in urls),
+            return_exceptions=True
+        )
+
+    def fetch_many(self, urls, headers=None, method='GET', timeout=None, max_bytes=None):
+        """Синхронная обертка над fetch_many_async"""
+        return self.run(self.fetch_many_async(urls, headers, method, timeout, max_bytes))
+
+    def close(self):
+        """Закрытие HTTP-сессии при завершении процесса"""
+        if self._session is not None and not self._session.closed:
+            self.run(self._session.close(), timeout=5)
+
+# Общий движок загрузки для краулера и анализатора изображений
+fetch_engine = AsyncFetchEngine(
+    http_transport,
+    max_concurrency=int(os.environ.get('ARIOS_FETCH_CONCURRENCY', 100)),
+    per_host=int(os.environ.get('ARIOS_FETCH_PER_HOST', 4))
+)
+atexit.register(fetch_engine.close)
+
+class TTLCache:
+    """Потокобезопасный кэш с ограничением размера (LRU) и временем жизни записей"""
+
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self._data = OrderedDict()  # ключ -> (значение, время истечения)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            if item[1] <= time.time():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return item[0]
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (value, time.time() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+class KeywordMatcher:
+    """Автомат Ахо–Корасик: все вхождения набора ключевых слов за один проход по тексту"""
+
+    def __init__(self):
+        self._goto = [{}]       # переходы состояний по символам
+        self._fail = [0]        # суффиксные ссылки
+        self._output = [()]     # (длина шаблона, данные) для каждого состояния
+        self._built = False
+
+    def add(self, pattern, payload):
+        """Добавление шаблона с произвольными связанными данными"""
+        if not pattern:
+            return
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(())
+                self._goto[state][char] = next_state
+            state = next_state
+        self._output[state] += ((len(pattern), payload),)
+        self._built = False
+
+    def build(self):
+        """Построение суффиксных ссылок обходом в ширину"""
+        queue = deque(self._goto[0].values())
+        for state in queue:
+            self._fail[state] = 0
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                self._output[next_state] += self._output[self._fail[next_state]]
+        self._built = True
+
+    def find(self, text):
+        """Список (позиция начала, данные) для всех вхождений шаблонов в текст"""
+        if not self._built:
+            self.build()
+
+        goto, fail, output = self._goto, self._fail, self._output
+        hits = []
+        state = 0
+        for position, char in enumerate(text):
+            next_state = goto[state].get(char)
+            while next_state is None and state:
+                state = fail[state]
+                next_state = goto[state].get(char)
+            state = next_state or 0
+            for length, payload in output[state]:
+                hits.append((position - length + 1, payload))
+        return hits
+
+class BKTree:
+    """BK-дерево для поиска 64-битных хэшей в пределах расстояния Хэмминга.
+    
+    Узлы хранятся по столбцам в массивах (хэш, целочисленные данные, расстояние до родителя,
+    первый потомок, следующий потомок того же родителя) - без объекта и словаря на каждый узел.
+    """
+
+    def __init__(self):
+        self._values = array('Q')
+        self._payloads = array('q')
+        self._distances = array('B')
+        self._first_child = array('i')
+        self._next_sibling = array('i')
+
+    @staticmethod
+    def distance(a, b):
+        return (a ^ b).bit_count()
+
+    def add(self, value, payload):
+        """Добавление хэша с целочисленными данными (например, идентификатором документа)"""
+        node = len(self._values)
+        self._values.append(value)
+        self._payloads.append(payload)
+        self._distances.append(0)
+        self._first_child.append(-1)
+        self._next_sibling.append(-1)
+        if node == 0:
+            return
+
+        parent = 0
+        while True:
+            d = self.distance(value, self._values[parent])
+            child = self._first_child[parent]
+            while child != -1 and self._distances[child] != d:
+                child = self._next_sibling[child]
+            if child == -1:
+                self._distances[node] = d
+                self._next_sibling[node] = self._first_child[parent]
+                self._first_child[parent] = node
+                return
+            parent = child
+
+    def find(self, value, max_distance):
+        """Список (расстояние, хэш, данные) в пределах max_distance, ближайшие первыми"""
+        if not self._values:
+            return []
+        found = []
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            d = self.distance(value, self._values[node])
+            if d <= max_distance:
+                found.append((d, self._values[node], self._payloads[node]))
+            # Неравенство треугольника: ветви дальше этого диапазона не содержат совпадений
+            child = self._first_child[node]
+            while child != -1:
+                if d - max_distance <= self._distances[child] <= d + max_distance:
+                    stack.append(child)
+                child = self._next_sibling[child]
+        found.sort(key=lambda item: item[0])
+        return found
+
+    def memory_bytes(self):
+        """Размер столбцов дерева в байтах"""
+        return sum(column.itemsize * len(column) for column in (
+            self._values, self._payloads, self._distances, self._first_child, self._next_sibling
+        ))
+
+    def __len__(self):
+        return len(self._values)
 
 class ImageAnalyzer:
     """Анализатор изображений с компьютерным зрением"""
@@ -597,19 +2132,89 @@ class ImageAnalyzer:
             'vibration': 'вибрация', 'wave': 'волна', 'particle': 'частица'
         }
         
+        # Расширенный анализ ключевых слов
+        self.keywords_mapping = {
+            # Животные
+            'cat': 'кот', 'kitty': 'котенок', 'kitten': 'котенок', 'кошка': 'кот', 'кот': 'кот',
+            'dog': 'собака', 'puppy': 'щенок', 'собака': 'собака', 'пес': 'собака',
+            'bird': 'птица', 'птица': 'птица', 'eagle': 'орел', 'owl': 'сова',
+            # Природа
+            'flower': 'цветок', 'rose': 'роза', 'цветок': 'цветок', 'роза': 'роза',
+            'tree': 'дерево', 'forest': 'лес', 'дерево': 'дерево', 'лес': 'лес',
+            'mountain': 'горы', 'гора': 'горы', 'горы': 'горы',
+            'beach': 'пляж', 'пляж': 'пляж', 'море': 'море',
+            'city': 'город', 'город': 'город', 'urban': 'город',
+            # Транспорт
+            'car': 'машина', 'auto': 'автомобиль', 'машина': 'машина', 'авто': 'автомобиль',
+            # Еда
+            'food': 'еда', 'fruit': 'фрукт', 'vegetable': 'овощ', 'еда': 'еда',
+            # Люди
+            'person': 'человек', 'people': 'люди', 'человек': 'человек', 'люди': 'люди',
+            # Технологии
+            'computer': 'компьютер', 'phone': 'телефон', 'компьютер': 'компьютер',
+            # Спорт
+            'sport': 'спорт', 'football': 'футбол', 'basketball': 'баскетбол',
+            # Искусство
+            'art': 'искусство', 'music': 'музыка', 'painting': 'живопись',
+            # Архитектура
+            'building': 'здание', 'house': 'дом', 'architecture': 'архитектура',
+            # Время года
+            'winter': 'зима', 'summer': 'лето', 'spring': 'весна', 'autumn': 'осень',
+            # Цвета
+            'red': 'красный', 'blue': 'синий', 'green': 'зеленый', 'yellow': 'желтый',
+            'black': 'черный', 'white': 'белый', 'pink': 'розовый', 'purple': 'фиолетовый'
+        }
+        
+        # Определение цветов по ключевым словам в URL
+        self.color_keywords = {
+            'red': 'красный', 'blue': 'синий', 'green': 'зеленый',
+            'yellow': 'желтый', 'orange': 'оранжевый', 'purple': 'фиолетовый',
+            'pink': 'розовый', 'black': 'черный', 'white': 'белый',
+            'gray': 'серый', 'brown': 'коричневый', 'gold': 'золотой',
+            'silver': 'серебряный', 'beige': 'бежевый', 'turquoise': 'бирюзовый'
+        }
+        
+        # Все словари собираются в один автомат Ахо–Корасик при создании анализатора
+        self.keyword_matcher = self._build_keyword_matcher()
+        
+        # Проверка доступности изображений без загрузки тела
+        self.image_min_bytes = 1024
+        self.image_max_bytes = 20 * 1024 * 1024
+        self.validation_ttl = 24 * 3600
+        self.negative_validation_ttl = 3600
+        self.validation_cache = TTLCache(maxsize=100000)
+        
+        # Опорные цвета для гистограммы пикселей (RGB)
+        self.color_palette = {
+            'красный': (200, 30, 35), 'оранжевый': (240, 130, 30), 'желтый': (240, 215, 50),
+            'зеленый': (50, 150, 60), 'голубой': (100, 190, 235), 'синий': (35, 70, 180),
+            'фиолетовый': (125, 60, 165), 'розовый': (240, 150, 185), 'коричневый': (115, 70, 40),
+            'бежевый': (220, 200, 160), 'черный': (15, 15, 15), 'серый': (128, 128, 128),
+            'белый': (245, 245, 245)
+        }
+        
+        # Бюджет на одно изображение: байты загрузки, пиксели исходника, сторона миниатюры
+        self.color_max_bytes = 4 * 1024 * 1024
+        self.color_max_pixels = 50 * 1000 * 1000
+        self.color_thumbnail_size = 64
+        self.color_min_share = 0.1
+        self.color_bins = self._build_color_bins()
+        
     def analyze_image(self, image_url):
         """Анализ изображения с помощью упрощенного компьютерного зрения"""
+        return fetch_engine.run(self.analyze_image_async(image_url))
+
+    async def analyze_image_async(self, image_url):
+        """Асинхронный анализ изображения через общий движок загрузки"""
         try:
-            # Загрузка изображения
-            response = requests.get(image_url, timeout=10)
-            if response.status_code != 200:
+            # Проверка и загрузка изображения - один запрос
+            features = await self._validated_features(image_url)
+            if features is None:
                 return {}
             
-            # Упрощенный анализ на основе URL и метаданных
-            analysis = self._simplified_analysis(image_url)
-            
-            # Дополнительный анализ цветов
-            analysis.update(self._analyze_colors_from_url(image_url))
+            # Упрощенный анализ на основе URL; цвета - по пикселям, если их удалось получить
+            analysis, color_analysis = self._analyze_url(image_url)
+            analysis.update(features.get('colors') or color_analysis)
             
             return analysis
             
@@ -617,92 +2222,273 @@ class ImageAnalyzer:
             logger.error(f"❌ Ошибка анализа изображения {image_url}: {e}")
             return {}
 
-    def _simplified_analysis(self, image_url):
-        """Упрощенный анализ изображения на основе URL и имени файла"""
-        analysis = {}
-        
-        try:
-            # Анализ имени файла
-            filename = os.path.basename(urlparse(image_url).path).lower()
-            
-            # Поиск объектов в имени файла
-            for eng, rus in self.object_translations.items():
-                if eng in filename or rus in filename:
-                    analysis[rus] = 0.7  # Высокая уверенность для совпадений в имени
-            
-            # Анализ пути URL
-            path = urlparse(image_url).path.lower()
-            for scene in self.scene_categories:
-                if scene in path:
-                    analysis[scene] = 0.6
-            
-            # Расширенный анализ ключевых слов
-            keywords_mapping = {
-                # Животные
-                'cat': 'кот', 'kitty': 'котенок', 'kitten': 'котенок', 'кошка': 'кот', 'кот': 'кот',
-                'dog': 'собака', 'puppy': 'щенок', 'собака': 'собака', 'пес': 'собака',
-                'bird': 'птица', 'птица': 'птица', 'eagle': 'орел', 'owl': 'сова',
-                # Природа
-                'flower': 'цветок', 'rose': 'роза', 'цветок': 'цветок', 'роза': 'роза',
-                'tree': 'дерево', 'forest': 'лес', 'дерево': 'дерево', 'лес': 'лес',
-                'mountain': 'горы', 'гора': 'горы', 'горы': 'горы',
-                'beach': 'пляж', 'пляж': 'пляж', 'море': 'море',
-                'city': 'город', 'город': 'город', 'urban': 'город',
-                # Транспорт
-                'car': 'машина', 'auto': 'автомобиль', 'машина': 'машина', 'авто': 'автомобиль',
-                # Еда
-                'food': 'еда', 'fruit': 'фрукт', 'vegetable': 'овощ', 'еда': 'еда',
-                # Люди
-                'person': 'человек', 'people': 'люди', 'человек': 'человек', 'люди': 'люди',
-                # Технологии
-                'computer': 'компьютер', 'phone': 'телефон', 'компьютер': 'компьютер',
-                # Спорт
-                'sport': 'спорт', 'football': 'футбол', 'basketball': 'баскетбол',
-                # Искусство
-                'art': 'искусство', 'music': 'музыка', 'painting': 'живопись',
-                # Архитектура
-                'building': 'здание', 'house': 'дом', 'architecture': 'архитектура',
-                # Время года
-                'winter': 'зима', 'summer': 'лето', 'spring': 'весна', 'autumn': 'осень',
-                # Цвета
-                'red': 'красный', 'blue': 'синий', 'green': 'зеленый', 'yellow': 'желтый',
-                'black': 'черный', 'white': 'белый', 'pink': 'розовый', 'purple': 'фиолетовый'
-            }
-            
-            for keyword, category in keywords_mapping.items():
-                if keyword in filename or keyword in path:
-                    analysis[category] = 0.8
-            
-        except Exception as e:
-            logger.error(f"❌ Ошибка упрощенного анализа: {e}")
-        
-        return analysis
+    def analyze_batch(self, image_urls):
+        """Анализ пачки изображений; результаты в порядке входных URL"""
+        return fetch_engine.run(self.analyze_batch_async(image_urls))
 
-    def _analyze_colors_from_url(self, image_url):
-        """Упрощенный анализ цветов на основе URL"""
-        color_analysis = {}
+    async def analyze_batch_async(self, image_urls):
+        """Пакетный анализ: проверки по сети идут параллельно с сопоставлением ключевых слов"""
+        return [analysis for analysis, _ in await self.analyze_batch_with_features_async(image_urls)]
+
+    async def analyze_batch_with_features_async(self, image_urls):
+        """Пакетный анализ; для каждого URL - (анализ, признаки по пикселям: цвета и перцептивный хэш)"""
+        loop = asyncio.get_running_loop()
         
-        try:
-            filename = urlparse(image_url).path.lower()
-            
-            # Определение цветов по ключевым словам в URL
-            color_keywords = {
-                'red': 'красный', 'blue': 'синий', 'green': 'зеленый',
-                'yellow': 'желтый', 'orange': 'оранжевый', 'purple': 'фиолетовый',
-                'pink': 'розовый', 'black': 'черный', 'white': 'белый',
-                'gray': 'серый', 'brown': 'коричневый', 'gold': 'золотой',
-                'silver': 'серебряный', 'beige': 'бежевый', 'turquoise': 'бирюзовый'
-            }
-            
-            for eng, rus in color_keywords.items():
-                if eng in filename or rus in filename:
-                    color_analysis[rus] = 0.6
+        # Проверка и декодирование запускаются сразу, по одной задаче на уникальный URL
+        pixel_features = {url: asyncio.ensure_future(self._validated_features(url)) for url in set(image_urls)}
         
-        except Exception as e:
-            logger.error(f"❌ Ошибка анализа цветов: {e}")
+        # Сопоставление по словарям вне цикла событий, пока идут загрузки
+        matched = await loop.run_in_executor(None, lambda: [self._analyze_url(url) for url in image_urls])
         
-        return color_analysis
-
+        await asyncio.gather(*pixel_features.values())
+        
+        results = []
+        for url, (analysis, color_analysis) in zip(image_urls, matched):
+            features = pixel_features[url].result()
+            if features is None:
+                results.append(({}, {}))
+                continue
+            analysis = dict(analysis)
+            analysis.update(features.get('colors') or color_analysis)
+            results.append((analysis, features))
+        return results
+
+    async def _validated_features(self, image_url):
+        """Признаки по пикселям для доступного изображения, None - если изображение не прошло проверку.
+        
+        Проверка и загрузка - один потоковый GET: тип и размер проверяются по заголовкам ответа,
+        и тело не читается, если изображение не подходит или его пиксели все равно не декодируются.
+        """
+        if self.validation_cache.get(image_url) is False:
+            return None
+        
+        verdict = {'valid': False}
+        
+        def accept(status, headers):
+            verdict['valid'] = self._valid_image_response(status, headers)
+            return verdict['valid'] and self._decodable(headers)
+        
+        try:
+            response = await fetch_engine.fetch_async(
+                image_url, timeout=10, max_bytes=self.color_max_bytes, accept=accept
+            )
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось проверить изображение {image_url}: {e}")
+            response = None
+        
+        valid = response is not None and verdict['valid']
+        ttl = self.validation_ttl if valid else self.negative_validation_ttl
+        self.validation_cache.set(image_url, valid, ttl)
+        if not valid:
+            return None
+        if not response.content:
+            return {}
+        return await self._features_from_response(image_url, response)
+
+    def extract_colors(self, image_url):
+        """Доминирующие цвета изображения по его пикселям"""
+        return fetch_engine.run(self.extract_features_async(image_url)).get('colors', {})
+
+    async def extract_features_async(self, image_url):
+        """Загрузка изображения в пределах бюджета байт и расчет признаков по пикселям вне цикла событий"""
+        if Image is None or np is None:
+            return {}
+        
+        try:
+            response = await fetch_engine.fetch_async(
+                image_url, timeout=10, max_bytes=self.color_max_bytes,
+                accept=lambda status, headers: status == 200 and self._decodable(headers)
+            )
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось загрузить изображение {image_url}: {e}")
+            return {}
+        return await self._features_from_response(image_url, response)
+
+    async def _features_from_response(self, image_url, response):
+        # Обрезанное тело не декодируется: цвета по части кадра были бы смещены
+        if response.status_code != 200 or response.truncated or not response.content:
+            return {}
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                None, self._pixel_features, response.content
+            )
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось декодировать изображение {image_url}: {e}")
+            return {}
+
+    def _decodable(self, headers):
+        """Стоит ли читать тело: пиксели декодируются, только если есть Pillow и размер в бюджете байт"""
+        if Image is None or np is None:
+            return False
+        size = headers.get('Content-Length')
+        return size is None or not size.isdigit() or int(size) <= self.color_max_bytes
+
+    def _pixel_features(self, data):
+        """Гистограмма цветов и перцептивный хэш по одной уменьшенной копии изображения"""
+        # Image.open читает только заголовок: размер проверяется до декодирования пикселей
+        image = Image.open(io.BytesIO(data))
+        width, height = image.size
+        if width * height > self.color_max_pixels:
+            return {}
+        
+        # Для JPEG thumbnail включает draft: декодер сразу выдает кадр в масштабе 1/2-1/8
+        size = self.color_thumbnail_size
+        image.thumbnail((size, size), Image.BILINEAR, reducing_gap=2.0)
+        if image.mode != 'RGB':
+            image = image.convert('RGBA').convert('RGB') if 'transparency' in image.info else image.convert('RGB')
+        
+        return {
+            'colors': self._histogram_colors(np.asarray(image, dtype=np.uint8).reshape(-1, 3)),
+            'phash': self._difference_hash(image)
+        }
+
+    @staticmethod
+    def _difference_hash(image):
+        """dHash: 64 бита - сравнение яркости соседних пикселей в копии 9x8"""
+        pixels = np.asarray(image.convert('L').resize((9, 8), Image.BILINEAR), dtype=np.int16)
+        bits = np.packbits(pixels[:, 1:] > pixels[:, :-1])
+        return '%016x' % int.from_bytes(bits.tobytes(), 'big')
+
+    def _histogram_colors(self, pixels):
+        """Доли опорных цветов по массиву пикселей (N, 3): квантование 8x8x8 и подсчет через bincount"""
+        if not len(pixels):
+            return {}
+        
+        quantized = (pixels >> 5).astype(np.intp)
+        bins = (quantized[:, 0] << 6) | (quantized[:, 1] << 3) | quantized[:, 2]
+        counts = np.bincount(self.color_bins[bins], minlength=len(self.color_palette))
+        shares = counts / counts.sum()
+        
+        names = list(self.color_palette)
+        return {
+            names[index]: round(float(shares[index]), 3)
+            for index in np.argsort(shares)[::-1][:3]
+            if shares[index] >= self.color_min_share
+        }
+
+    def _build_color_bins(self):
+        """Таблица: ячейка квантования RGB (512 штук) -> ближайший опорный цвет"""
+        if np is None:
+            return None
+        
+        levels = np.arange(8) * 32 + 16
+        centers = np.stack(np.meshgrid(levels, levels, levels, indexing='ij'), axis=-1).reshape(-1, 3)
+        palette = np.array(list(self.color_palette.values()))
+        # Взвешенное евклидово расстояние: глаз чувствительнее всего к зеленому
+        distances = (((centers[:, None, :] - palette[None, :, :]) ** 2) * (2, 4, 3)).sum(axis=-1)
+        return distances.argmin(axis=1)
+
+    def validate_image(self, image_url):
+        """Проверка, что URL указывает на доступное изображение допустимого размера"""
+        return fetch_engine.run(self.validate_image_async(image_url))
+
+    async def validate_image_async(self, image_url):
+        """Асинхронная проверка изображения; результат кэшируется по URL"""
+        cached = self.validation_cache.get(image_url)
+        if cached is not None:
+            return cached
+        
+        # Заголовки ответа GET без чтения тела
+        verdict = {'valid': False}
+        
+        def accept(status, headers):
+            verdict['valid'] = self._valid_image_response(status, headers)
+            return False
+        
+        try:
+            await fetch_engine.fetch_async(image_url, timeout=10, accept=accept)
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось проверить изображение {image_url}: {e}")
+            verdict['valid'] = False
+        
+        valid = verdict['valid']
+        ttl = self.validation_ttl if valid else self.negative_validation_ttl
+        self.validation_cache.set(image_url, valid, ttl)
+        return valid
+
+    def _valid_image_response(self, status, headers):
+        """Проверка типа и размера изображения по заголовкам ответа"""
+        if status != 200 or not headers.get('Content-Type', '').lower().startswith('image/'):
+            return False
+        
+        try:
+            size = int(headers.get('Content-Length'))
+        except (TypeError, ValueError):
+            # Размер неизвестен (например, chunked-ответ) - проверяем только тип
+            return True
+        
+        return self.image_min_bytes <= size <= self.image_max_bytes
+
+    def _simplified_analysis(self, image_url):
+        """Упрощенный анализ изображения на основе URL и имени файла"""
+        return self._analyze_url(image_url)[0]
+
+    def _analyze_colors_from_url(self, image_url):
+        """Упрощенный анализ цветов на основе URL"""
+        return self._analyze_url(image_url)[1]
+
+    def _analyze_url(self, image_url):
+        """Поиск объектов, сцен, ключевых слов и цветов за один проход автомата по пути URL"""
+        path = self._url_path(image_url)
+        return self._collect_hits(path, self.keyword_matcher.find(path))
+
+    @staticmethod
+    def _url_path(image_url):
+        """Путь URL в нижнем регистре - текст, по которому идет анализ"""
+        try:
+            return urlparse(image_url).path.lower()
+        except Exception:
+            return ''
+
+    def _collect_hits(self, path, hits):
+        """Сборка результата анализа из совпадений автомата в одном пути"""
+        analysis = {}
+        color_analysis = {}
+        
+        # Имя файла - хвост пути после последнего '/'
+        filename_start = path.rfind('/') + 1
+        
+        objects, scenes, keywords = [], [], []
+        for start, (kind, order, label) in hits:
+            if kind == 'object':
+                # Объекты ищутся только в имени файла
+                if start >= filename_start:
+                    objects.append((order, label))
+            elif kind == 'scene':
+                scenes.append((order, label))
+            elif kind == 'keyword':
+                keywords.append((order, label))
+            else:
+                color_analysis[label] = 0.6
+        
+        # Порядок применения как у исходного анализа: ключевые слова важнее сцен, сцены - объектов
+        for _, label in sorted(objects):
+            analysis[label] = 0.7  # Высокая уверенность для совпадений в имени
+        for _, label in sorted(scenes):
+            analysis[label] = 0.6
+        for _, label in sorted(keywords):
+            analysis[label] = 0.8
+        
+        return analysis, color_analysis
+
+    def _build_keyword_matcher(self):
+        """Сборка единого автомата по всем словарям анализатора"""
+        matcher = KeywordMatcher()
+        
+        for order, (eng, rus) in enumerate(self.object_translations.items()):
+            matcher.add(eng, ('object', order, rus))
+            matcher.add(rus, ('object', order, rus))
+        for order, scene in enumerate(self.scene_categories):
+            matcher.add(scene, ('scene', order, scene))
+        for order, (keyword, category) in enumerate(self.keywords_mapping.items()):
+            matcher.add(keyword, ('keyword', order, category))
+        for order, (eng, rus) in enumerate(self.color_keywords.items()):
+            matcher.add(eng, ('color', order, rus))
+            matcher.add(rus, ('color', order, rus))
+        
+        matcher.build()
+        return matcher
+
     def translate_object_name(self, english_name):
         """Перевод названий объектов"""
         return self.object_translations.get(english_name, english_name)
@@ -710,110 +2496,852 @@ class ImageAnalyzer:
 # Инициализация анализатора
 image_analyzer = ImageAnalyzer()
 
+class SynonymGraph:
+    """Двунаправленный граф синонимов и переводов между терминами анализатора"""
+
+    # Вес ребра по источнику: перевод почти равноценен исходному слову, тематическая связь - слабее
+    TRANSLATION_WEIGHT = 0.9
+    SYNONYM_WEIGHT = 0.8
+    KEYWORD_WEIGHT = 0.7
+
+    def __init__(self, analyzer, max_hops=2, min_weight=0.5):
+        self.analyzer = analyzer
+        self.max_hops = max_hops
+        self.min_weight = min_weight
+        self.edges = defaultdict(dict)  # термин -> {связанный термин: вес}
+
+    def _term(self, text):
+        """Единственный термин фразы; фразы из нескольких слов в граф не попадают"""
+        terms = self.analyzer.analyze(text)
+        return terms[0] if len(terms) == 1 else None
+
+    def link(self, first, second, weight):
+        """Связь двух слов в обе стороны (сохраняется наибольший вес)"""
+        a, b = self._term(first), self._term(second)
+        if not a or not b or a == b:
+            return
+        for source, target in ((a, b), (b, a)):
+            if weight > self.edges[source].get(target, 0):
+                self.edges[source][target] = weight
+
+    def add_translations(self, translations):
+        for english, russian in translations.items():
+            self.link(english, russian, self.TRANSLATION_WEIGHT)
+
+    def add_synonyms(self, groups):
+        for word, synonyms in groups.items():
+            for synonym in synonyms:
+                self.link(word, synonym, self.SYNONYM_WEIGHT)
+
+    def add_keywords(self, mapping):
+        for keyword, category in mapping.items():
+            self.link(keyword, category, self.KEYWORD_WEIGHT)
+
+    def load(self, path):
+        """Дополнительные синонимы и переводы из JSON-файла"""
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        self.add_synonyms(data.get('synonyms', {}))
+        self.add_translations(data.get('translations', {}))
+
+    def expand(self, terms):
+        """Термины запроса с весами: исходные - 1, связанные - произведение весов ребер на пути"""
+        expanded = dict.fromkeys(terms, 1.0)
+        frontier = dict(expanded)
+        for _ in range(self.max_hops):
+            reached = {}
+            for term, weight in frontier.items():
+                for neighbour, edge_weight in self.edges.get(term, {}).items():
+                    candidate = weight * edge_weight
+                    if candidate >= self.min_weight and candidate > expanded.get(neighbour, 0):
+                        expanded[neighbour] = reached[neighbour] = candidate
+            frontier = reached
+        return expanded
+
+    def stats(self):
+        return {
+            'terms': len(self.edges),
+            'links': sum(len(targets) for targets in self.edges.values())
+        }
+
+def build_synonym_graph(analyzer, image_analyzer, path):
+    """Граф из словарей анализатора изображений и файла синонимов (строится один раз при запуске)"""
+    graph = SynonymGraph(analyzer)
+    graph.add_translations(image_analyzer.object_translations)
+    graph.add_translations(image_analyzer.color_names)
+    graph.add_translations(image_analyzer.color_keywords)
+    graph.add_keywords(image_analyzer.keywords_mapping)
+    try:
+        graph.load(path)
+    except FileNotFoundError:
+        logger.warning(f"⚠️ Файл синонимов не найден: {path}")
+    except (OSError, ValueError) as e:
+        logger.error(f"❌ Ошибка загрузки синонимов {path}: {e}")
+    return graph
+
+synonym_graph = build_synonym_graph(text_analyzer, image_analyzer, os.environ.get(
+    'ARIOS_SYNONYMS_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'synonyms.json')
+))
+
+class NearDuplicateIndex:
+    """Кластеры почти одинаковых изображений по перцептивному хэшу"""
+
+    def __init__(self, index, max_distance=6, min_detail_bits=8):
+        self.index = index
+        self.max_distance = max_distance
+        # У однотонных и почти пустых изображений хэш вырождается (все биты 0 или 1) - их не кластеризуем
+        self.min_detail_bits = min_detail_bits
+        self._tree = BKTree()
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def _load(self):
+        """Загрузка хэшей канонических изображений из индекса при первом обращении"""
+        for doc_id, phash in self.index.cluster_heads():
+            value = int(phash, 16)
+            if self._has_detail(value):
+                self._tree.add(value, doc_id)
+        self._loaded = True
+
+    def _has_detail(self, value):
+        return self.min_detail_bits <= value.bit_count() <= 64 - self.min_detail_bits
+
+    def assign(self, url, phash):
+        """URL канонического изображения кластера; новый хэш без близких соседей открывает свой кластер"""
+        value = int(phash, 16)
+        if not self._has_detail(value):
+            return url
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            # В дереве - идентификаторы документов; URL читается из индекса только для найденного кластера
+            for _, _, doc_id in self._tree.find(value, self.max_distance):
+                head = self.index.document_url(doc_id)
+                if head:
+                    return head
+            doc_id = self.index.doc_id('images', url)
+            if doc_id is not None:
+                self._tree.add(value, doc_id)
+            return url
+
+    def stats(self):
+        return {
+            'clusters': len(self._tree),
+            'max_distance': self.max_distance,
+            'tree_bytes': self._tree.memory_bytes()
+        }
+
+near_duplicates = NearDuplicateIndex(search_index)
+
+class ImageEnrichmentQueue:
+    """Фоновый анализ изображений при индексировании, вне пути обработки запроса"""
+
+    def __init__(self, analyzer, index, duplicates, concurrency=4, batch_size=256, max_queued=50000):
+        self.analyzer = analyzer
+        self.index = index
+        self.duplicates = duplicates
+        self.duplicates_found = 0
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.max_queued = max_queued
+        self.analyzed = 0
+        self.dropped = 0
+        self._pending = set()
+        self._queue = None
+        self._future = None
+
+    def enqueue(self, image_url):
+        """Постановка изображения в очередь анализа (можно вызывать из любого потока)"""
+        if self._queue is None or image_url in self._pending:
+            return False
+        if len(self._pending) >= self.max_queued:
+            self.dropped += 1
+            return False
+
+        self._pending.add(image_url)
+        fetch_engine.loop.call_soon_threadsafe(self._queue.put_nowait, image_url)
+        return True
+
+    def backfill(self):
+        """Добавление в очередь изображений, оставшихся без анализа (например, после перезапуска).
+        
+        Каждое изображение берет один воркер (захват в индексе); захват своей очереди продлевается,
+        чтобы долго ждущие изображения не достались другим воркерам.
+        """
+        if self._pending:
+            self.index.renew_enrichment_claims(self._pending.copy())
+        free = self.max_queued - len(self._pending)
+        for image_url in self.index.claim_enrichment(limit=max(0, min(free, 1000))):
+            self.enqueue(image_url)
+
+    def start(self):
+        if self._future is not None:
+            return False
+
+        self._future = asyncio.run_coroutine_threadsafe(self._run(), fetch_engine.loop)
+        logger.info(f"🧠 Image enrichment started: {self.concurrency} workers, batches of {self.batch_size}")
+        return True
+
+    async def _run(self):
+        self._queue = asyncio.Queue()
+        await asyncio.get_running_loop().run_in_executor(None, self.backfill)
+        await asyncio.gather(*(self._worker() for _ in range(self.concurrency)))
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            # Пачка из всего, что уже накопилось в очереди, но не больше batch_size
+            batch = [await self._queue.get()]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                analyses = await self.analyzer.analyze_batch_with_features_async(batch)
+                items = await loop.run_in_executor(None, self._cluster_batch, batch, analyses)
+                await loop.run_in_executor(None, self.index.set_vision_analyses, items)
+                self.analyzed += len(batch)
+            except Exception as e:
+                logger.error(f"❌ Ошибка обогащения пачки из {len(batch)} изображений: {e}")
+            finally:
+                self._pending.difference_update(batch)
+
+    def _cluster_batch(self, batch, analyses):
+        """Элементы для set_vision_analyses; почти-дубликаты сохраняются без анализа и привязываются к кластеру"""
+        items = []
+        # Повторный анализ уже привязанной копии не должен считать ее дубликатом еще раз
+        previous = self.index.image_clusters(batch)
+        for url, (analysis, features) in zip(batch, analyses):
+            fields = {'colors': features.get('colors', {})}
+            if features.get('phash'):
+                fields['phash'] = features['phash']
+                fields['cluster'] = self.duplicates.assign(url, features['phash'])
+                if fields['cluster'] != url:
+                    if previous.get(url) != fields['cluster']:
+                        self.duplicates_found += 1
+                    analysis, fields['colors'] = {}, {}
+            items.append((url, analysis, fields))
+        return items
+
+    def stats(self):
+        return {
+            'queued': len(self._pending),
+            'analyzed': self.analyzed,
+            'dropped': self.dropped,
+            'duplicates': self.duplicates_found,
+            **self.duplicates.stats()
+        }
+
+image_enrichment = ImageEnrichmentQueue(
+    image_analyzer, search_index, near_duplicates,
+    concurrency=int(os.environ.get('ARIOS_ENRICHMENT_CONCURRENCY', 4)),
+    batch_size=int(os.environ.get('ARIOS_ENRICHMENT_BATCH', 256))
+)
+
+class HtmlParser:
+    """Разбор HTML: парсер на C (lxml), если установлен, и обрезка разметки после нужного числа тегов"""
+
+    # Открывающие теги, которые извлекает краулер; у ссылок учитываются только теги с href
+    TAG_PATTERNS = {
+        'img': rb'<img[\s/>]',
+        'a': rb'<a\s[^>]*?\bhref\s*=',
+        'video': rb'<video[\s/>]',
+        'iframe': rb'<iframe[\s/>]'
+    }
+
+    def __init__(self, backend=None, slack=1.5, tail_bytes=4096):
+        self.backend = backend or ('lxml' if lxml is not None else 'html.parser')
+        # Запас на теги в комментариях и скриптах, которые парсер не увидит
+        self.slack = slack
+        # Разметка после последнего нужного тега: подписи, абзацы и соседние элементы для контекста
+        self.tail_bytes = tail_bytes
+        self._scanner = re.compile(
+            b'|'.join(b'(?P<%s>%s)' % (tag.encode(), pattern) for tag, pattern in self.TAG_PATTERNS.items()),
+            re.IGNORECASE
+        )
+
+    def parse(self, content, encoding=None, limits=None):
+        """Дерево BeautifulSoup; при limits ({тег: сколько нужно}) разбирается только начало документа"""
+        if limits:
+            content = self.truncate(content, limits)
+        return BeautifulSoup(content, self.backend, from_encoding=encoding)
+
+    def truncate(self, content, limits):
+        """Обрезка байтов разметки после последнего нужного тега.
+        
+        Для каждого тега из limits нужный - limit-й (с запасом slack) или последний на странице,
+        если столько не набралось; разметка после самого дальнего из них не разбирается.
+        """
+        remaining = {tag: int(limit * self.slack) + 1 for tag, limit in limits.items()}
+        needed_end = {}
+        for match in self._scanner.finditer(content):
+            tag = match.lastgroup
+            if not remaining.get(tag):
+                continue
+            remaining[tag] -= 1
+            needed_end[tag] = match.end()
+            if not any(remaining.values()):
+                break
+        if not needed_end:
+            return content
+        cut = max(needed_end.values()) + self.tail_bytes
+        if cut >= len(content):
+            return content
+        # Разрез не должен попасть внутрь символа UTF-8 (кириллица - два байта): иначе BeautifulSoup
+        # отвергнет объявленную кодировку и прочитает страницу как windows-1252.
+        # Продолжающие байты 10xxxxxx отступаются назад до начала символа
+        for _ in range(3):
+            if content[cut] & 0xC0 != 0x80:
+                break
+            cut -= 1
+        return content[:cut]
+
+html_parser = HtmlParser(os.environ.get('ARIOS_HTML_PARSER'))
+
+class PageContext:
+    """Контекст элементов страницы: позиции тегов в порядке документа и тексты, собранные один раз"""
+
+    ANCHOR_TAGS = ('h1', 'h2', 'h3', 'p', 'figcaption')
+
+    def __init__(self, soup):
+        self._order = {id(soup): -1}
+        self._anchors = {'heading': ([], []), 'p': ([], []), 'figcaption': ([], [])}
+        self._texts = {}
+
+        # Один обход дерева: номер каждого тега и списки опорных тегов, уже отсортированные по позиции
+        position = 0
+        for element in soup.descendants:
+            if not isinstance(element, Tag):
+                continue
+            self._order[id(element)] = position
+            if element.name in self.ANCHOR_TAGS:
+                kind = 'heading' if element.name[0] == 'h' else element.name
+                positions, elements = self._anchors[kind]
+                positions.append(position)
+                elements.append(element)
+            position += 1
+
+    @classmethod
+    def for_element(cls, element):
+        """Контекст документа, которому принадлежит элемент"""
+        root = element
+        for root in element.parents:
+            pass
+        return cls(root)
+
+    def before(self, kind, element):
+        """Ближайший опорный тег, открытый раньше элемента (как find_previous)"""
+        positions, elements = self._anchors[kind]
+        index = bisect.bisect_left(positions, self._order[id(element)]) - 1
+        return elements[index] if index >= 0 else None
+
+    def after(self, kind, element):
+        """Ближайший опорный тег после открытия элемента (как find_next)"""
+        positions, elements = self._anchors[kind]
+        index = bisect.bisect_right(positions, self._order[id(element)])
+        return elements[index] if index < len(elements) else None
+
+    def text(self, element, limit, skip=()):
+        """get_text(strip=True) без поддеревьев тегов из skip, не длиннее limit; результат кэшируется"""
+        key = (id(element), limit, skip)
+        cached = self._texts.get(key)
+        if cached is not None:
+            return cached
+
+        types = element.interesting_string_types
+        if isinstance(types, type):
+            types = (types,)
+
+        pieces = []
+        length = 0
+        stack = list(reversed(element.contents))
+        while stack and length < limit:
+            node = stack.pop()
+            if isinstance(node, Tag):
+                if node.name not in skip:
+                    stack.extend(reversed(node.contents))
+            elif type(node) in types:
+                piece = node.strip()
+                if piece:
+                    pieces.append(piece)
+                    length += len(piece)
+
+        text = ''.join(pieces)[:limit]
+        self._texts[key] = text
+        return text
+
+# Параметры запроса, которые не меняют содержимое страницы
+TRACKING_PARAMS = {'gclid', 'fbclid', 'yclid', 'msclkid', 'igshid', 'mc_cid', 'mc_eid', '_openstat', 'ref_src'}
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+def normalize_url(url):
+    """Канонический вид URL для учета посещений: регистр схемы и хоста, порт по умолчанию, без фрагмента и меток"""
+    try:
+        parts = urlsplit(url.strip())
+        port = parts.port
+    except ValueError:
+        return url
+
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if ':' in host:
+        host = f'[{host}]'  # IPv6
+    netloc = host if port is None or DEFAULT_PORTS.get(scheme) == port else f'{host}:{port}'
+
+    query = urlencode(sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not key.lower().startswith('utm_') and key.lower() not in TRACKING_PARAMS
+    ))
+    return urlunsplit((scheme, netloc, parts.path or '/', query, ''))
+
+class MemoryVisitedStore:
+    """Посещенные URL в памяти процесса: LRU с ограничением размера и сроком до повторного обхода"""
+
+    def __init__(self, ttl=24 * 3600, maxsize=1000000):
+        self.ttl = ttl
+        self._cache = TTLCache(maxsize=maxsize)
+        self._lock = threading.Lock()
+
+    def __contains__(self, url):
+        return self._cache.get(normalize_url(url)) is not None
+
+    def add(self, url):
+        self._cache.set(normalize_url(url), True, self.ttl)
+
+    def check_and_add(self, url):
+        """Отметка посещения; False, если URL уже посещался в пределах ttl"""
+        key = normalize_url(url)
+        with self._lock:
+            if self._cache.get(key) is not None:
+                return False
+            self._cache.set(key, True, self.ttl)
+            return True
+
+    def check_and_add_many(self, urls):
+        """Отметка посещения пачки URL: [True, если URL новый] в порядке urls"""
+        keys = [normalize_url(url) for url in urls]
+        fresh = []
+        with self._lock:
+            for key in keys:
+                is_new = self._cache.get(key) is None
+                if is_new:
+                    self._cache.set(key, True, self.ttl)
+                fresh.append(is_new)
+        return fresh
+
+    def prune(self):
+        pass
+
+    def stats(self):
+        return {'backend': 'memory', 'urls': len(self._cache), 'ttl': self.ttl}
+
+class BloomVisitedStore:
+    """Посещенные URL в паре фильтров Блума фиксированного размера.
+
+    Фильтры сменяются каждые ttl / 2 (или при заполнении), поэтому URL считается посещенным
+    от ttl / 2 до ttl. Ложные срабатывания (error_rate) означают пропуск части новых URL.
+    """
+
+    def __init__(self, ttl=24 * 3600, capacity=1000000, error_rate=0.01):
+        self.ttl = ttl
+        self.capacity = capacity
+        self.size_bits = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size_bits / capacity * math.log(2)))
+        self._filters = [bytearray((self.size_bits + 7) // 8), bytearray((self.size_bits + 7) // 8)]
+        self._added = 0
+        self._rotated_at = time.time()
+        self._lock = threading.Lock()
+
+    def _positions(self, url):
+        # Двойное хэширование: k позиций из двух 64-битных половин одного дайджеста
+        digest = hashlib.blake2b(normalize_url(url).encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size_bits for i in range(self.hash_count)]
+
+    def _rotate(self):
+        now = time.time()
+        if now - self._rotated_at >= self.ttl:
+            # Оба фильтра устарели (долго не было обращений)
+            self._filters = [bytearray(len(self._filters[0])), bytearray(len(self._filters[0]))]
+        elif now - self._rotated_at >= self.ttl / 2 or self._added >= self.capacity:
+            self._filters = [bytearray(len(self._filters[0])), self._filters[0]]
+        else:
+            return
+        self._added = 0
+        self._rotated_at = now
+
+    def _contains(self, positions):
+        return any(
+            all(bits[p >> 3] & (1 << (p & 7)) for p in positions)
+            for bits in self._filters
+        )
+
+    def __contains__(self, url):
+        positions = self._positions(url)
+        with self._lock:
+            self._rotate()
+            return self._contains(positions)
+
+    def add(self, url):
+        positions = self._positions(url)
+        with self._lock:
+            self._rotate()
+            self._set(positions)
+
+    def _set(self, positions):
+        bits = self._filters[0]
+        for p in positions:
+            bits[p >> 3] |= 1 << (p & 7)
+        self._added += 1
+
+    def check_and_add(self, url):
+        """Отметка посещения; False, если URL (вероятно) уже посещался"""
+        positions = self._positions(url)
+        with self._lock:
+            self._rotate()
+            if self._contains(positions):
+                return False
+            self._set(positions)
+            return True
+
+    def check_and_add_many(self, urls):
+        """Отметка посещения пачки URL: [True, если URL (вероятно) новый] в порядке urls"""
+        batch = [self._positions(url) for url in urls]
+        fresh = []
+        with self._lock:
+            self._rotate()
+            for positions in batch:
+                is_new = not self._contains(positions)
+                if is_new:
+                    self._set(positions)
+                fresh.append(is_new)
+        return fresh
+
+    def prune(self):
+        with self._lock:
+            self._rotate()
+
+    def stats(self):
+        return {
+            'backend': 'bloom',
+            'urls': self._added,
+            'capacity': self.capacity,
+            'bytes': 2 * len(self._filters[0]),
+            'ttl': self.ttl
+        }
+
+class SqliteVisitedStore:
+    """Посещенные URL в файле SQLite, общем для всех воркеров на узле"""
+
+    def __init__(self, path, ttl=24 * 3600):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS visited ('
+                '  url_hash BLOB PRIMARY KEY,'
+                '  visited_at REAL NOT NULL'
+                ') WITHOUT ROWID'
+            )
+
+    def _connection(self):
+        """Отдельное соединение на каждый поток"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _key(url):
+        return hashlib.md5(normalize_url(url).encode()).digest()
+
+    def __contains__(self, url):
+        row = self._connection().execute(
+            'SELECT visited_at FROM visited WHERE url_hash = ?', (self._key(url),)
+        ).fetchone()
+        return row is not None and row[0] > time.time() - self.ttl
+
+    def add(self, url):
+        with self._connection() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO visited (url_hash, visited_at) VALUES (?, ?)',
+                (self._key(url), time.time())
+            )
+
+    def check_and_add(self, url):
+        """Атомарная отметка посещения (между процессами); False, если URL посещался в пределах ttl"""
+        now = time.time()
+        with self._connection() as conn:
+            cursor = conn.execute(
+                'INSERT INTO visited (url_hash, visited_at) VALUES (?, ?) '
+                'ON CONFLICT (url_hash) DO UPDATE SET visited_at = excluded.visited_at '
+                'WHERE visited.visited_at <= ?',
+                (self._key(url), now, now - self.ttl)
+            )
+            return cursor.rowcount > 0
+
+    def check_and_add_many(self, urls):
+        """Отметка посещения пачки URL одной транзакцией: [True, если URL новый] в порядке urls"""
+        now = time.time()
+        with self._connection() as conn:
+            return [
+                conn.execute(
+                    'INSERT INTO visited (url_hash, visited_at) VALUES (?, ?) '
+                    'ON CONFLICT (url_hash) DO UPDATE SET visited_at = excluded.visited_at '
+                    'WHERE visited.visited_at <= ?',
+                    (self._key(url), now, now - self.ttl)
+                ).rowcount > 0
+                for url in urls
+            ]
+
+    def prune(self):
+        """Удаление записей с истекшим сроком"""
+        with self._connection() as conn:
+            conn.execute('DELETE FROM visited WHERE visited_at <= ?', (time.time() - self.ttl,))
+
+    def stats(self):
+        count = self._connection().execute('SELECT COUNT(*) FROM visited').fetchone()[0]
+        return {'backend': 'sqlite', 'urls': count, 'ttl': self.ttl}
+
+def create_visited_store(backend, ttl):
+    """Хранилище посещенных URL по имени: memory, bloom или sqlite"""
+    if backend == 'bloom':
+        return BloomVisitedStore(ttl, capacity=int(os.environ.get('ARIOS_VISITED_CAPACITY', 1000000)))
+    if backend == 'sqlite':
+        return SqliteVisitedStore(os.environ.get(
+            'ARIOS_VISITED_PATH',
+            os.path.join(os.path.dirname(os.path.abspath(__file__)), 'arios_visited.db')
+        ), ttl)
+    return MemoryVisitedStore(ttl, maxsize=int(os.environ.get('ARIOS_VISITED_CAPACITY', 1000000)))
+
+# Общий учет посещенных URL для краулера и очереди сканирования
+visited_store = create_visited_store(
+    os.environ.get('ARIOS_VISITED_BACKEND', 'memory'),
+    ttl=float(os.environ.get('ARIOS_REVISIT_TTL', 24 * 3600))
+)
+
 class WebCrawler:
     """Веб-краулер для сканирования страниц и поиска изображений, сайтов и видео"""
     
+    # Сколько первых тегов каждого вида просматривают извлекатели
+    TAG_LIMITS = {
+        'images': {'img': 30},
+        'websites': {'a': 20},
+        'videos': {'video': 10, 'iframe': 10}
+    }
+    LINK_LIMIT = 100
+    
     def __init__(self):
         self.user_agents = [
             'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
             'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
             'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
         ]
-        self.visited_urls = set()
+        self.visited_urls = visited_store
         self.image_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.svg'}
         
     def get_random_user_agent(self):
         return random.choice(self.user_agents)
     
     def crawl_page(self, url, query_words, search_type='images'):
-        """Сканирование страницы и извлечение контента"""
-        if url in self.visited_urls:
-            return []
-            
-        self.visited_urls.add(url)
+        """Сканирование страницы и извлечение контента (search_type='all' - запись страницы целиком)"""
+        return fetch_engine.run(self.crawl_page_async(url, query_words, search_type))
+
+    async def crawl_page_async(self, url, query_words, search_type='images'):
+        """Асинхронное сканирование страницы через общий движок загрузки"""
+        empty = self._empty_page(url) if search_type == 'all' else []
+        # Хранилище посещенных может быть на диске (sqlite): проверка вне цикла событий
+        if not await asyncio.get_running_loop().run_in_executor(None, self.visited_urls.check_and_add, url):
+            return empty
         
         try:
-            headers = {'User-Agent': self.get_random_user_agent()}
-            response = requests.get(url, headers=headers, timeout=8)
-            
-            if response.status_code != 200:
-                return []
+            result = await self._crawl_async(url, query_words, search_type)
+            return empty if result is None else result
             
-            app_status['processed_pages'] += 1
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            if search_type == 'images':
-                return self._extract_images(soup, url, query_words)
-            elif search_type == 'websites':
-                return self._extract_websites(soup, url, query_words)
-            elif search_type == 'videos':
-                return self._extract_videos(soup, url, query_words)
-            else:
-                return []
+        except Exception as e:
+            logger.error(f"❌ Ошибка сканирования {url}: {e}")
+            return empty
+
+    def crawl_for_index(self, url):
+        """Сканирование страницы для фонового индексирования: все типы контента и исходящие ссылки"""
+        return fetch_engine.run(self.crawl_for_index_async(url))
+
+    async def crawl_for_index_async(self, url):
+        """Асинхронное сканирование страницы для фонового индексирования (повторы отсекает очередь)"""
+        try:
+            page = await self._crawl_async(url, [], 'all')
+            return page['links'] if page else []
             
         except Exception as e:
             logger.error(f"❌ Ошибка сканирования {url}: {e}")
             return []
 
-    def _extract_images(self, soup, page_url, query_words):
-        """Извлечение изображений со страницы"""
-        images_data = []
-        img_tags = soup.find_all('img')
+    async def _crawl_async(self, url, query_words, search_type):
+        """Условная загрузка и обработка страницы; None, если страница недоступна"""
+        loop = asyncio.get_running_loop()
+        state = await loop.run_in_executor(None, search_index.page_state, url)
         
-        for img in img_tags[:30]:  # Ограничиваем для производительности
-            try:
-                image_info = self._extract_image_data(img, page_url, query_words)
-                if image_info:
-                    images_data.append(image_info)
-            except Exception as e:
-                continue
+        response = await self._fetch_async(url, state)
+        if response is None:
+            return None
         
-        return images_data
+        content_hash = None
+        if response.status_code == 200:
+            content_hash = hashlib.blake2b(response.content, digest_size=16).hexdigest()
+        
+        if response.status_code == 304 or (state and state['content_hash'] == content_hash):
+            # Страница не изменилась: ни разбора, ни записи в индекс, ссылки - из прошлого обхода
+            validators = None
+            if response.status_code == 200:
+                # Сервер ответил целиком, но содержимое то же: запоминаем новые ETag и Last-Modified
+                validators = (response.headers.get('ETag'), response.headers.get('Last-Modified'))
+            await loop.run_in_executor(None, search_index.touch_page_state, url, validators)
+            app_status['unchanged_pages'] += 1
+            if search_type != 'all':
+                return []
+            page = self._empty_page(url)
+            page['links'] = state['links']
+            return page
+        
+        # Разбор и извлечение нагружают CPU, поэтому выполняются вне цикла событий
+        return await loop.run_in_executor(
+            None, self._process_page, response, url, query_words, search_type, content_hash
+        )
 
-    def _extract_websites(self, soup, page_url, query_words):
-        """Извлечение веб-сайтов со страницы"""
-        websites_data = []
+    async def _fetch_async(self, url, state=None):
+        """Загрузка страницы (условная, если известно ее прошлое состояние); None, если страница недоступна"""
+        headers = {'User-Agent': self.get_random_user_agent()}
+        if state:
+            if state['etag']:
+                headers['If-None-Match'] = state['etag']
+            if state['last_modified']:
+                headers['If-Modified-Since'] = state['last_modified']
+        response = await fetch_engine.fetch_async(url, headers=headers, timeout=8)
+        
+        if response.status_code != 200 and not (response.status_code == 304 and state):
+            return None
         
-        # Поиск ссылок на страницы
-        links = soup.find_all('a', href=True)
+        app_status['processed_pages'] += 1
+        return response
+
+    def _parse(self, response, limits=None):
+        """Разбор HTML страницы (только до последнего нужного тега, если заданы limits)"""
+        return html_parser.parse(response.content, response.encoding, limits)
+
+    def _process_page(self, response, url, query_words, search_type, content_hash=None):
+        """Извлечение контента за один разбор и сохранение его в индекс"""
+        if search_type == 'all':
+            types = tuple(self.TAG_LIMITS)
+        elif search_type in self.TAG_LIMITS:
+            types = (search_type,)
+        else:
+            return []
         
-        for link in links[:20]:  # Ограничиваем количество
-            try:
-                website_info = self._extract_website_data(link, page_url, query_words)
-                if website_info:
-                    websites_data.append(website_info)
-            except Exception as e:
-                continue
+        limits = {tag: limit for content_type in types for tag, limit in self.TAG_LIMITS[content_type].items()}
+        if search_type == 'all':
+            limits['a'] = max(limits.get('a', 0), self.LINK_LIMIT)
+        soup = self._parse(response, limits)
         
-        return websites_data
+        page = self._extract_page(soup, url, query_words, types, with_links=search_type == 'all')
+        
+        # Сохранение извлеченного контента в индекс
+        self._index_page(page)
+        
+        if search_type != 'all':
+            return page[search_type]
+        
+        # Состояние сохраняется только для полной записи страницы: по нему следующий обход может пропустить ее целиком
+        if content_hash:
+            search_index.set_page_state(
+                url, response.headers.get('ETag'), response.headers.get('Last-Modified'), content_hash, page['links']
+            )
+        return page
+
+    def _empty_page(self, url):
+        return {'url': url, 'images': [], 'websites': [], 'videos': [], 'links': []}
 
-    def _extract_videos(self, soup, page_url, query_words):
-        """Извлечение видео со страницы"""
-        videos_data = []
+    def _index_page(self, page):
+        """Сохранение записи страницы в индекс одной транзакцией"""
+        if not (page['images'] or page['websites'] or page['videos']):
+            return
+        pending = search_index.add_page(page)
+        if page['images']:
+            app_status['indexed_images'] = search_index.count('images')
+        # Анализ компьютерным зрением выполняется в фоне, а не во время запроса; уже
+        # проанализированные при прошлом обходе изображения индекс сохранил и в очередь не попадают
+        for url in pending:
+            image_enrichment.enqueue(url)
+
+    def _extract_page(self, soup, page_url, query_words, types, with_links=False):
+        """Извлечение изображений, ссылок и видео за один обход дерева"""
+        limits = {tag: limit for content_type in types for tag, limit in self.TAG_LIMITS[content_type].items()}
+        # Позиции и тексты опорных тегов считаются один раз на страницу
+        page_context = PageContext(soup)
+        extractors = {
+            'img': functools.partial(self._extract_image_data, page_context=page_context),
+            'a': functools.partial(self._extract_website_data, page_context=page_context),
+            'video': self._extract_video_data,
+            'iframe': self._extract_iframe_video_data
+        }
+        found = {tag: [] for tag in extractors}
+        seen = defaultdict(int)
+        links = []
+        seen_links = set()
         
-        # Поиск видео тегов
-        video_tags = soup.find_all('video')
-        for video in video_tags[:10]:
-            try:
-                video_info = self._extract_video_data(video, page_url, query_words)
-                if video_info:
-                    videos_data.append(video_info)
-            except Exception as e:
-                continue
+        def done():
+            return (all(seen[tag] >= limit for tag, limit in limits.items())
+                    and (not with_links or len(links) >= self.LINK_LIMIT))
         
-        # Поиск iframe с видео (YouTube, Vimeo и т.д.)
-        iframe_tags = soup.find_all('iframe')
-        for iframe in iframe_tags[:10]:
-            try:
-                video_info = self._extract_iframe_video_data(iframe, page_url, query_words)
-                if video_info:
-                    videos_data.append(video_info)
-            except Exception as e:
+        # Обход в порядке документа прекращается, как только все лимиты исчерпаны
+        for element in soup.descendants:
+            if not isinstance(element, Tag) or element.name not in extractors:
                 continue
+            tag = element.name
+            if tag == 'a':
+                if not element.has_attr('href'):
+                    continue
+                if with_links and len(links) < self.LINK_LIMIT:
+                    link = self._absolute_link(element['href'], page_url)
+                    if link and link not in seen_links:
+                        seen_links.add(link)
+                        links.append(link)
+            
+            if seen[tag] < limits.get(tag, 0):
+                seen[tag] += 1
+                try:
+                    result = extractors[tag](element, page_url, query_words)
+                    if result:
+                        found[tag].append(result)
+                except Exception:
+                    # Один испорченный тег не должен срывать разбор всей страницы
+                    logger.debug(f"Пропущен тег {tag} на {page_url}", exc_info=True)
+            elif done():
+                break
+        
+        return {
+            'url': page_url,
+            'images': found['img'],
+            'websites': found['a'],
+            'videos': found['video'] + found['iframe'],
+            'links': links
+        }
+
+    def _absolute_link(self, href, page_url):
+        """Абсолютный URL исходящей ссылки без фрагмента; None для служебных ссылок"""
+        href = href.strip()
+        if not href or href.startswith(('#', 'javascript:', 'mailto:', 'tel:')):
+            return None
         
-        return videos_data
+        absolute_url = urldefrag(urljoin(page_url, href))[0]
+        if not absolute_url.startswith(('http://', 'https://')):
+            return None
+        return absolute_url
 
-    def _extract_image_data(self, img_tag, page_url, query_words):
+    def _extract_image_data(self, img_tag, page_url, query_words, page_context=None):
         """Извлечение метаданных изображения"""
         try:
             # Получение URL изображения
@@ -852,7 +3380,7 @@ class WebCrawler:
             title_text = img_tag.get('title', '')
             
             # Извлечение контекста
-            context = self._get_image_context(img_tag)
+            context = self._get_image_context(img_tag, page_context)
             
             # Анализ имени файла
             filename = self._analyze_filename(img_src)
@@ -881,7 +3409,7 @@ class WebCrawler:
             logger.error(f"❌ Ошибка извлечения данных изображения: {e}")
             return None
 
-    def _extract_website_data(self, link_tag, page_url, query_words):
+    def _extract_website_data(self, link_tag, page_url, query_words, page_context=None):
         """Извлечение данных веб-сайта"""
         try:
             href = link_tag.get('href', '')
@@ -902,12 +3430,12 @@ class WebCrawler:
                 return None
             
             # Извлечение описания
-            description = self._get_link_description(link_tag)
+            description = self._get_link_description(link_tag, page_context)
             
             # Расчет релевантности
             relevance_score = self._calculate_website_relevance(link_text, description, query_words)
             
-            if relevance_score < 1:  # Минимальный порог релевантности
+            if query_words and relevance_score <= 0:  # Минимальный порог релевантности
                 return None
             
             website_data = {
@@ -996,60 +3524,56 @@ class WebCrawler:
             logger.error(f"❌ Ошибка извлечения данных iframe видео: {e}")
             return None
 
-    def _get_image_context(self, img_tag):
+    def _get_image_context(self, img_tag, page_context=None):
         """Извлечение контекста изображения"""
         try:
+            page_context = page_context or PageContext.for_element(img_tag)
             context_parts = []
             
             # Текст из родительского элемента
             parent = img_tag.parent
             if parent:
-                temp_parent = parent.copy()
-                for img in temp_parent.find_all('img'):
-                    img.decompose()
-                parent_text = temp_parent.get_text(strip=True)
+                parent_text = page_context.text(parent, 300, skip=('img',))
                 if parent_text:
                     context_parts.append(parent_text)
             
             # Заголовок страницы
-            title_tag = img_tag.find_parent().find_previous(['h1', 'h2', 'h3'])
+            title_tag = page_context.before('heading', img_tag.find_parent())
             if title_tag:
-                context_parts.append(title_tag.get_text(strip=True))
+                context_parts.append(page_context.text(title_tag, 300))
             
             # Подпись (figcaption)
-            figcaption = img_tag.find_next('figcaption')
+            figcaption = page_context.after('figcaption', img_tag)
             if figcaption:
-                context_parts.append(figcaption.get_text(strip=True))
+                context_parts.append(page_context.text(figcaption, 300))
             
             # Ближайший абзац
-            paragraph = img_tag.find_previous('p') or img_tag.find_next('p')
+            paragraph = page_context.before('p', img_tag) or page_context.after('p', img_tag)
             if paragraph:
-                context_parts.append(paragraph.get_text(strip=True)[:200])
+                context_parts.append(page_context.text(paragraph, 200))
             
             return ' '.join(context_parts)[:300]
             
         except Exception as e:
             return ""
 
-    def _get_link_description(self, link_tag):
+    def _get_link_description(self, link_tag, page_context=None):
         """Извлечение описания ссылки"""
         try:
+            page_context = page_context or PageContext.for_element(link_tag)
             description_parts = []
             
-            # Родительский элемент
+            # Родительский элемент без текста ссылок
             parent = link_tag.parent
             if parent:
-                temp_parent = parent.copy()
-                for a in temp_parent.find_all('a'):
-                    a.decompose()
-                parent_text = temp_parent.get_text(strip=True)
+                parent_text = page_context.text(parent, 150, skip=('a',))
                 if parent_text:
                     description_parts.append(parent_text)
             
             # Следующий элемент после ссылки
             next_sibling = link_tag.find_next_sibling()
             if next_sibling:
-                next_text = next_sibling.get_text(strip=True)
+                next_text = page_context.text(next_sibling, 150)
                 if next_text:
                     description_parts.append(next_text)
             
@@ -1119,49 +3643,120 @@ class WebCrawler:
             return ""
 
     def _calculate_relevance(self, alt, title, filename, context, query_words):
-        """Расчет релевантности на основе метаданных"""
-        score = 0
-        all_text = f"{alt} {title} {filename} {context}".lower()
-        
-        for word in query_words:
-            if len(word) > 2:
-                if word in all_text:
-                    # Разный вес для разных источников
-                    if word in alt.lower():
-                        score += 3  # Высокий вес для alt
-                    if word in title.lower():
-                        score += 2  # Средний вес для title
-                    if word in filename.lower():
-                        score += 2  # Средний вес для имени файла
-                    if word in context.lower():
-                        score += 1  # Низкий вес для контекста
-        
-        return score
+        """Расчет релевантности на основе метаданных (BM25F по статистике индекса)"""
+        return search_index.score_fields(
+            'images', {'alt': alt, 'title': title, 'filename': filename, 'context': context}, query_words
+        )
 
     def _calculate_website_relevance(self, title, description, query_words):
         """Расчет релевантности для веб-сайтов"""
-        score = 0
-        all_text = f"{title} {description}".lower()
-        
-        for word in query_words:
-            if len(word) > 2 and word in all_text:
-                if word in title.lower():
-                    score += 3
-                if word in description.lower():
-                    score += 2
-        
-        return score
+        return search_index.score_fields('websites', {'title': title, 'description': description}, query_words)
 
     def _calculate_video_relevance(self, title, query_words):
         """Расчет релевантности для видео"""
-        score = 0
-        title_lower = title.lower()
-        
-        for word in query_words:
-            if len(word) > 2 and word in title_lower:
-                score += 3
-        
-        return score
+        return search_index.score_fields('videos', {'title': title}, query_words)
+
+class QueryCache:
+    """Кэш результатов поиска: LRU, время жизни, бюджет памяти и объединение одинаковых запросов"""
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, ttl=300, maxsize=10000):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data = OrderedDict()  # ключ -> (значение, поколение индекса, время истечения, размер)
+        self._bytes = 0
+        self._inflight = {}         # ключ -> Future вычисляющего запроса
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def get(self, key, generation):
+        """Значение из кэша или None, если его нет или индекс с тех пор изменился"""
+        with self._lock:
+            item = self._lookup(key, generation)
+            if item is None:
+                self.misses += 1
+                return None
+            return item[0]
+
+    def put(self, key, value, generation):
+        self._store(key, value, generation)
+
+    def get_or_compute(self, key, generation, compute, cacheable=None):
+        """Результат из кэша или вычисленный один раз для всех одновременных одинаковых запросов"""
+        with self._lock:
+            item = self._lookup(key, generation)
+            if item is not None:
+                return item[0]
+
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = concurrent.futures.Future()
+                self._inflight[key] = flight
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            return flight.result()
+
+        try:
+            value = compute()
+            if cacheable is None or cacheable(value):
+                self._store(key, value, generation)
+            flight.set_result(value)
+            return value
+        except Exception as e:
+            flight.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _lookup(self, key, generation):
+        # Вызывается под блокировкой; устаревшая запись сразу удаляется
+        item = self._data.get(key)
+        if item is None:
+            return None
+        if item[1] == generation and item[2] > time.time():
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item
+        self._remove(key)
+        return None
+
+    def _store(self, key, value, generation):
+        # Размер оценивается по JSON-представлению результата
+        size = len(json.dumps(value, ensure_ascii=False, default=str))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._remove(key)
+            self._data[key] = (value, generation, time.time() + self.ttl, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes or len(self._data) > self.maxsize:
+                self._remove(next(iter(self._data)))
+
+    def _remove(self, key):
+        item = self._data.pop(key, None)
+        if item is not None:
+            self._bytes -= item[3]
+
+    def stats(self):
+        return {
+            'entries': len(self._data),
+            'bytes': self._bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced
+        }
+
+query_cache = QueryCache(
+    max_bytes=int(os.environ.get('ARIOS_QUERY_CACHE_BYTES', 64 * 1024 * 1024)),
+    ttl=float(os.environ.get('ARIOS_QUERY_CACHE_TTL', 300))
+)
 
 class SearchEngine:
     """Универсальная поисковая система для изображений, сайтов и видео"""
@@ -1179,68 +3774,166 @@ class SearchEngine:
                 # Убраны все внешние поисковые системы
             ]
         }
+        # Сколько кандидатов из индекса передается в ранжирование. Пул один для всех страниц запроса:
+        # бонусы ранжирования меняют порядок внутри пула, поэтому страницы листаются только в его пределах
+        self.candidate_limit = int(os.environ.get('ARIOS_CANDIDATE_LIMIT', 200))
         
-    def search(self, query, max_results=20, search_types=None):
-        """Основной метод поиска"""
-        logger.info(f"🔍 Начало поиска для: '{query}'")
+        # Общий пул потоков для поиска по типам и срок ответа на запрос (секунды)
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=int(os.environ.get('ARIOS_SEARCH_WORKERS', 8)), thread_name_prefix='search'
+        )
+        self.deadline = float(os.environ.get('ARIOS_SEARCH_DEADLINE', 2.0))
+        atexit.register(self.executor.shutdown, wait=False, cancel_futures=True)
         
+    def search(self, query, max_results=20, search_types=None, page=1):
+        """Основной метод поиска (популярные запросы отдаются из кэша до изменения индекса)"""
         if search_types is None:
             search_types = ['images', 'websites', 'videos']
         
-        query_words = re.findall(r'\w+', query.lower())
+        offset = (max(1, int(page)) - 1) * max_results
+        results = self.search_window(query, {search_type: (offset, max_results) for search_type in search_types})
+        return {search_type: items[:max_results] for search_type, items in results.items()}
+
+    def search_window(self, query, windows):
+        """Срезы ранжированных результатов по типам: windows = {тип: (смещение, количество)}.
+        
+        В каждом списке на один результат больше запрошенного, если дальше есть еще.
+        """
+        query_words = text_analyzer.analyze(query)
         if not query_words:
             return {}
         
+        key = (' '.join(query_words), tuple(sorted(windows.items())))
+        results, _ = query_cache.get_or_compute(
+            key, search_index.generation(),
+            lambda: self._search_uncached(query, synonym_graph.expand(query_words), windows),
+            # Частичный ответ (истек срок или ошибка) не кэшируется
+            cacheable=lambda value: value[1]
+        )
+        return results
+
+    def search_stream(self, query, max_results=20, search_types=None, page=1):
+        """Потоковый поиск: пары (тип, результаты) в порядке готовности типов"""
+        if search_types is None:
+            search_types = ['images', 'websites', 'videos']
+        
+        query_words = text_analyzer.analyze(query)
+        if not query_words:
+            return
+        
+        offset = (max(1, int(page)) - 1) * max_results
+        windows = {search_type: (offset, max_results) for search_type in search_types}
+        key = (' '.join(query_words), tuple(sorted(windows.items())))
+        generation = search_index.generation()
+        
+        cached = query_cache.get(key, generation)
+        if cached is not None:
+            for search_type, items in cached[0].items():
+                yield search_type, items[:max_results]
+            return
+        
+        logger.info(f"🔍 Начало потокового поиска для: '{query}'")
         results = {}
+        complete = True
+        for search_type, items, ok in self._iter_search(query, synonym_graph.expand(query_words), windows):
+            results[search_type] = items
+            complete = complete and ok
+            yield search_type, items[:max_results]
         
-        # Поиск по всем запрошенным типам
-        with concurrent.futures.ThreadPoolExecutor(max_workers=3) as executor:
-            futures = {}
-            
-            for search_type in search_types:
-                if search_type in self.search_urls:
-                    future = executor.submit(
-                        self._search_type, 
-                        query, query_words, search_type, max_results
-                    )
-                    futures[search_type] = future
-            
-            # Сбор результатов
-            for search_type, future in futures.items():
-                try:
-                    results[search_type] = future.result(timeout=15)
-                except Exception as e:
-                    logger.error(f"❌ Ошибка поиска {search_type}: {e}")
-                    results[search_type] = []
+        # Полный ответ попадает в тот же кэш, что и обычный поиск
+        if complete:
+            query_cache.put(key, (results, True), generation)
+
+    def _iter_search(self, query, query_terms, windows):
+        """(тип, результаты, успел ли тип) по мере готовности, не дольше срока запроса"""
+        deadline = time.monotonic() + self.deadline
+        
+        # Поиск по всем запрошенным типам в общем пуле потоков
+        futures = {}
+        for search_type, (offset, count) in windows.items():
+            if search_type in self.search_urls:
+                future = self.executor.submit(
+                    self._search_type,
+                    query, query_terms, search_type, offset, count, deadline
+                )
+                futures[future] = search_type
+        
+        pending = set(futures)
+        try:
+            for future in concurrent.futures.as_completed(futures, timeout=self.deadline):
+                pending.discard(future)
+                yield self._future_results(futures[future], future)
+        except concurrent.futures.TimeoutError:
+            # Опоздавшие типы отменяются (начатые прерывает срок в SearchIndex.search), ответ получается частичным
+            for future in pending:
+                search_type = futures[future]
+                if future.done():
+                    yield self._future_results(search_type, future)
+                    continue
+                future.cancel()
+                logger.warning(f"⏱️ Поиск {search_type} не уложился в {self.deadline} с")
+                yield search_type, [], False
+
+    def _future_results(self, search_type, future):
+        try:
+            return search_type, future.result(), True
+        except Exception as e:
+            logger.error(f"❌ Ошибка поиска {search_type}: {e}")
+            return search_type, [], False
+
+    def _search_uncached(self, query, query_terms, windows):
+        """Поиск по индексу и ранжирование без кэша; (результаты, все ли типы успели к сроку)"""
+        logger.info(f"🔍 Начало поиска для: '{query}'")
+        
+        results = {}
+        complete = True
+        for search_type, items, ok in self._iter_search(query, query_terms, windows):
+            results[search_type] = items
+            complete = complete and ok
         
         logger.info(f"✅ Поиск завершен. Найдено: "
                    f"Изображений: {len(results.get('images', []))}, "
                    f"Сайтов: {len(results.get('websites', []))}, "
                    f"Видео: {len(results.get('videos', []))}")
         
-        return results
+        return results, complete
 
-    def _search_type(self, query, query_words, search_type, max_results):
-        """Поиск по конкретному типу контента"""
-        all_results = []
+    def _search_type(self, query, query_terms, search_type, offset=0, count=20, deadline=None):
+        """Поиск по конкретному типу контента: count результатов после offset (и еще один, если есть)"""
+        if offset >= self.candidate_limit:
+            return []
         
-        # Теперь просто возвращаем пустой список, так как внешние поисковые системы убраны
-        # В реальной реализации здесь можно добавить сканирование собственной базы данных
-        # или других внутренних источников
+        # Кандидаты из собственного инвертированного индекса: пул не зависит от offset, иначе
+        # при переходе на следующую страницу порядок пересчитывался бы по другому набору
+        # Чтение индекса прерывается по истечении срока
+        all_results = search_index.search(search_type, query_terms, limit=self.candidate_limit, deadline=deadline)
         
-        # Ранжирование и ограничение результатов
+        # Ответ уже не ждут - ранжирование пропускается
+        if deadline is not None and time.monotonic() > deadline:
+            raise TimeoutError("срок запроса истек")
+        
+        # Ранжирование только до нужной позиции (без полной сортировки кандидатов)
+        needed = offset + count + 1
         if search_type == 'images':
-            ranked_results = self._rank_images(all_results, query_words)
+            ranked_results = self._rank_images(all_results, query_terms, needed)
         elif search_type == 'websites':
-            ranked_results = self._rank_websites(all_results, query_words)
+            ranked_results = self._rank_websites(all_results, query_terms, needed)
         elif search_type == 'videos':
-            ranked_results = self._rank_videos(all_results, query_words)
+            ranked_results = self._rank_videos(all_results, query_terms, needed)
         else:
             ranked_results = all_results
         
-        return ranked_results[:max_results]
+        return ranked_results[offset:offset + count + 1]
+
+    @staticmethod
+    def _best_first(scored):
+        """Результаты (оценка, результат) по убыванию оценки: куча строится за O(n), извлекается по одному"""
+        heap = [(-score, order, item) for order, (score, item) in enumerate(scored)]
+        heapq.heapify(heap)
+        while heap:
+            yield heapq.heappop(heap)[2]
 
-    def _rank_images(self, images, query_words):
+    def _rank_images(self, images, query_terms, limit=None):
         """Ранжирование изображений"""
         scored_images = []
         
@@ -1255,26 +3948,18 @@ class SearchEngine:
                 # Бонус за высокое качество изображения
                 final_score += self._estimate_image_quality(image)
                 
-                # Анализ компьютерным зрением
-                if not image.get('vision_analyzed', False):
-                    vision_analysis = image_analyzer.analyze_image(image['url'])
-                    image['vision_analysis'] = vision_analysis
-                    image['vision_analyzed'] = True
-                    
-                    # Обновление релевантности на основе анализа зрения
-                    vision_score = self._calculate_vision_relevance(vision_analysis, query_words)
-                    final_score += vision_score
+                # Результат компьютерного зрения, сохраненный при индексировании
+                final_score += self._calculate_vision_relevance(image, query_terms)
                 
                 scored_images.append((final_score, image))
                 
             except Exception as e:
                 continue
         
-        # Сортировка по убыванию релевантности
-        scored_images.sort(key=lambda x: x[0], reverse=True)
-        return [img for score, img in scored_images]
+        # Почти-дубликаты до ранжирования не доходят: постинги есть только у канонического изображения кластера
+        return list(itertools.islice(self._best_first(scored_images), limit))
 
-    def _rank_websites(self, websites, query_words):
+    def _rank_websites(self, websites, query_terms, limit=None):
         """Ранжирование веб-сайтов"""
         scored_websites = []
         
@@ -1294,88 +3979,860 @@ class SearchEngine:
             except Exception as e:
                 continue
         
-        scored_websites.sort(key=lambda x: x[0], reverse=True)
-        return [site for score, site in scored_websites]
+        return list(itertools.islice(self._best_first(scored_websites), limit))
+
+    def _rank_videos(self, videos, query_terms, limit=None):
+        """Ранжирование видео"""
+        scored_videos = []
+        
+        for video in videos:
+            try:
+                final_score = video.get('relevance_score', 0)
+                
+                # Бонус за популярные платформы
+                if any(platform in video.get('channel', '').lower() 
+                      for platform in ['youtube', 'vimeo']):
+                    final_score += 2
+                
+                # Бонус за наличие миниатюры
+                if video.get('thumbnail'):
+                    final_score += 1
+                
+                scored_videos.append((final_score, video))
+                
+            except Exception as e:
+                continue
+        
+        return list(itertools.islice(self._best_first(scored_videos), limit))
+
+    def _calculate_domain_authority(self, domain):
+        """Расчет авторитетности домена"""
+        authority_domains = {
+            'unsplash.com': 3, 'pixabay.com': 3, 'pexels.com': 3,
+            'flickr.com': 2, 'shutterstock.com': 2, 'gettyimages.com': 2,
+            'wikipedia.org': 3, 'youtube.com': 3, 'vimeo.com': 2,
+            'google.com': 3, 'github.com': 2, 'stackoverflow.com': 2
+        }
+        return authority_domains.get(domain, 0)
+
+    def _estimate_image_quality(self, image_data):
+        """Оценка качества изображения"""
+        score = 0
+        
+        # Бонус за наличие детальных метаданных
+        if len(image_data.get('alt', '')) > 10:
+            score += 1
+        if len(image_data.get('title', '')) > 5:
+            score += 1
+        if image_data.get('filename'):
+            score += 1
+        
+        return score
+
+    def _calculate_vision_relevance(self, image, query_terms):
+        """Расчет релевантности на основе анализа компьютерного зрения (query_terms - расширенный запрос).
+        
+        Термины меток сохранены в индексе при анализе изображения (vision_terms).
+        """
+        score = 0
+        vision_terms = image.get('vision_terms') or {}
+        
+        for obj, confidence in (image.get('vision_analysis') or {}).items():
+            terms = vision_terms.get(obj)
+            if terms is None:
+                # Документ еще не перестроен после обновления индекса
+                terms = text_analyzer.analyze(obj)
+            weight = max((query_terms.get(term, 0) for term in terms), default=0)
+            score += confidence * 2 * weight
+        
+        return score
+
+# Инициализация поисковой системы
+search_engine = SearchEngine()
+
+class CrawlFrontier:
+    """Приоритетная очередь URL с отдельными очередями и задержкой вежливости для каждого хоста"""
+
+    def __init__(self, visited, politeness_delay=1.0, max_size=100000, max_per_host=5000, max_hosts=100000):
+        self.visited = visited
+        self.politeness_delay = politeness_delay
+        self.max_size = max_size
+        self.max_per_host = max_per_host
+        self._host_queues = {}      # хост -> куча (приоритет, порядок, url, глубина)
+        self._ready_hosts = []      # куча (время готовности, хост)
+        # хост -> время, раньше которого хост не трогаем; запись живет до этого времени,
+        # а число хостов ограничено, поэтому за долгий обход словарь не растет без предела
+        self._next_allowed = TTLCache(maxsize=max_hosts)
+        self._in_flight = set()     # хосты, запрос к которым выполняется прямо сейчас
+        self._size = 0
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        # Вызывается (под блокировкой), когда у очереди появился готовый или скоро готовый хост
+        self.on_ready = None
+
+    def add(self, url, depth=0, priority=None, force=False):
+        """Добавление URL в очередь (меньший приоритет обрабатывается раньше); force - даже если URL недавно посещался"""
+        host = urlparse(url).netloc.lower()
+        if not host:
+            return False
+
+        with self._cond:
+            if self._size >= self.max_size or len(self._host_queues.get(host, ())) >= self.max_per_host:
+                return False
+
+        # Проверка вне блокировки: хранилище может быть на диске
+        if force:
+            self.visited.add(url)
+        elif not self.visited.check_and_add(url):
+            return False
+
+        with self._cond:
+            self._push(url, host, depth, priority)
+            return True
+
+    def add_many(self, urls, depth=0, priority=None):
+        """Добавление ссылок страницы: одна проверка посещенных URL на всю пачку; возвращает число добавленных.
+        
+        Хранилище посещенных может быть на диске, поэтому из цикла событий метод вызывается через run_in_executor.
+        """
+        batch = []
+        with self._cond:
+            room = self.max_size - self._size
+            host_sizes = {}
+            for url in urls:
+                if len(batch) >= room:
+                    break
+                host = urlparse(url).netloc.lower()
+                if not host:
+                    continue
+                size = host_sizes.get(host, len(self._host_queues.get(host, ())))
+                if size >= self.max_per_host:
+                    continue
+                host_sizes[host] = size + 1
+                batch.append((url, host))
+        if not batch:
+            return 0
+
+        fresh = self.visited.check_and_add_many([url for url, _ in batch])
+        added = 0
+        with self._cond:
+            for (url, host), is_new in zip(batch, fresh):
+                if is_new:
+                    self._push(url, host, depth, priority)
+                    added += 1
+        return added
+
+    def _push(self, url, host, depth, priority):
+        """Постановка URL в очередь хоста (под self._cond)"""
+        queue = self._host_queues.setdefault(host, [])
+        was_empty = not queue
+        heapq.heappush(queue, (depth if priority is None else priority, next(self._counter), url, depth))
+        self._size += 1
+
+        if was_empty and host not in self._in_flight:
+            heapq.heappush(self._ready_hosts, (self._next_allowed.get(host, 0), host))
+            self._cond.notify()
+            if self.on_ready:
+                self.on_ready()
+
+    def next(self, timeout=1.0):
+        """Следующий URL, чей хост уже можно сканировать: (url, глубина, хост) или None"""
+        deadline = time.time() + timeout
+
+        with self._cond:
+            while True:
+                now = time.time()
+                if self._ready_hosts and self._ready_hosts[0][0] <= now:
+                    _, host = heapq.heappop(self._ready_hosts)
+                    _, _, url, depth = heapq.heappop(self._host_queues[host])
+                    self._size -= 1
+                    self._in_flight.add(host)
+                    return url, depth, host
+
+                if now >= deadline:
+                    return None
+
+                wake_at = deadline
+                if self._ready_hosts:
+                    wake_at = min(wake_at, self._ready_hosts[0][0])
+                self._cond.wait(wake_at - now)
+
+    def release(self, host, delay=None):
+        """Завершение запроса к хосту: следующий запрос не раньше, чем через задержку"""
+        ready_at = time.time() + (self.politeness_delay if delay is None else delay)
+
+        with self._cond:
+            self._in_flight.discard(host)
+            self._next_allowed.set(host, ready_at, ready_at - time.time())
+
+            if self._host_queues.get(host):
+                heapq.heappush(self._ready_hosts, (ready_at, host))
+                self._cond.notify()
+                if self.on_ready:
+                    self.on_ready()
+            else:
+                self._host_queues.pop(host, None)
+
+    def ready_in(self):
+        """Через сколько секунд освободится ближайший хост с URL в очереди (None, если таких нет)"""
+        with self._cond:
+            if not self._ready_hosts:
+                return None
+            return max(0.0, self._ready_hosts[0][0] - time.time())
+
+    def stats(self):
+        with self._cond:
+            return {
+                'queued': self._size,
+                'hosts': len(self._host_queues),
+                'in_flight': len(self._in_flight)
+            }
+
+class RobotsCache:
+    """Кэш правил robots.txt по хостам"""
+
+    def __init__(self, user_agent, ttl=24 * 3600, error_ttl=600, max_hosts=10000):
+        self.user_agent = user_agent
+        self.ttl = ttl
+        self.error_ttl = error_ttl
+        self._parsers = TTLCache(maxsize=max_hosts)  # scheme://host -> парсер
+
+    async def rules(self, url):
+        """Правила robots.txt для хоста URL (загружаются при первом обращении)"""
+        parsed = urlparse(url)
+        base = f"{parsed.scheme}://{parsed.netloc}"
+
+        cached = self._parsers.get(base)
+        if cached is not None:
+            return cached
+
+        parser = RobotFileParser()
+        ttl = self.ttl
+        try:
+            response = await fetch_engine.fetch_async(
+                f"{base}/robots.txt", headers={'User-Agent': self.user_agent},
+                timeout=5, max_bytes=512 * 1024
+            )
+            if response.status_code in (401, 403):
+                parser.disallow_all = True
+            elif response.status_code >= 500:
+                parser.disallow_all = True
+                ttl = self.error_ttl
+            elif response.status_code >= 400:
+                parser.allow_all = True
+            else:
+                parser.parse(response.text.splitlines())
+        except Exception as e:
+            logger.warning(f"⚠️ robots.txt недоступен для {base}: {e}")
+            parser.disallow_all = True
+            ttl = self.error_ttl
+
+        self._parsers.set(base, parser, ttl)
+        return parser
+
+class CrawlScheduler:
+    """Фоновое непрерывное сканирование: очередь URL → краулер → индекс"""
+
+    def __init__(self, crawler, seed_urls, concurrency=64, max_depth=2, politeness_delay=1.0):
+        self.crawler = crawler
+        self.seed_urls = seed_urls
+        self.concurrency = concurrency
+        self.max_depth = max_depth
+        self.frontier = CrawlFrontier(crawler.visited_urls, politeness_delay=politeness_delay)
+        self.robots = RobotsCache(user_agent='AriOSBot')
+        self.pages_crawled = 0
+        self._stop = threading.Event()
+        self._future = None
+        # Свободные воркеры ждут это событие; при пробуждении оно заменяется новым
+        self._wakeup = None
+        self.frontier.on_ready = self._notify
+
+    def reseed(self):
+        """Повторное добавление стартовых URL для регулярного обхода"""
+        for url in self.seed_urls:
+            self.frontier.add(url, depth=0, force=True)
+
+    @property
+    def running(self):
+        return self._future is not None and not self._future.done()
+
+    def start(self):
+        if self.running or not self.seed_urls:
+            return False
+
+        self._stop.clear()
+        self.reseed()
+        self._future = asyncio.run_coroutine_threadsafe(self._run(), fetch_engine.loop)
+
+        logger.info(f"🕷️ Crawler started: {self.concurrency} concurrent fetches, "
+                    f"{len(self.seed_urls)} seed URLs")
+        return True
+
+    def stop(self):
+        self._stop.set()
+        self._notify()
+
+    def _notify(self):
+        """Пробуждение свободных воркеров (можно вызывать из любого потока)"""
+        if self._future is not None:
+            fetch_engine.loop.call_soon_threadsafe(self._wake)
+
+    def _wake(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+            self._wakeup = asyncio.Event()
+
+    async def _run(self):
+        self._wakeup = asyncio.Event()
+        await asyncio.gather(*(self._worker() for _ in range(self.concurrency)))
+
+    async def _worker(self):
+        while not self._stop.is_set():
+            # Событие берется до запроса к очереди: добавление URL после пустого ответа его уже разбудит
+            wakeup = self._wakeup
+            item = self.frontier.next(timeout=0)
+            if item is None:
+                # Без опроса: до появления URL или до освобождения ближайшего хоста по задержке вежливости
+                try:
+                    await asyncio.wait_for(wakeup.wait(), self.frontier.ready_in())
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            url, depth, host = item
+            delay = self.frontier.politeness_delay
+            try:
+                rules = await self.robots.rules(url)
+                if not rules.can_fetch(self.robots.user_agent, url):
+                    continue
+                delay = max(delay, rules.crawl_delay(self.robots.user_agent) or 0)
+
+                links = await self.crawler.crawl_for_index_async(url)
+                self.pages_crawled += 1
+
+                if depth < self.max_depth and links:
+                    await asyncio.get_running_loop().run_in_executor(
+                        None, self.frontier.add_many, links, depth + 1
+                    )
+            except Exception as e:
+                logger.error(f"❌ Ошибка фонового сканирования {url}: {e}")
+            finally:
+                self.frontier.release(host, delay)
+
+    def stats(self):
+        stats = self.frontier.stats()
+        stats['pages_crawled'] = self.pages_crawled
+        stats['visited'] = self.frontier.visited.stats()
+        stats['concurrency'] = self.concurrency if self.running else 0
+        return stats
+
+crawl_scheduler = CrawlScheduler(
+    search_engine.crawler,
+    seed_urls=[url.strip() for url in os.environ.get('ARIOS_SEED_URLS', '').split(',') if url.strip()],
+    concurrency=int(os.environ.get('ARIOS_CRAWL_CONCURRENCY', 64)),
+    max_depth=int(os.environ.get('ARIOS_CRAWL_MAX_DEPTH', 2)),
+    politeness_delay=float(os.environ.get('ARIOS_CRAWL_DELAY', 1.0))
+)
+
+# Краулер работает в одном процессе из всех воркеров gunicorn: в том, что держит аренду 'crawler'
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{os.urandom(4).hex()}"
+CRAWLER_LEASE_TTL = int(os.environ.get('ARIOS_CRAWLER_LEASE_TTL', 90))
+
+def elect_crawler():
+    """Занять или продлить аренду краулера; краулер запускается у арендатора и останавливается при ее потере"""
+    try:
+        leader = search_index.acquire_lease('crawler', WORKER_ID, CRAWLER_LEASE_TTL)
+    except sqlite3.Error as e:
+        logger.warning(f"⚠️ Не удалось продлить аренду краулера: {e}")
+        leader = False
+    if leader:
+        crawl_scheduler.start()
+    elif crawl_scheduler.running:
+        logger.warning("⚠️ Аренда краулера перешла к другому воркеру, краулер остановлен")
+        crawl_scheduler.stop()
+    return leader
+
+# HTML шаблон
+# Стили и скрипт страницы отдаются отдельными файлами с хэшем в имени (см. /assets)
+PAGE_CSS = '''
+:root {
+    --primary-color: #6366f1;
+    --primary-hover: #4f46e5;
+    --gradient-start: #8b5cf6;
+    --gradient-end: #6366f1;
+}
+
+body {
+    font-family: 'Segoe UI', system-ui, -apple-system, sans-serif;
+    max-width: 1200px;
+    margin: 0 auto;
+    padding: 20px;
+    background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+    min-height: 100vh;
+}
+
+.main-container {
+    background: white;
+    border-radius: 20px;
+    padding: 40px;
+    margin-top: 30px;
+    box-shadow: 0 20px 40px rgba(0,0,0,0.1);
+}
+
+.search-container {
+    text-align: center;
+}
+
+.logo {
+    font-size: 42px;
+    font-weight: 800;
+    margin-bottom: 10px;
+    background: linear-gradient(135deg, var(--gradient-start), var(--gradient-end));
+    -webkit-background-clip: text;
+    -webkit-text-fill-color: transparent;
+    background-clip: text;
+}
+
+.logo a {
+    text-decoration: none;
+}
+
+.tagline {
+    color: #6b7280;
+    font-size: 16px;
+    margin-bottom: 40px;
+    font-weight: 500;
+}
+
+.search-box {
+    width: 100%;
+    max-width: 600px;
+    padding: 18px 24px;
+    font-size: 16px;
+    border: 3px solid #e5e7eb;
+    border-radius: 50px;
+    outline: none;
+    margin-bottom: 25px;
+    transition: all 0.3s ease;
+    background: #f8fafc;
+}
+
+.search-box:focus {
+    border-color: var(--primary-color);
+    background: white;
+    box-shadow: 0 0 0 4px rgba(99, 102, 241, 0.1);
+}
+
+.search-button {
+    background: linear-gradient(135deg, var(--gradient-start), var(--gradient-end));
+    color: white;
+    border: none;
+    padding: 12px 32px;
+    font-size: 16px;
+    font-weight: 600;
+    border-radius: 50px;
+    cursor: pointer;
+    margin: 0 8px;
+    transition: all 0.3s ease;
+    box-shadow: 0 4px 12px rgba(99, 102, 241, 0.3);
+}
+
+.search-button:hover {
+    transform: translateY(-2px);
+    box-shadow: 0 6px 20px rgba(99, 102, 241, 0.4);
+}
+
+.filter-tabs {
+    display: flex;
+    justify-content: center;
+    gap: 10px;
+    margin: 20px 0;
+    flex-wrap: wrap;
+}
+
+.filter-tab {
+    background: #f8fafc;
+    border: 2px solid #e5e7eb;
+    padding: 10px 20px;
+    border-radius: 25px;
+    cursor: pointer;
+    font-weight: 600;
+    font-size: 14px;
+    transition: all 0.3s ease;
+    display: flex;
+    align-items: center;
+    gap: 8px;
+}
+
+.filter-tab:hover {
+    background: #f1f5f9;
+    border-color: #d1d5db;
+}
+
+.filter-tab.active {
+    background: var(--primary-color);
+    color: white;
+    border-color: var(--primary-color);
+    box-shadow: 0 4px 12px rgba(99, 102, 241, 0.3);
+}
+
+.filter-tab .count {
+    background: rgba(255, 255, 255, 0.2);
+    padding: 2px 8px;
+    border-radius: 12px;
+    font-size: 12px;
+    font-weight: 600;
+}
+
+.filter-tab:not(.active) .count {
+    background: #e5e7eb;
+    color: #374151;
+}
+
+.results-container {
+    margin-top: 20px;
+    text-align: left;
+}
+
+.stream-results {
+    display: flex;
+    flex-direction: column;
+}
+
+.results-header {
+    color: #374151;
+    font-size: 14px;
+    margin-bottom: 20px;
+    padding-bottom: 10px;
+    border-bottom: 2px solid #f3f4f6;
+}
+
+.result-item {
+    margin-bottom: 25px;
+    padding: 20px;
+    background: white;
+    border-radius: 12px;
+    border: 1px solid #f3f4f6;
+    transition: all 0.3s ease;
+    position: relative;
+}
+
+.result-item:hover {
+    border-color: var(--primary-color);
+    box-shadow: 0 4px 12px rgba(0,0,0,0.05);
+    transform: translateY(-1px);
+}
+
+.result-item::before {
+    content: '';
+    position: absolute;
+    left: 0;
+    top: 0;
+    bottom: 0;
+    width: 4px;
+    background: linear-gradient(to bottom, var(--gradient-start), var(--gradient-end));
+    border-radius: 4px 0 0 4px;
+}
+
+.result-title {
+    font-size: 18px;
+    color: var(--primary-color);
+    text-decoration: none;
+    font-weight: 600;
+    display: block;
+    margin-bottom: 8px;
+}
+
+.result-title:hover {
+    text-decoration: underline;
+}
+
+.result-url {
+    color: #059669;
+    font-size: 14px;
+    margin-bottom: 8px;
+    font-weight: 500;
+}
+
+.result-snippet {
+    color: #4b5563;
+    font-size: 14px;
+    line-height: 1.5;
+}
+
+.highlight {
+    background-color: #fffacd;
+    padding: 2px 4px;
+    border-radius: 3px;
+    font-weight: 600;
+}
+
+.images-container {
+    display: grid;
+    grid-template-columns: repeat(auto-fill, minmax(200px, 1fr));
+    gap: 15px;
+    margin: 30px 0;
+}
+
+.image-result {
+    border-radius: 10px;
+    overflow: hidden;
+    border: 1px solid #e5e7eb;
+    transition: all 0.3s ease;
+    background: white;
+}
+
+.image-result:hover {
+    transform: translateY(-2px);
+    box-shadow: 0 8px 25px rgba(0,0,0,0.15);
+}
+
+.image-result img {
+    width: 100%;
+    height: 150px;
+    object-fit: cover;
+    display: block;
+}
+
+.image-info {
+    padding: 10px;
+}
+
+.image-title {
+    font-size: 12px;
+    color: #374151;
+    margin-bottom: 5px;
+    line-height: 1.3;
+}
+
+.image-source {
+    font-size: 10px;
+    color: #6b7280;
+}
+
+.image-meta {
+    font-size: 9px;
+    color: #9ca3af;
+    margin-top: 3px;
+}
+
+.videos-container {
+    display: grid;
+    grid-template-columns: repeat(auto-fill, minmax(300px, 1fr));
+    gap: 20px;
+    margin: 30px 0;
+}
+
+.video-result {
+    border-radius: 10px;
+    overflow: hidden;
+    border: 1px solid #e5e7eb;
+    transition: all 0.3s ease;
+    background: white;
+}
+
+.video-result:hover {
+    transform: translateY(-2px);
+    box-shadow: 0 8px 25px rgba(0,0,0,0.15);
+}
+
+.video-thumbnail {
+    width: 100%;
+    height: 180px;
+    object-fit: cover;
+    display: block;
+}
+
+.video-info {
+    padding: 15px;
+}
+
+.video-title {
+    font-size: 14px;
+    color: #374151;
+    margin-bottom: 8px;
+    line-height: 1.3;
+    font-weight: 600;
+}
+
+.video-channel {
+    font-size: 12px;
+    color: #6b7280;
+    margin-bottom: 5px;
+}
+
+.video-duration {
+    font-size: 11px;
+    color: #9ca3af;
+}
+
+.section-title {
+    font-size: 20px;
+    font-weight: 600;
+    margin: 30px 0 15px 0;
+    color: #374151;
+    border-left: 4px solid var(--primary-color);
+    padding-left: 15px;
+}
+
+.feature-badges {
+    display: flex;
+    justify-content: center;
+    gap: 15px;
+    margin-top: 30px;
+    flex-wrap: wrap;
+}
+
+.badge {
+    background: #f0f9ff;
+    color: #0369a1;
+    padding: 8px 16px;
+    border-radius: 20px;
+    font-size: 12px;
+    font-weight: 600;
+    border: 1px solid #bae6fd;
+}
+
+.error {
+    color: #dc2626;
+    text-align: center;
+    margin-top: 20px;
+    padding: 15px;
+    background: #fef2f2;
+    border-radius: 10px;
+    border: 1px solid #fecaca;
+}
+
+.footer {
+    text-align: center;
+    margin-top: 50px;
+    color: #9ca3af;
+    font-size: 14px;
+}
+
+.quick-search {
+    margin: 20px 0;
+}
+
+.quick-search-btn {
+    background: #f1f5f9;
+    border: 1px solid #e2e8f0;
+    padding: 8px 16px;
+    margin: 5px;
+    border-radius: 20px;
+    cursor: pointer;
+    font-size: 14px;
+    transition: all 0.2s ease;
+}
+
+.quick-search-btn:hover {
+    background: var(--primary-color);
+    color: white;
+    border-color: var(--primary-color);
+}
+
+.loading {
+    text-align: center;
+    color: #6366f1;
+    padding: 40px;
+    font-size: 18px;
+}
+
+.status-info {
+    background: #f0fdf4;
+    border: 1px solid #bbf7d0;
+    padding: 10px;
+    border-radius: 8px;
+    margin: 10px 0;
+    font-size: 12px;
+    color: #065f46;
+}
+
+.status-warning {
+    background: #fef3c7;
+    border: 1px solid #f59e0b;
+    padding: 10px;
+    border-radius: 8px;
+    margin: 10px 0;
+    font-size: 12px;
+    color: #92400e;
+}
+
+.no-results {
+    text-align: center;
+    padding: 40px;
+    color: #6b7280;
+    font-size: 16px;
+}
+
+.content-type {
+    display: none;
+}
 
-    def _rank_videos(self, videos, query_words):
-        """Ранжирование видео"""
-        scored_videos = []
-        
-        for video in videos:
-            try:
-                final_score = video.get('relevance_score', 0)
-                
-                # Бонус за популярные платформы
-                if any(platform in video.get('channel', '').lower() 
-                      for platform in ['youtube', 'vimeo']):
-                    final_score += 2
-                
-                # Бонус за наличие миниатюры
-                if video.get('thumbnail'):
-                    final_score += 1
-                
-                scored_videos.append((final_score, video))
-                
-            except Exception as e:
-                continue
-        
-        scored_videos.sort(key=lambda x: x[0], reverse=True)
-        return [video for score, video in scored_videos]
+.content-type.active {
+    display: block;
+}
 
-    def _calculate_domain_authority(self, domain):
-        """Расчет авторитетности домена"""
-        authority_domains = {
-            'unsplash.com': 3, 'pixabay.com': 3, 'pexels.com': 3,
-            'flickr.com': 2, 'shutterstock.com': 2, 'gettyimages.com': 2,
-            'wikipedia.org': 3, 'youtube.com': 3, 'vimeo.com': 2,
-            'google.com': 3, 'github.com': 2, 'stackoverflow.com': 2
-        }
-        return authority_domains.get(domain, 0)
+.stats-info {
+    background: #eff6ff;
+    border: 1px solid #dbeafe;
+    padding: 8px 12px;
+    border-radius: 6px;
+    margin: 5px 0;
+    font-size: 11px;
+    color: #1e40af;
+}
 
-    def _estimate_image_quality(self, image_data):
-        """Оценка качества изображения"""
-        score = 0
-        
-        # Бонус за наличие детальных метаданных
-        if len(image_data.get('alt', '')) > 10:
-            score += 1
-        if len(image_data.get('title', '')) > 5:
-            score += 1
-        if image_data.get('filename'):
-            score += 1
-        
-        return score
+.search-stats {
+    background: #f0f9ff;
+    border: 1px solid #e0f2fe;
+    padding: 10px 15px;
+    border-radius: 8px;
+    margin: 10px 0;
+    font-size: 12px;
+    color: #0c4a6e;
+}
+'''
 
-    def _calculate_vision_relevance(self, vision_analysis, query_words):
-        """Расчет релевантности на основе анализа компьютерного зрения"""
-        score = 0
-        
-        for obj, confidence in vision_analysis.items():
-            for word in query_words:
-                if word in obj or self._is_synonym(word, obj):
-                    score += confidence * 2
-        
-        return score
+PAGE_JS = '''
+function setSearch(term) {
+    document.querySelector('.search-box').value = term;
+    document.getElementById('searchForm').submit();
+}
 
-    def _is_synonym(self, word, object_name):
-        """Проверка синонимичности"""
-        synonyms = {
-            'кот': ['кошка', 'котенок'],
-            'собака': ['пес', 'щенок'],
-            'машина': ['автомобиль', 'тачка'],
-            'человек': ['люди', 'персона'],
-            'цветок': ['цветы', 'букет'],
-            'дом': ['здание', 'строение'],
-            'горы': ['гора', 'вершина'],
-            'пляж': ['берег', 'песок'],
-            'город': ['улица', 'здания']
-        }
-        return word in synonyms.get(object_name, [])
+function showContent(type) {
+    // Скрываем все контент-блоки
+    document.querySelectorAll('.content-type').forEach(el => {
+        el.classList.remove('active');
+    });
+    
+    // Показываем выбранный контент-блок
+    document.getElementById('content-' + type).classList.add('active');
+    
+    // Обновляем активную вкладку
+    document.querySelectorAll('.filter-tab').forEach(tab => {
+        tab.classList.remove('active');
+    });
+    event.target.classList.add('active');
+    
+    // Сохраняем выбранную вкладку в URL
+    const url = new URL(window.location);
+    url.searchParams.set('tab', type);
+    window.history.replaceState({}, '', url);
+}
 
-# Инициализация поисковой системы
-search_engine = SearchEngine()
+// Восстанавливаем выбранную вкладку при загрузке
+document.addEventListener('DOMContentLoaded', function() {
+    const urlParams = new URLSearchParams(window.location.search);
+    const savedTab = urlParams.get('tab');
+    if (savedTab) {
+        showContent(savedTab);
+    }
+});
+
+document.querySelector('.search-box').focus();
+'''
 
-# HTML шаблон
 HTML_TEMPLATE = '''
 <!DOCTYPE html>
 <html lang="ru">
@@ -1385,440 +4842,7 @@ HTML_TEMPLATE = '''
     <title>{% if query %}{{ query }} - AriOS Search{% else %}AriOS - Умный поиск{% endif %}</title>
     <meta name="description" content="AriOS - независимая поисковая система с реальными результатами">
     
-    <style>
-        :root {
-            --primary-color: #6366f1;
-            --primary-hover: #4f46e5;
-            --gradient-start: #8b5cf6;
-            --gradient-end: #6366f1;
-        }
-        
-        body {
-            font-family: 'Segoe UI', system-ui, -apple-system, sans-serif;
-            max-width: 1200px;
-            margin: 0 auto;
-            padding: 20px;
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            min-height: 100vh;
-        }
-        
-        .main-container {
-            background: white;
-            border-radius: 20px;
-            padding: 40px;
-            margin-top: 30px;
-            box-shadow: 0 20px 40px rgba(0,0,0,0.1);
-        }
-        
-        .search-container {
-            text-align: center;
-        }
-        
-        .logo {
-            font-size: 42px;
-            font-weight: 800;
-            margin-bottom: 10px;
-            background: linear-gradient(135deg, var(--gradient-start), var(--gradient-end));
-            -webkit-background-clip: text;
-            -webkit-text-fill-color: transparent;
-            background-clip: text;
-        }
-        
-        .logo a {
-            text-decoration: none;
-        }
-        
-        .tagline {
-            color: #6b7280;
-            font-size: 16px;
-            margin-bottom: 40px;
-            font-weight: 500;
-        }
-        
-        .search-box {
-            width: 100%;
-            max-width: 600px;
-            padding: 18px 24px;
-            font-size: 16px;
-            border: 3px solid #e5e7eb;
-            border-radius: 50px;
-            outline: none;
-            margin-bottom: 25px;
-            transition: all 0.3s ease;
-            background: #f8fafc;
-        }
-        
-        .search-box:focus {
-            border-color: var(--primary-color);
-            background: white;
-            box-shadow: 0 0 0 4px rgba(99, 102, 241, 0.1);
-        }
-        
-        .search-button {
-            background: linear-gradient(135deg, var(--gradient-start), var(--gradient-end));
-            color: white;
-            border: none;
-            padding: 12px 32px;
-            font-size: 16px;
-            font-weight: 600;
-            border-radius: 50px;
-            cursor: pointer;
-            margin: 0 8px;
-            transition: all 0.3s ease;
-            box-shadow: 0 4px 12px rgba(99, 102, 241, 0.3);
-        }
-        
-        .search-button:hover {
-            transform: translateY(-2px);
-            box-shadow: 0 6px 20px rgba(99, 102, 241, 0.4);
-        }
-        
-        .filter-tabs {
-            display: flex;
-            justify-content: center;
-            gap: 10px;
-            margin: 20px 0;
-            flex-wrap: wrap;
-        }
-        
-        .filter-tab {
-            background: #f8fafc;
-            border: 2px solid #e5e7eb;
-            padding: 10px 20px;
-            border-radius: 25px;
-            cursor: pointer;
-            font-weight: 600;
-            font-size: 14px;
-            transition: all 0.3s ease;
-            display: flex;
-            align-items: center;
-            gap: 8px;
-        }
-        
-        .filter-tab:hover {
-            background: #f1f5f9;
-            border-color: #d1d5db;
-        }
-        
-        .filter-tab.active {
-            background: var(--primary-color);
-            color: white;
-            border-color: var(--primary-color);
-            box-shadow: 0 4px 12px rgba(99, 102, 241, 0.3);
-        }
-        
-        .filter-tab .count {
-            background: rgba(255, 255, 255, 0.2);
-            padding: 2px 8px;
-            border-radius: 12px;
-            font-size: 12px;
-            font-weight: 600;
-        }
-        
-        .filter-tab:not(.active) .count {
-            background: #e5e7eb;
-            color: #374151;
-        }
-        
-        .results-container {
-            margin-top: 20px;
-            text-align: left;
-        }
-        
-        .results-header {
-            color: #374151;
-            font-size: 14px;
-            margin-bottom: 20px;
-            padding-bottom: 10px;
-            border-bottom: 2px solid #f3f4f6;
-        }
-        
-        .result-item {
-            margin-bottom: 25px;
-            padding: 20px;
-            background: white;
-            border-radius: 12px;
-            border: 1px solid #f3f4f6;
-            transition: all 0.3s ease;
-            position: relative;
-        }
-        
-        .result-item:hover {
-            border-color: var(--primary-color);
-            box-shadow: 0 4px 12px rgba(0,0,0,0.05);
-            transform: translateY(-1px);
-        }
-        
-        .result-item::before {
-            content: '';
-            position: absolute;
-            left: 0;
-            top: 0;
-            bottom: 0;
-            width: 4px;
-            background: linear-gradient(to bottom, var(--gradient-start), var(--gradient-end));
-            border-radius: 4px 0 0 4px;
-        }
-        
-        .result-title {
-            font-size: 18px;
-            color: var(--primary-color);
-            text-decoration: none;
-            font-weight: 600;
-            display: block;
-            margin-bottom: 8px;
-        }
-        
-        .result-title:hover {
-            text-decoration: underline;
-        }
-        
-        .result-url {
-            color: #059669;
-            font-size: 14px;
-            margin-bottom: 8px;
-            font-weight: 500;
-        }
-        
-        .result-snippet {
-            color: #4b5563;
-            font-size: 14px;
-            line-height: 1.5;
-        }
-        
-        .highlight {
-            background-color: #fffacd;
-            padding: 2px 4px;
-            border-radius: 3px;
-            font-weight: 600;
-        }
-        
-        .images-container {
-            display: grid;
-            grid-template-columns: repeat(auto-fill, minmax(200px, 1fr));
-            gap: 15px;
-            margin: 30px 0;
-        }
-        
-        .image-result {
-            border-radius: 10px;
-            overflow: hidden;
-            border: 1px solid #e5e7eb;
-            transition: all 0.3s ease;
-            background: white;
-        }
-        
-        .image-result:hover {
-            transform: translateY(-2px);
-            box-shadow: 0 8px 25px rgba(0,0,0,0.15);
-        }
-        
-        .image-result img {
-            width: 100%;
-            height: 150px;
-            object-fit: cover;
-            display: block;
-        }
-        
-        .image-info {
-            padding: 10px;
-        }
-        
-        .image-title {
-            font-size: 12px;
-            color: #374151;
-            margin-bottom: 5px;
-            line-height: 1.3;
-        }
-        
-        .image-source {
-            font-size: 10px;
-            color: #6b7280;
-        }
-        
-        .image-meta {
-            font-size: 9px;
-            color: #9ca3af;
-            margin-top: 3px;
-        }
-        
-        .videos-container {
-            display: grid;
-            grid-template-columns: repeat(auto-fill, minmax(300px, 1fr));
-            gap: 20px;
-            margin: 30px 0;
-        }
-        
-        .video-result {
-            border-radius: 10px;
-            overflow: hidden;
-            border: 1px solid #e5e7eb;
-            transition: all 0.3s ease;
-            background: white;
-        }
-        
-        .video-result:hover {
-            transform: translateY(-2px);
-            box-shadow: 0 8px 25px rgba(0,0,0,0.15);
-        }
-        
-        .video-thumbnail {
-            width: 100%;
-            height: 180px;
-            object-fit: cover;
-            display: block;
-        }
-        
-        .video-info {
-            padding: 15px;
-        }
-        
-        .video-title {
-            font-size: 14px;
-            color: #374151;
-            margin-bottom: 8px;
-            line-height: 1.3;
-            font-weight: 600;
-        }
-        
-        .video-channel {
-            font-size: 12px;
-            color: #6b7280;
-            margin-bottom: 5px;
-        }
-        
-        .video-duration {
-            font-size: 11px;
-            color: #9ca3af;
-        }
-        
-        .section-title {
-            font-size: 20px;
-            font-weight: 600;
-            margin: 30px 0 15px 0;
-            color: #374151;
-            border-left: 4px solid var(--primary-color);
-            padding-left: 15px;
-        }
-        
-        .feature-badges {
-            display: flex;
-            justify-content: center;
-            gap: 15px;
-            margin-top: 30px;
-            flex-wrap: wrap;
-        }
-        
-        .badge {
-            background: #f0f9ff;
-            color: #0369a1;
-            padding: 8px 16px;
-            border-radius: 20px;
-            font-size: 12px;
-            font-weight: 600;
-            border: 1px solid #bae6fd;
-        }
-        
-        .error {
-            color: #dc2626;
-            text-align: center;
-            margin-top: 20px;
-            padding: 15px;
-            background: #fef2f2;
-            border-radius: 10px;
-            border: 1px solid #fecaca;
-        }
-        
-        .footer {
-            text-align: center;
-            margin-top: 50px;
-            color: #9ca3af;
-            font-size: 14px;
-        }
-        
-        .quick-search {
-            margin: 20px 0;
-        }
-        
-        .quick-search-btn {
-            background: #f1f5f9;
-            border: 1px solid #e2e8f0;
-            padding: 8px 16px;
-            margin: 5px;
-            border-radius: 20px;
-            cursor: pointer;
-            font-size: 14px;
-            transition: all 0.2s ease;
-        }
-        
-        .quick-search-btn:hover {
-            background: var(--primary-color);
-            color: white;
-            border-color: var(--primary-color);
-        }
-        
-        .loading {
-            text-align: center;
-            color: #6366f1;
-            padding: 40px;
-            font-size: 18px;
-        }
-        
-        .status-info {
-            background: #f0fdf4;
-            border: 1px solid #bbf7d0;
-            padding: 10px;
-            border-radius: 8px;
-            margin: 10px 0;
-            font-size: 12px;
-            color: #065f46;
-        }
-        
-        .status-warning {
-            background: #fef3c7;
-            border: 1px solid #f59e0b;
-            padding: 10px;
-            border-radius: 8px;
-            margin: 10px 0;
-            font-size: 12px;
-            color: #92400e;
-        }
-        
-        .no-results {
-            text-align: center;
-            padding: 40px;
-            color: #6b7280;
-            font-size: 16px;
-        }
-        
-        .content-type {
-            display: none;
-        }
-        
-        .content-type.active {
-            display: block;
-        }
-        
-        .stats-info {
-            background: #eff6ff;
-            border: 1px solid #dbeafe;
-            padding: 8px 12px;
-            border-radius: 6px;
-            margin: 5px 0;
-            font-size: 11px;
-            color: #1e40af;
-        }
-        
-        .search-stats {
-            background: #f0f9ff;
-            border: 1px solid #e0f2fe;
-            padding: 10px 15px;
-            border-radius: 8px;
-            margin: 10px 0;
-            font-size: 12px;
-            color: #0c4a6e;
-        }
-    </style>
+    <link rel="stylesheet" href="{{ asset_urls.css }}">
 </head>
 <body>
     <div class="main-container">
@@ -1878,6 +4902,10 @@ HTML_TEMPLATE = '''
             </div>
             {% endif %}
             
+            {% if streaming %}
+            <div class="results-container stream-results"><!--stream--></div>
+            {% endif %}
+            
             {% if results or images or videos %}
             <div class="results-container">
                 <div class="results-header">
@@ -2062,48 +5090,121 @@ HTML_TEMPLATE = '''
         </div>
     </div>
 
-    <script>
-        function setSearch(term) {
-            document.querySelector('.search-box').value = term;
-            document.getElementById('searchForm').submit();
-        }
-        
-        function showContent(type) {
-            // Скрываем все контент-блоки
-            document.querySelectorAll('.content-type').forEach(el => {
-                el.classList.remove('active');
-            });
-            
-            // Показываем выбранный контент-блок
-            document.getElementById('content-' + type).classList.add('active');
-            
-            // Обновляем активную вкладку
-            document.querySelectorAll('.filter-tab').forEach(tab => {
-                tab.classList.remove('active');
-            });
-            event.target.classList.add('active');
-            
-            // Сохраняем выбранную вкладку в URL
-            const url = new URL(window.location);
-            url.searchParams.set('tab', type);
-            window.history.replaceState({}, '', url);
-        }
-        
-        // Восстанавливаем выбранную вкладку при загрузке
-        document.addEventListener('DOMContentLoaded', function() {
-            const urlParams = new URLSearchParams(window.location.search);
-            const savedTab = urlParams.get('tab');
-            if (savedTab) {
-                showContent(savedTab);
-            }
-        });
-        
-        document.querySelector('.search-box').focus();
-    </script>
+    <script src="{{ asset_urls.js }}"></script>
 </body>
 </html>
 '''
 
+# Фрагмент потоковой выдачи: блок одного типа, порядок на странице задается через CSS order
+STREAM_SECTION_TEMPLATE = '''
+<div class="stream-section" style="order: {{ order }}">
+    {% if search_type == 'videos' %}
+    <div class="section-title">🎥 Видео</div>
+    <div class="videos-container">
+        {% for video in videos %}
+        <div class="video-result">
+            <a href="{{ video.url }}" target="_blank">
+                <img src="{{ video.thumbnail }}" alt="{{ video.title }}" class="video-thumbnail"
+                     onerror="this.src='data:image/svg+xml;base64,PHN2ZyB3aWR0aD0iMzAwIiBoZWlnaHQ9IjE4MCIgdmlld0JveD0iMCAwIDMwMCAxODAiIGZpbGw9Im5vbmUiIHhtbG5zPSJodHRwOi8vd3d3LnczLm9yZy8yMDAwL3N2ZyI+CjxyZWN0IHdpZHRoPSIzMDAiIGhlaWdodD0iMTgwIiBmaWxsPSIjRjNGNEY2Ii8+CjxwYXRoIGQ9Ik0xMjAgODBMMTYwIDEwMEwxMjAgMTIwVjgwWiIgZmlsbD0iIzlDQTNBRiIvPgo8L3N2Zz4='">
+            </a>
+            <div class="video-info">
+                <div class="video-title">{{ video.title }}</div>
+                <div class="video-channel">{{ video.channel }}</div>
+                <div class="video-duration">{{ video.duration }}</div>
+            </div>
+        </div>
+        {% endfor %}
+    </div>
+    {% elif search_type == 'images' %}
+    <div class="section-title">📷 Изображения (проанализированы компьютерным зрением)</div>
+    <div class="images-container">
+        {% for image in images %}
+        <div class="image-result">
+            <a href="{{ image.url }}" target="_blank">
+                <img src="{{ image.thumbnail }}" alt="{{ image.title }}"
+                     onerror="this.src='data:image/svg+xml;base64,PHN2ZyB3aWR0aD0iMjAwIiBoZWlnaHQ9IjE1MCIgdmlld0JveD0iMCAwIDIwMCAxNTAiIGZpbGw9Im5vbmUiIHhtbG5zPSJodHRwOi8vd3d3LnczLm9yZy8yMDAwL3N2ZyI+CjxyZWN0IHdpZHRoPSIyMDAiIGhlaWdodD0iMTUwIiBmaWxsPSIjRjNGNEY2Ii8+CjxwYXRoIGQ9Ik04MCA2MEgxMjBNNzAgODBIMTMwTTY1IDEwMEgxMzUiIHN0cm9rZT0iIzlDQTNBRiIgc3Ryb2tlLXdpZHRoPSIyIi8+CjxjaXJjbGUgY3g9IjEwMCIgY3k9IjUwIiByPSIxNSIgc3Ryb2tlPSIjOUNBM0FGIiBzdHJva2Utd2lkdGg9IjIiLz4KPC9zdmc+'">
+            </a>
+            <div class="image-info">
+                <div class="image-title">{{ image.title }}</div>
+                <div class="image-source">{{ image.source }}</div>
+                {% if image.metadata %}
+                <div class="image-meta">
+                    Релевантность: {{ image.metadata.relevance_score }} | 
+                    {{ image.metadata.analysis_type }}
+                    {% if image.metadata.alt %}| Alt: {{ image.metadata.alt[:30] }}...{% endif %}
+                </div>
+                {% endif %}
+            </div>
+        </div>
+        {% endfor %}
+    </div>
+    {% else %}
+    <div class="section-title">🌐 Веб-сайты</div>
+    {% for result in results %}
+    <div class="result-item">
+        <a href="{{ result.url }}" class="result-title" target="_blank">
+            {{ result.title }}
+        </a>
+        <div class="result-url">{{ result.display_url }}</div>
+        <div class="result-snippet">{{ result.description }}</div>
+    </div>
+    {% endfor %}
+    {% endif %}
+</div>
+'''
+
+# Итоговая строка потоковой выдачи; индикатор загрузки скрывается стилем, без скриптов
+STREAM_SUMMARY_TEMPLATE = '''
+<div class="results-header" style="order: 0">
+    Найдено: {{ total_results }} • Время: {{ search_time }}с • 
+    Запрос: "{{ query }}" • Алгоритм: интеллектуальный поиск
+</div>
+{% if not total_results %}
+<div class="no-results" style="order: 4">📭 Ничего не найдено</div>
+{% endif %}
+<style>.loading { display: none; }</style>
+'''
+
+class StaticAsset:
+    """Неизменяемый файл страницы: имя с хэшем содержимого и заранее сжатые варианты"""
+
+    def __init__(self, name, content, mimetype):
+        body = content.encode('utf-8')
+        digest = hashlib.sha256(body).hexdigest()[:12]
+        base, extension = name.rsplit('.', 1)
+        self.filename = f"{base}.{digest}.{extension}"
+        self.mimetype = mimetype
+        self.etag = digest
+        self.variants = {'identity': body, 'gzip': gzip.compress(body, compresslevel=9)}
+        if brotli is not None:
+            self.variants['br'] = brotli.compress(body, quality=11)
+
+STATIC_ASSETS = {
+    asset.filename: asset for asset in (
+        StaticAsset('arios.css', PAGE_CSS, 'text/css'),
+        StaticAsset('arios.js', PAGE_JS, 'application/javascript')
+    )
+}
+
+# Шаблон компилируется один раз при запуске, ссылки на стили и скрипт - глобальные переменные шаблона
+page_template = app.jinja_env.from_string(HTML_TEMPLATE, globals={
+    'asset_urls': {
+        asset.filename.rsplit('.', 1)[1]: f"/assets/{asset.filename}" for asset in STATIC_ASSETS.values()
+    }
+})
+
+stream_section_template = app.jinja_env.from_string(STREAM_SECTION_TEMPLATE)
+stream_summary_template = app.jinja_env.from_string(STREAM_SUMMARY_TEMPLATE)
+
+# Типы ответов, которые имеет смысл сжимать, и минимальный размер тела
+COMPRESSIBLE_MIMETYPES = {'text/html', 'text/css', 'text/plain', 'application/json', 'application/javascript'}
+COMPRESS_MIN_BYTES = 500
+
+def preferred_encoding():
+    """Лучшее сжатие из поддерживаемых клиентом (Accept-Encoding)"""
+    offered = ['br', 'gzip'] if brotli is not None else ['gzip']
+    return request.accept_encodings.best_match(offered)
+
 # Функции для само-пинга и планировщика
 def self_ping():
     """Отправляет запросы самому себе чтобы держать приложение активным"""
@@ -2119,13 +5220,13 @@ def self_ping():
         logger.info(f"🔁 Starting self-ping to {base_url}")
         
         try:
-            response1 = requests.get(health_url, timeout=10)
+            response1 = http_transport.get(health_url, timeout=10)
             logger.info(f"✅ Health ping: {response1.status_code}")
         except Exception as e:
             logger.error(f"❌ Health ping failed: {e}")
         
         try:
-            response2 = requests.get(search_url, timeout=10)
+            response2 = http_transport.get(search_url, timeout=10)
             logger.info(f"✅ Search ping: {response2.status_code}")
         except Exception as e:
             logger.error(f"❌ Search ping failed: {e}")
@@ -2140,15 +5241,28 @@ def self_ping():
         logger.error(f"❌ Self-ping error: {e}")
         app_status['is_active'] = False
 
+def migrate_index_in_background():
+    """Перестроение устаревшего индекса в отдельном потоке (займет один воркер, остальные его пропустят)"""
+    if search_index.needs_reindex():
+        threading.Thread(target=search_index.migrate, daemon=True).start()
+
 def run_scheduler():
     """Запускает планировщик для регулярных само-пингов"""
     logger.info("🕒 Starting background scheduler...")
     
     schedule.every(2).minutes.do(self_ping)
     schedule.every(30).seconds.do(lambda: 
-        requests.get(f"{os.environ.get('RENDER_EXTERNAL_URL', 'https://arios-yqnm.onrender.com')}/ping", timeout=5) 
+        http_transport.get(f"{os.environ.get('RENDER_EXTERNAL_URL', 'https://arios-yqnm.onrender.com')}/ping", timeout=5) 
         if random.random() > 0.3 else None
     )
+    schedule.every(max(1, CRAWLER_LEASE_TTL // 3)).seconds.do(elect_crawler)
+    schedule.every(int(os.environ.get('ARIOS_RESEED_MINUTES', 60))).minutes.do(
+        lambda: crawl_scheduler.reseed() if crawl_scheduler.running else None
+    )
+    schedule.every(10).minutes.do(image_enrichment.backfill)
+    schedule.every(1).hours.do(visited_store.prune)
+    # Средние длины полей растущего индекса уходят от опорных длин вкладов
+    schedule.every(30).minutes.do(migrate_index_in_background)
     
     logger.info("🔁 Performing initial self-ping...")
     self_ping()
@@ -2164,9 +5278,13 @@ def run_scheduler():
 def start_background_scheduler():
     """Запускает фоновый планировщик"""
     try:
+        migrate_index_in_background()
         scheduler_thread = threading.Thread(target=run_scheduler, daemon=True)
         scheduler_thread.start()
         logger.info("🚀 Background scheduler started successfully")
+        image_enrichment.start()
+        elect_crawler()
+        atexit.register(search_index.release_lease, 'crawler', WORKER_ID)
         return True
     except Exception as e:
         logger.error(f"❌ Failed to start scheduler: {e}")
@@ -2189,7 +5307,7 @@ def home():
     uptime = int(time.time() - app_status['start_time'])
     uptime_str = f"{uptime // 3600}ч {(uptime % 3600) // 60}м {uptime % 60}с"
     
-    return render_template_string(HTML_TEMPLATE, 
+    return render_template(page_template, 
                                 query="", 
                                 results=None, 
                                 images=None, 
@@ -2218,7 +5336,7 @@ def search():
     active_tab = request.args.get('tab', 'all')
     
     if not query:
-        return render_template_string(HTML_TEMPLATE, 
+        return render_template(page_template, 
                                    query="", 
                                    results=None, 
                                    images=None,
@@ -2241,8 +5359,17 @@ def search():
         
         start_time = time.time()
         
+        try:
+            page = max(1, int(request.args.get('page', 1)))
+        except ValueError:
+            page = 1
+        
+        # Потоковый режим: каркас страницы сразу, блоки типов по мере готовности
+        if request.args.get('stream') == '1':
+            return stream_search(query, page, show_status)
+        
         # Используем универсальную поисковую систему
-        search_results = search_engine.search(query, max_results=20)
+        search_results = search_engine.search(query, max_results=20, page=page)
         
         results = search_results.get('websites', [])
         images = search_results.get('images', [])
@@ -2262,7 +5389,7 @@ def search():
         uptime = int(time.time() - app_status['start_time'])
         uptime_str = f"{uptime // 3600}ч {(uptime % 3600) // 60}м {uptime % 60}с"
         
-        return render_template_string(HTML_TEMPLATE,
+        return render_template(page_template,
                                    query=query,
                                    results=results,
                                    images=images,
@@ -2285,7 +5412,7 @@ def search():
     
     except Exception as e:
         logger.error(f"❌ Search error: {e}")
-        return render_template_string(HTML_TEMPLATE,
+        return render_template(page_template,
                                    query=query,
                                    results=None,
                                    images=None,
@@ -2303,6 +5430,185 @@ def search():
                                    indexed_images=app_status['indexed_images'],
                                    processed_pages=app_status['processed_pages'])
 
+# Порядок блоков потоковой выдачи на странице и имена их списков в шаблоне
+STREAM_SECTIONS = {'videos': (1, 'videos'), 'images': (2, 'images'), 'websites': (3, 'results')}
+
+def stream_search(query, page, show_status):
+    """Выдача частями (chunked): каркас страницы, затем блок каждого типа, как только он найден"""
+    start_time = time.time()
+    
+    last_ping = "никогда"
+    if app_status['last_self_ping']:
+        last_ping = f"{int(time.time() - app_status['last_self_ping'])} сек назад"
+    
+    uptime = int(time.time() - app_status['start_time'])
+    uptime_str = f"{uptime // 3600}ч {(uptime % 3600) // 60}м {uptime % 60}с"
+    
+    shell = render_template(page_template,
+                            query=query,
+                            error=None,
+                            loading=True,
+                            streaming=True,
+                            auto_search=False,
+                            show_status=show_status,
+                            last_ping=last_ping,
+                            total_searches=app_status['total_searches'],
+                            uptime=uptime_str,
+                            is_active=app_status['is_active'],
+                            active_tab='all',
+                            indexed_images=app_status['indexed_images'],
+                            processed_pages=app_status['processed_pages'])
+    head, tail = shell.split('<!--stream-->', 1)
+    
+    def generate():
+        yield head
+        total_results = 0
+        try:
+            for search_type, items in search_engine.search_stream(query, max_results=20, page=page):
+                if not items or search_type not in STREAM_SECTIONS:
+                    continue
+                order, name = STREAM_SECTIONS[search_type]
+                total_results += len(items)
+                yield stream_section_template.render(search_type=search_type, order=order, **{name: items})
+        except Exception as e:
+            logger.error(f"❌ Stream search error: {e}")
+        yield stream_summary_template.render(query=query, total_results=total_results,
+                                             search_time=f"{time.time() - start_time:.2f}")
+        yield tail
+    
+    response = app.response_class(stream_with_context(generate()), mimetype='text/html')
+    # Прокси не должны буферизовать ответ, иначе первые блоки не дойдут раньше последнего
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/assets/<filename>')
+def assets(filename):
+    """Стили и скрипт страницы: кэшируются браузером навсегда, новое содержимое - новое имя"""
+    asset = STATIC_ASSETS.get(filename)
+    if asset is None:
+        abort(404)
+    
+    encoding = preferred_encoding() or 'identity'
+    response = app.response_class(asset.variants[encoding], mimetype=asset.mimetype)
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    response.set_etag(asset.etag)
+    return response.make_conditional(request)
+
+# Ограничения JSON API
+API_DEFAULT_LIMIT = 20
+API_MAX_LIMIT = 100
+API_TYPES = ('images', 'websites', 'videos')
+
+def encode_cursor(state):
+    """Непрозрачный курсор следующей страницы"""
+    return base64.urlsafe_b64encode(json.dumps(state, separators=(',', ':')).encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    padded = cursor + '=' * (-len(cursor) % 4)
+    return json.loads(base64.urlsafe_b64decode(padded.encode()))
+
+def api_error(message, status=400):
+    return jsonify({'error': message}), status
+
+def parse_api_limit(value, default):
+    limit = int(value) if value not in (None, '') else default
+    if not 1 <= limit <= API_MAX_LIMIT:
+        raise ValueError(f"limit должен быть от 1 до {API_MAX_LIMIT}")
+    return limit
+
+@app.route('/api/search')
+def api_search():
+    """JSON API поиска: ?q=, types=, limit=, limit_<тип>=, fields=, cursor=
+    
+    Страницы листаются в пределах пула из ARIOS_CANDIDATE_LIMIT лучших по индексу кандидатов.
+    truncated[тип] = true: результаты типа кончились на границе пула, и совпадений может быть больше,
+    чем отдано (запрос стоит уточнить); next_cursor для такого типа уже не выдается.
+    """
+    cursor = request.args.get('cursor')
+    try:
+        if cursor:
+            # Курсор хранит все параметры запроса и смещения по типам
+            state = decode_cursor(cursor)
+            query, fields = str(state['q']), [str(f) for f in state['f']]
+            offsets = {t: max(0, int(state['o'][t])) for t in API_TYPES if t in state['o']}
+            limits = {t: parse_api_limit(state['l'][t], API_DEFAULT_LIMIT) for t in offsets}
+        else:
+            query = request.args.get('q', '').strip()
+            types = [t.strip() for t in request.args.get('types', ','.join(API_TYPES)).split(',') if t.strip()]
+            unknown = [t for t in types if t not in API_TYPES]
+            if unknown:
+                return api_error(f"Неизвестные типы: {', '.join(unknown)}")
+            limit = parse_api_limit(request.args.get('limit'), API_DEFAULT_LIMIT)
+            limits = {t: parse_api_limit(request.args.get(f'limit_{t}'), limit) for t in types}
+            offsets = {t: 0 for t in types}
+            fields = [f.strip() for f in request.args.get('fields', '').split(',') if f.strip()]
+    except (ValueError, KeyError, TypeError) as e:
+        return api_error(f"Некорректные параметры: {e}")
+    
+    if not query:
+        return api_error("Параметр q обязателен")
+    
+    app_status['total_searches'] += 1
+    start_time = time.time()
+    
+    windows = {t: (offsets[t], limits[t]) for t in offsets}
+    found = search_engine.search_window(query, windows)
+    
+    results = {}
+    next_offsets = {}
+    truncated = {}
+    for search_type, (offset, limit) in windows.items():
+        items = found.get(search_type, [])
+        if len(items) > limit:
+            next_offsets[search_type] = offset + limit
+        # Страниц больше нет, но не потому, что кончились совпадения, а потому, что кончился пул кандидатов
+        truncated[search_type] = len(items) <= limit and offset + len(items) >= search_engine.candidate_limit
+        results[search_type] = [
+            {field: item[field] for field in fields if field in item} if fields else item
+            for item in items[:limit]
+        ]
+    
+    next_cursor = None
+    if next_offsets:
+        # На следующей странице только типы, у которых остались результаты
+        next_cursor = encode_cursor({
+            'q': query, 'o': next_offsets,
+            'l': {t: limits[t] for t in next_offsets}, 'f': fields
+        })
+    
+    return jsonify({
+        'query': query,
+        'results': results,
+        'next_cursor': next_cursor,
+        'truncated': truncated,
+        'search_time': round(time.time() - start_time, 4)
+    })
+
+@app.after_request
+def compress_response(response):
+    """Сжатие ответов gzip или brotli (кроме потоковых и уже сжатых)"""
+    if (response.direct_passthrough or response.is_streamed
+            or response.status_code != 200
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+    
+    encoding = preferred_encoding()
+    body = response.get_data()
+    if encoding is None or len(body) < COMPRESS_MIN_BYTES:
+        return response
+    
+    if encoding == 'br':
+        response.set_data(brotli.compress(body, quality=5))
+    else:
+        response.set_data(gzip.compress(body, compresslevel=6))
+    response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    return response
+
 @app.route('/health')
 def health():
     """Health check endpoint"""
@@ -2339,13 +5645,21 @@ def status():
         'total_searches': app_status['total_searches'],
         'indexed_images': app_status['indexed_images'],
         'processed_pages': app_status['processed_pages'],
+        'unchanged_pages': app_status['unchanged_pages'],
         'start_time': app_status['start_time'],
         'uptime': uptime,
-        'uptime_human': uptime_str
+        'uptime_human': uptime_str,
+        'crawler': crawl_scheduler.stats(),
+        'enrichment': image_enrichment.stats(),
+        'query_cache': query_cache.stats(),
+        'synonyms': synonym_graph.stats(),
+        'http': http_transport.stats()
     })
 
-# Запускаем само-пинг при старте приложения
-start_background_scheduler()
+# Запускаем само-пинг при старте приложения (ARIOS_BACKGROUND=0 отключает фоновые задачи,
+# например для бенчмарков и одноразовых скриптов)
+if os.environ.get('ARIOS_BACKGROUND', '1') != '0':
+    start_background_scheduler()
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
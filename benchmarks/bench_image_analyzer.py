@@ -0,0 +1,79 @@
+"""Бенчмарк анализа изображений по URL: построчный перебор словарей против автомата Ахо–Корасик
+
+Запуск: python benchmarks/bench_image_analyzer.py [количество URL]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from urllib.parse import urlparse
+
+os.environ.setdefault('ARIOS_BACKGROUND', '0')
+os.environ.setdefault('ARIOS_INDEX_PATH', os.path.join(tempfile.mkdtemp(), 'bench_index.db'))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import arios  # noqa: E402
+
+
+def legacy_analysis(analyzer, image_url):
+    """Исходный алгоритм: проверка каждого слова словарей через `in` (словарь ключевых слов копируется на каждый вызов)"""
+    analysis = {}
+    filename = os.path.basename(urlparse(image_url).path).lower()
+    for eng, rus in analyzer.object_translations.items():
+        if eng in filename or rus in filename:
+            analysis[rus] = 0.7
+    path = urlparse(image_url).path.lower()
+    for scene in analyzer.scene_categories:
+        if scene in path:
+            analysis[scene] = 0.6
+    for keyword, category in dict(analyzer.keywords_mapping).items():
+        if keyword in filename or keyword in path:
+            analysis[category] = 0.8
+
+    colors = {}
+    for eng, rus in dict(analyzer.color_keywords).items():
+        if eng in path or rus in path:
+            colors[rus] = 0.6
+    return analysis, colors
+
+
+def make_urls(analyzer, count, seed=42):
+    rng = random.Random(seed)
+    words = (list(analyzer.object_translations) + list(analyzer.object_translations.values())
+             + analyzer.scene_categories + ['img', 'photo', 'uploads', 'large', 'thumb', '2024', 'v2'])
+    urls = []
+    for _ in range(count):
+        directories = '/'.join(rng.choice(words).replace(' ', '-') for _ in range(rng.randint(1, 3)))
+        name = '-'.join(rng.choice(words).replace(' ', '_') for _ in range(rng.randint(1, 4)))
+        urls.append(f"https://cdn{rng.randint(1, 9)}.example.com/{directories}/{name}-{rng.randint(1, 9999)}.jpg")
+    return urls
+
+
+def measure(label, function, items):
+    started = time.perf_counter()
+    for item in items:
+        function(item)
+    elapsed = time.perf_counter() - started
+    rate = len(items) / elapsed
+    print(f"{label:<28} {elapsed:8.3f} s  {rate:12,.0f} images/sec")
+    return rate
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    analyzer = arios.image_analyzer
+    urls = make_urls(analyzer, count)
+
+    mismatches = sum(1 for url in urls if legacy_analysis(analyzer, url) != analyzer._analyze_url(url))
+    patterns = (2 * len(analyzer.object_translations) + len(analyzer.scene_categories)
+                + len(analyzer.keywords_mapping) + 2 * len(analyzer.color_keywords))
+    print(f"URLs: {count}, patterns: {patterns}, mismatches with legacy: {mismatches}")
+
+    before = measure('before (substring scan)', lambda url: legacy_analysis(analyzer, url), urls)
+    after = measure('after (Aho-Corasick)', analyzer._analyze_url, urls)
+    print(f"speedup: {after / before:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""Бенчмарк памяти на изображение: полные словари и BK-дерево на узлах-списках против
+компактных документов и столбцового BK-дерева с целочисленными идентификаторами
+
+Запуск: python benchmarks/bench_memory.py [количество изображений]
+"""
+import hashlib
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from urllib.parse import urlparse
+
+os.environ.setdefault('ARIOS_BACKGROUND', '0')
+os.environ.setdefault('ARIOS_INDEX_PATH', os.path.join(tempfile.mkdtemp(), 'bench_index.db'))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import arios  # noqa: E402
+
+
+class LegacyBKTree:
+    """Исходное дерево: узел - список [хэш, URL, {расстояние: дочерний узел}]"""
+
+    def __init__(self):
+        self.root = None
+
+    def add(self, value, payload):
+        if self.root is None:
+            self.root = [value, payload, {}]
+            return
+        node = self.root
+        while True:
+            d = (value ^ node[0]).bit_count()
+            child = node[2].get(d)
+            if child is None:
+                node[2][d] = [value, payload, {}]
+                return
+            node = child
+
+    def memory_bytes(self):
+        """Узлы, словари потомков, хэши и строки URL"""
+        total = 0
+        stack = [self.root] if self.root else []
+        while stack:
+            node = stack.pop()
+            total += (sys.getsizeof(node) + sys.getsizeof(node[0])
+                      + sys.getsizeof(node[1]) + sys.getsizeof(node[2]))
+            stack.extend(node[2].values())
+        return total
+
+
+def make_images(count, seed=42):
+    """Записи изображений в том виде, в каком их строит WebCrawler._extract_image_data"""
+    rng = random.Random(seed)
+    words = list(arios.image_analyzer.object_translations)
+    domains = [f"{rng.choice(words).replace(' ', '-')}{i}.example.com" for i in range(max(1, count // 200))]
+    for i in range(count):
+        domain = rng.choice(domains)
+        name = '-'.join(rng.choice(words).replace(' ', '_') for _ in range(rng.randint(1, 3)))
+        url = f"https://cdn{rng.randint(1, 9)}.{domain}/uploads/{i}/{name}.jpg"
+        yield {
+            'id': hashlib.md5(url.encode()).hexdigest(),
+            'url': url,
+            'thumbnail': url,
+            'alt': ' '.join(rng.choice(words) for _ in range(rng.randint(0, 4))),
+            'title': rng.choice(words) if rng.random() < 0.3 else '',
+            'filename': name.replace('-', ' ').replace('_', ' '),
+            'context': ' '.join(rng.choice(words) for _ in range(rng.randint(0, 12))),
+            'page_url': f"https://{domain}/posts/{i // 10}",
+            'domain': urlparse(f"https://{domain}/").netloc,
+            'relevance_score': 0,
+            'metadata_extracted': True,
+            'vision_analyzed': False
+        }, rng.getrandbits(64)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    index = arios.search_index
+
+    legacy_stored = compact_stored = 0
+    legacy_tree = LegacyBKTree()
+    tree = arios.BKTree()
+    started = time.perf_counter()
+    for doc_id, (image, phash) in enumerate(make_images(count), 1):
+        stored = {k: v for k, v in image.items() if k != 'relevance_score'}
+        # JSON документа плюс столбец домена
+        legacy_stored += len(json.dumps(stored, ensure_ascii=False).encode()) + len(image['domain'])
+        compact = index._compact_document('images', dict(stored), image['domain'])
+        compact_stored += len(json.dumps(compact, ensure_ascii=False).encode()) + len(image['domain'])
+        legacy_tree.add(phash, image['url'])
+        tree.add(phash, doc_id)
+    elapsed = time.perf_counter() - started
+
+    legacy_memory = legacy_tree.memory_bytes()
+    compact_memory = tree.memory_bytes()
+    print(f"images: {count:,} ({elapsed:.1f} s to build)")
+    print(f"{'':<36} {'before':>12} {'after':>12}")
+    print(f"{'stored document, bytes/image':<36} {legacy_stored / count:12.1f} {compact_stored / count:12.1f}")
+    print(f"{'near-duplicate index, bytes/image':<36} {legacy_memory / count:12.1f} {compact_memory / count:12.1f}")
+    print(f"{'near-duplicate index, total MB':<36} {legacy_memory / 2**20:12.1f} {compact_memory / 2**20:12.1f}")
+
+
+if __name__ == '__main__':
+    main()
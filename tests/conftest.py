@@ -0,0 +1,8 @@
+import os
+import sys
+import tempfile
+
+# Фоновые задачи и глобальный индекс модуля не должны трогать рабочие файлы
+os.environ.setdefault('ARIOS_BACKGROUND', '0')
+os.environ.setdefault('ARIOS_INDEX_PATH', os.path.join(tempfile.mkdtemp(), 'test_index.db'))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
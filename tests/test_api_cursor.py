@@ -0,0 +1,53 @@
+"""Курсор /api/search: кодирование, листание до границы пула кандидатов и флаг truncated"""
+import pytest
+
+import arios
+
+
+@pytest.fixture
+def client(monkeypatch):
+    arios.search_index.add_documents('websites', [
+        {'url': f'https://cursor.example/{i}', 'title': f'zebracursor page {i}' + (' rarecursor' if i < 5 else ''), 'description': 'x' * (i % 80)}
+        for i in range(50)
+    ])
+    monkeypatch.setattr(arios.search_engine, 'candidate_limit', 30)
+    return arios.app.test_client()
+
+
+def test_cursor_round_trip():
+    state = {'q': 'кошки и собаки', 'o': {'images': 20, 'websites': 40}, 'l': {'images': 20, 'websites': 20},
+             'f': ['url', 'title']}
+    cursor = arios.encode_cursor(state)
+    assert '=' not in cursor and '+' not in cursor and '/' not in cursor
+    assert arios.decode_cursor(cursor) == state
+
+
+def test_pages_until_candidate_cap_then_truncated(client):
+    response = client.get('/api/search?q=zebracursor&types=websites&limit=12&fields=url').get_json()
+    urls = [item['url'] for item in response['results']['websites']]
+    assert response['truncated'] == {'websites': False}
+
+    pages = 1
+    while response['next_cursor']:
+        response = client.get(f"/api/search?cursor={response['next_cursor']}").get_json()
+        urls += [item['url'] for item in response['results']['websites']]
+        pages += 1
+
+    assert pages == 3
+    assert len(urls) == len(set(urls)) == 30
+    assert response['truncated'] == {'websites': True}
+
+
+def test_truncated_only_when_pool_is_full(client):
+    response = client.get('/api/search?q=zebracursor&types=websites&limit=100').get_json()
+    assert len(response['results']['websites']) == 30
+    assert response['next_cursor'] is None and response['truncated'] == {'websites': True}
+
+    # Все совпадения поместились в пул
+    response = client.get('/api/search?q=rarecursor&types=websites&limit=100').get_json()
+    assert len(response['results']['websites']) == 5
+    assert response['next_cursor'] is None and response['truncated'] == {'websites': False}
+
+
+def test_malformed_cursor_is_rejected(client):
+    assert client.get('/api/search?cursor=not-a-cursor').status_code == 400
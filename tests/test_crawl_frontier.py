@@ -0,0 +1,55 @@
+"""Один краулер на все воркеры (аренда в индексе) и ограниченные таблицы хостов очереди обхода"""
+import time
+
+import arios
+
+
+class MemoryVisited:
+    def __init__(self):
+        self.urls = set()
+
+    def add(self, url):
+        self.urls.add(url)
+
+    def check_and_add(self, url):
+        return self.check_and_add_many([url])[0]
+
+    def check_and_add_many(self, urls):
+        fresh = []
+        for url in urls:
+            fresh.append(url not in self.urls)
+            self.urls.add(url)
+        return fresh
+
+
+def test_lease_has_single_owner_until_it_expires(tmp_path):
+    first = arios.SearchIndex(str(tmp_path / 'index.db'), arios.text_analyzer)
+    second = arios.SearchIndex(str(tmp_path / 'index.db'), arios.text_analyzer)
+    assert first.acquire_lease('crawler', 'worker-1', ttl=60)
+    assert not second.acquire_lease('crawler', 'worker-2', ttl=60)
+    # Продление своей аренды
+    assert first.acquire_lease('crawler', 'worker-1', ttl=0.2)
+    time.sleep(0.3)
+    assert second.acquire_lease('crawler', 'worker-2', ttl=60)
+    assert not first.acquire_lease('crawler', 'worker-1', ttl=60)
+    # Чужую аренду освободить нельзя
+    first.release_lease('crawler', 'worker-1')
+    assert not first.acquire_lease('crawler', 'worker-1', ttl=60)
+    second.release_lease('crawler', 'worker-2')
+    assert first.acquire_lease('crawler', 'worker-1', ttl=60)
+
+
+def test_next_allowed_is_bounded_and_keeps_politeness_delay():
+    frontier = arios.CrawlFrontier(MemoryVisited(), politeness_delay=0, max_hosts=50)
+    for i in range(500):
+        frontier.add(f'https://host{i}.example/')
+        url, _, host = frontier.next(timeout=0)
+        frontier.release(host)
+    assert len(frontier._next_allowed) <= 50
+
+    frontier.add('https://slow.example/a')
+    _, _, host = frontier.next(timeout=0)
+    frontier.release(host, delay=60)
+    frontier.add('https://slow.example/b')
+    assert frontier.next(timeout=0) is None
+    assert frontier.ready_in() > 50
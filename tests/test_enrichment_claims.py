@@ -0,0 +1,34 @@
+"""Изображения без анализа достаются одному воркеру: захват строк в индексе"""
+import arios
+
+
+def add_images(index, count):
+    index.add_documents('images', [
+        {'url': f'https://example.com/{i}.jpg', 'alt': 'red car'} for i in range(count)
+    ])
+
+
+def test_workers_claim_disjoint_images(tmp_path):
+    path = str(tmp_path / 'index.db')
+    first = arios.SearchIndex(path, arios.text_analyzer)
+    second = arios.SearchIndex(path, arios.text_analyzer)
+    add_images(first, 30)
+    # Записавший процесс занял изображения сам
+    assert first.claim_enrichment() == [] and second.claim_enrichment() == []
+
+    # Записавший процесс упал, не проанализировав изображения: его захват истек
+    with first._connection() as conn:
+        conn.execute('UPDATE documents SET enrich_claimed_at = NULL')
+    claimed = first.claim_enrichment(limit=20)
+    rest = second.claim_enrichment()
+    assert len(claimed) == 20 and len(rest) == 10
+    assert not set(claimed) & set(rest)
+    assert first.claim_enrichment() == []
+
+
+def test_analyzed_images_are_not_claimed(tmp_path, monkeypatch):
+    index = arios.SearchIndex(str(tmp_path / 'index.db'), arios.text_analyzer)
+    add_images(index, 5)
+    index.set_vision_analyses([(f'https://example.com/{i}.jpg', {'машина': 0.9}) for i in range(3)])
+    monkeypatch.setattr(arios.SearchIndex, 'ENRICHMENT_CLAIM_TTL', 0)
+    assert sorted(index.claim_enrichment()) == ['https://example.com/3.jpg', 'https://example.com/4.jpg']
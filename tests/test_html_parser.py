@@ -0,0 +1,43 @@
+"""Обрезка разметки в HtmlParser: по нужным тегам и без порчи многобайтовых символов"""
+import arios
+
+
+def cyrillic_page(images=10, filler=3000):
+    parts = ['<html><head><meta charset="utf-8"><title>Кошки</title></head><body>']
+    for i in range(images):
+        parts.append(f'<p>Рыжая кошка номер {i} спит на диване</p>'
+                     f'<img src="https://example.com/{i}.jpg" alt="кошка {i}">')
+        parts.append('<p>' + 'котёнок ' * (filler // 16) + '</p>')
+    parts.append('</body></html>')
+    return ''.join(parts).encode('utf-8')
+
+
+def test_cut_never_splits_utf8_characters():
+    content = cyrillic_page()
+    for tail_bytes in range(0, 64):
+        parser = arios.HtmlParser('html.parser', tail_bytes=tail_bytes)
+        truncated = parser.truncate(content, {'img': 2})
+        assert len(truncated) < len(content)
+        truncated.decode('utf-8')
+
+        soup = parser.parse(content, 'utf-8', {'img': 2})
+        alts = [img.get('alt') for img in soup.find_all('img')]
+        assert alts[:3] == ['кошка 0', 'кошка 1', 'кошка 2']
+        assert soup.title.string == 'Кошки'
+        # Текст, прочитанный как windows-1252, выглядит как 'Ð\xa0Ñ\x8bÐ¶...'
+        assert 'Ð' not in soup.get_text()
+
+
+def test_cut_after_last_match_when_limit_not_reached():
+    # Видео меньше лимита, iframe - тоже: страница все равно обрезается после последнего из них
+    content = (b'<html>' + b'<video src="v.mp4"></video>' * 3 + b'<p>' + b'x' * 100000 + b'</p>'
+               + b'<iframe src="https://example.com/embed"></iframe>' + b'<p>' + b'z' * 100000 + b'</p>')
+    parser = arios.HtmlParser('html.parser', tail_bytes=4096)
+    truncated = parser.truncate(content, {'video': 10, 'iframe': 10})
+    assert truncated.count(b'<iframe') == 1
+    assert len(truncated) < len(content) - 90000
+
+
+def test_no_needed_tags_keeps_content():
+    parser = arios.HtmlParser('html.parser')
+    assert parser.truncate(b'<html><p>text</p></html>', {'img': 5}) == b'<html><p>text</p></html>'
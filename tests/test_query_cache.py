@@ -0,0 +1,81 @@
+"""QueryCache: поколение индекса, объединение одинаковых запросов и вытеснение по памяти"""
+import threading
+import time
+
+import arios
+
+
+def test_generation_changes_at_most_once_per_interval(tmp_path, monkeypatch):
+    index = arios.SearchIndex(str(tmp_path / 'index.db'), arios.text_analyzer, generation_interval=60)
+    now = [6000.0]
+    monkeypatch.setattr(arios.time, 'time', lambda: now[0])
+    index.add_documents('websites', [{'url': 'https://example.com/0', 'title': 'python'}])
+    generation = index.generation()
+    for i in range(1, 20):
+        index.add_documents('websites', [{'url': f'https://example.com/{i}', 'title': 'python'}])
+    assert index.generation() == generation
+
+    now[0] += 60
+    index.add_documents('websites', [{'url': 'https://example.com/new', 'title': 'python'}])
+    assert index.generation() > generation
+    # Без записей поколение не меняется
+    now[0] += 600
+    assert index.search('websites', ['python'], limit=50) and index.generation() == generation + 1
+
+
+def test_stale_generation_and_ttl_miss():
+    cache = arios.QueryCache(ttl=0.2)
+    cache.put('q', {'images': []}, generation=1)
+    assert cache.get('q', 1) == {'images': []}
+    assert cache.get('q', 2) is None
+    # Устаревшая запись удалена и по старому поколению уже не находится
+    assert cache.get('q', 1) is None
+
+    cache.put('q', {'images': []}, generation=2)
+    time.sleep(0.3)
+    assert cache.get('q', 2) is None
+
+
+def test_concurrent_identical_queries_compute_once():
+    cache = arios.QueryCache()
+    calls = []
+    release = threading.Event()
+
+    def compute():
+        calls.append(1)
+        release.wait(5)
+        return {'websites': [{'url': 'https://example.com'}]}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute('q', 1, compute)))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    while cache.misses + cache.coalesced < 8:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert cache.coalesced == 7
+    assert all(result is results[0] for result in results)
+    assert cache.get_or_compute('q', 1, compute) is results[0] and len(calls) == 1
+
+
+def test_uncacheable_result_is_not_stored():
+    cache = arios.QueryCache()
+    cache.get_or_compute('q', 1, lambda: ({}, False), cacheable=lambda value: value[1])
+    assert cache.get('q', 1) is None
+
+
+def test_least_recently_used_evicted_by_memory_budget():
+    value = {'websites': ['x' * 100]}
+    cache = arios.QueryCache(max_bytes=500)
+    for key in ('a', 'b', 'c', 'd'):
+        cache.put(key, value, generation=1)
+    cache.get('a', 1)
+    cache.put('e', value, generation=1)
+    assert cache.get('a', 1) == value
+    assert cache.get('b', 1) is None
+    assert cache.stats()['bytes'] <= 500
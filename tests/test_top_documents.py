@@ -0,0 +1,127 @@
+"""Чтение постингов по убыванию вклада в SearchIndex._top_documents должно совпадать с полным перебором"""
+import heapq
+import random
+import time
+from collections import defaultdict
+
+import pytest
+
+import arios
+
+
+@pytest.fixture
+def index(tmp_path):
+    return arios.SearchIndex(str(tmp_path / 'index.db'), arios.text_analyzer)
+
+
+def exhaustive(index, doc_type, term_weights, limit):
+    """Оценки всех документов с любым из терминов и nlargest с тем же порядком при равенстве"""
+    scorer = index.scorers[doc_type]
+    stats = index.collection_stats(doc_type, term_weights)
+    scores = defaultdict(float)
+    for term, weight in term_weights.items():
+        if not stats['df'].get(term):
+            continue
+        idf = weight * scorer.idf(stats['df'][term], stats['docs'])
+        frequencies = defaultdict(float)
+        for doc_id, field, tf, length in index._term_postings(index._connection(), doc_type, term, 0):
+            frequencies[doc_id] += scorer.field_frequency(field, tf, length, stats['lengths'])
+        for doc_id, frequency in frequencies.items():
+            scores[doc_id] += scorer.saturate(frequency, idf)
+    return heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], -item[0]))
+
+
+def top_documents(index, doc_type, term_weights, limit):
+    scorer = index.scorers[doc_type]
+    stats = index.collection_stats(doc_type, term_weights)
+    terms = [
+        (term, stats['df'][term], weight * scorer.idf(stats['df'][term], stats['docs']))
+        for term, weight in term_weights.items() if stats['df'].get(term)
+    ]
+    return index._top_documents(index._connection(), doc_type, scorer, stats['lengths'],
+                                stats['impact_lengths'], terms, limit)
+
+
+def assert_same(actual, expected):
+    assert [doc_id for doc_id, _ in actual] == [doc_id for doc_id, _ in expected]
+    assert [score for _, score in actual] == pytest.approx([score for _, score in expected])
+
+
+def test_tied_scores_with_color_only_term(index):
+    # Одинаковые документы: все оценки равны, половина с цветом, который есть только в поле color
+    index.add_documents('images', [
+        {'url': f'https://example.com/{i}.jpg', 'alt': 'red car',
+         'colors': {'красный': 0.5} if i % 2 else {}}
+        for i in range(250)
+    ])
+    for limit in (3, 20, 200):
+        query = {'red': 1.0, 'красн': 0.9}
+        assert_same(top_documents(index, 'images', query, limit), exhaustive(index, 'images', query, limit))
+    assert len(index.search('images', {'red': 1.0, 'красн': 0.9}, limit=20)) == 20
+
+
+def test_vision_only_term_keeps_top(index):
+    index.add_documents('images', [
+        {'url': f'https://example.com/{i}.jpg', 'alt': 'red car' if i < 5 else 'car',
+         'vision_analysis': {'зебра': 0.9} if i % 3 == 0 else {}}
+        for i in range(30)
+    ])
+    query = {'red': 1.0, 'зебр': 1.0}
+    assert_same(top_documents(index, 'images', query, 3), exhaustive(index, 'images', query, 3))
+    assert len(index.search('images', ['red', 'зебр'], limit=3)) == 3
+
+
+def test_random_queries_match_exhaustive(index):
+    rng = random.Random(7)
+    words = ['cat', 'dog', 'tree', 'house', 'photo', 'river', 'city'] + [f'w{i}' for i in range(40)]
+    index.add_documents('images', [
+        {'url': f'https://example.com/{i}.jpg',
+         'alt': ' '.join(rng.choices(words, k=rng.randint(1, 5))),
+         'title': ' '.join(rng.choices(words, k=rng.randint(0, 2))),
+         'context': ' '.join(rng.choices(words, k=rng.randint(0, 8))),
+         'vision_analysis': {rng.choice(words): 0.7} if rng.random() < 0.3 else {}}
+        for i in range(400)
+    ])
+    for _ in range(50):
+        query = {term: rng.choice((1.0, 0.9, 0.6)) for term in rng.sample(words, rng.randint(1, 4))}
+        limit = rng.choice((1, 5, 20))
+        assert_same(top_documents(index, 'images', query, limit), exhaustive(index, 'images', query, limit))
+
+
+def test_single_common_term_reads_only_the_head_of_its_list(index, monkeypatch):
+    rng = random.Random(3)
+    index.add_documents('websites', [
+        {'url': f'https://example.com/{i}', 'title': ' '.join(['python'] * rng.randint(1, 3) + ['w'] * rng.randint(0, 12)),
+         'description': ' '.join(rng.choices(['guide', 'python', 'code', 'intro'], k=rng.randint(0, 20)))}
+        for i in range(5000)
+    ])
+    # Опорные длины заданы первым документом; пересчет вкладов - как при фоновой проверке индекса
+    assert index.needs_reindex()
+    assert index.migrate()
+    read = []
+    impact_blocks = index._impact_blocks
+
+    def counting_blocks(*args, **kwargs):
+        for block in impact_blocks(*args, **kwargs):
+            read.extend(block[2])
+            yield block
+
+    monkeypatch.setattr(index, '_impact_blocks', counting_blocks)
+    for limit in (1, 20):
+        read.clear()
+        assert_same(top_documents(index, 'websites', {'python': 1.0}, limit),
+                    exhaustive(index, 'websites', {'python': 1.0}, limit))
+        assert len(read) < 500
+    assert len(index.search('websites', ['python'], limit=20)) == 20
+
+
+def test_expired_deadline_interrupts_search(index):
+    index.add_documents('websites', [
+        {'url': f'https://example.com/{i}', 'title': 'python guide', 'description': 'code ' * (i % 7)}
+        for i in range(300)
+    ])
+    with pytest.raises(TimeoutError):
+        index.search('websites', ['python', 'code'], limit=20, deadline=time.monotonic() - 1)
+    # Обработчик прогресса снят: следующий поиск на том же соединении выполняется полностью
+    assert len(index.search('websites', ['python', 'code'], limit=20, deadline=time.monotonic() + 60)) == 20
+    assert len(index.search('websites', ['python'], limit=20)) == 20
@@ -0,0 +1,28 @@
+"""Термины меток компьютерного зрения разбираются при записи документа, а не при ранжировании"""
+import arios
+
+
+def test_vision_terms_stored_and_used_without_reanalysis(tmp_path, monkeypatch):
+    index = arios.SearchIndex(str(tmp_path / 'index.db'), arios.text_analyzer)
+    index.add_documents('images', [{'url': 'https://example.com/cat.jpg', 'alt': 'photo'}])
+    index.set_vision_analyses([('https://example.com/cat.jpg', {'рыжие кошки': 0.8, 'диван': 0.4})])
+    image = index.search('images', ['кошк'], limit=1)[0]
+    assert image['vision_terms'] == {'рыжие кошки': arios.text_analyzer.analyze('рыжие кошки'),
+                                     'диван': arios.text_analyzer.analyze('диван')}
+
+    monkeypatch.setattr(arios.text_analyzer, 'analyze', lambda text: (_ for _ in ()).throw(AssertionError(text)))
+    score = arios.search_engine._calculate_vision_relevance(image, {'кошк': 1.0})
+    assert score == 0.8 * 2
+
+
+def test_reindex_fills_vision_terms_of_old_documents(tmp_path):
+    index = arios.SearchIndex(str(tmp_path / 'index.db'), arios.text_analyzer)
+    index.add_documents('images', [{'url': 'https://example.com/dog.jpg', 'alt': 'photo',
+                                    'vision_analysis': {'собака': 0.9}, 'vision_analyzed': True}])
+    conn = index._connection()
+    with conn:
+        conn.execute("UPDATE documents SET data = json_remove(data, '$.vision_terms')")
+        conn.execute("UPDATE meta SET value = 0 WHERE key = 'index_version'")
+    assert index.migrate()
+    image = index.search('images', ['собак'], limit=1)[0]
+    assert image['vision_terms'] == {'собака': arios.text_analyzer.analyze('собака')}
@@ -0,0 +1,83 @@
+"""Канонический вид URL и хранилища посещенных URL (память, фильтры Блума, SQLite)"""
+import time
+
+import pytest
+
+import arios
+
+
+@pytest.mark.parametrize('url, expected', [
+    ('HTTPS://Example.COM:443/a?b=2&a=1#top', 'https://example.com/a?a=1&b=2'),
+    ('http://example.com:80', 'http://example.com/'),
+    ('http://example.com:8080/x', 'http://example.com:8080/x'),
+    ('https://example.com/p?utm_source=x&UTM_medium=y&gclid=1&id=7', 'https://example.com/p?id=7'),
+    ('https://example.com/p?q=&q=1', 'https://example.com/p?q=&q=1'),
+    ('  https://example.com/path  ', 'https://example.com/path'),
+    ('http://[::1]:8000/x', 'http://[::1]:8000/x'),
+])
+def test_normalize_url(url, expected):
+    assert arios.normalize_url(url) == expected
+
+
+def test_normalize_url_keeps_unparseable_input():
+    assert arios.normalize_url('http://example.com:99999999/') == 'http://example.com:99999999/'
+
+
+@pytest.fixture(params=['memory', 'bloom', 'sqlite'])
+def make_store(request, tmp_path):
+    def make(ttl=3600):
+        if request.param == 'memory':
+            return arios.MemoryVisitedStore(ttl, maxsize=1000)
+        if request.param == 'bloom':
+            return arios.BloomVisitedStore(ttl, capacity=1000)
+        return arios.SqliteVisitedStore(str(tmp_path / 'visited.db'), ttl)
+    return make
+
+
+def test_check_and_add_marks_canonical_url_once(make_store):
+    store = make_store()
+    assert store.check_and_add('https://example.com/a?utm_source=x')
+    assert not store.check_and_add('HTTPS://EXAMPLE.com/a#frag')
+    assert 'https://example.com/a' in store
+    assert 'https://example.com/b' not in store
+    store.add('https://example.com/b')
+    assert not store.check_and_add('https://example.com/b')
+
+
+def test_check_and_add_many_dedupes_within_and_across_batches(make_store):
+    store = make_store()
+    urls = [f'https://example.com/{i}' for i in range(50)]
+    assert store.check_and_add_many(urls[:10] + ['https://example.com/0#again']) == [True] * 10 + [False]
+    assert store.check_and_add_many(urls) == [False] * 10 + [True] * 40
+    assert store.check_and_add_many([]) == []
+
+
+def test_revisit_after_ttl(make_store):
+    store = make_store(ttl=0.2)
+    assert store.check_and_add('https://example.com/a')
+    assert not store.check_and_add('https://example.com/a')
+    time.sleep(0.45)
+    assert store.check_and_add('https://example.com/a')
+
+
+def test_sqlite_store_is_shared_between_instances(tmp_path):
+    first = arios.SqliteVisitedStore(str(tmp_path / 'visited.db'), ttl=3600)
+    second = arios.SqliteVisitedStore(str(tmp_path / 'visited.db'), ttl=3600)
+    assert first.check_and_add('https://example.com/a')
+    assert not second.check_and_add('https://example.com/a')
+    assert second.check_and_add_many(['https://example.com/a', 'https://example.com/b']) == [False, True]
+
+
+def test_sqlite_prune_drops_expired_rows(tmp_path):
+    store = arios.SqliteVisitedStore(str(tmp_path / 'visited.db'), ttl=0.1)
+    store.check_and_add_many([f'https://example.com/{i}' for i in range(5)])
+    time.sleep(0.2)
+    store.prune()
+    assert store.stats()['urls'] == 0
+
+
+def test_bloom_false_positive_rate_within_budget():
+    store = arios.BloomVisitedStore(3600, capacity=5000, error_rate=0.01)
+    store.check_and_add_many([f'https://example.com/seen/{i}' for i in range(5000)])
+    false_positives = sum(f'https://example.com/new/{i}' in store for i in range(5000))
+    assert false_positives / 5000 < 0.03